@@ -0,0 +1,565 @@
+"""
+@Project ：TaskQueue.py
+@File    ：AsyncSmartSQL.py
+@Author  ：agent
+@Date    ：2026/10/18 21:10
+"""
+
+import time
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+import aiomysql
+from loguru import logger
+from SmartSQL import BaseSmartSQL, ResultCache, pa
+
+
+class AsyncSmartSQL(BaseSmartSQL):
+    """
+    基于 aiomysql 的异步 SmartSQL, 方法与 SmartSQL 一致, 需要 await 调用
+    连接池在第一次执行 SQL 时创建, 连接绑定创建时的事件循环;
+    连接开启 autocommit, 每条语句(包括 add_many_smart 的每块)单独提交
+    """
+
+    def __init__(self, ip=None, port=None, db=None, user_name=None, user_pass=None, minsize=1, maxsize=10,
+                 pool_recycle=3600, ping_interval=30, connect_timeout=10, sql_cache_size=256, json_columns=None,
+                 use_orjson=False, **kwargs):
+        """
+        初始化异步 MySQL 数据库连接池配置
+        :param ip: 数据库 IP 地址，默认从 config 文件配置加载
+        :param port: 数据库端口号，默认从 config 文件配置加载
+        :param db: 数据库名称，默认从 config 文件配置加载
+        :param user_name: 数据库用户名，默认从 config 文件配置加载
+        :param user_pass: 数据库密码，默认从 config 文件配置加载
+        :param minsize: 连接池最小连接数
+        :param maxsize: 连接池最大连接数, 连接用尽时等待空闲连接
+        :param pool_recycle: 连接最长使用秒数, 超过后重建, -1 为不重建
+        :param ping_interval: 连接空闲超过该秒数后取出时先 ping 检查, 失效则换新连接; -1 为不检查
+        :param connect_timeout: 建立连接的超时秒数
+        :param sql_cache_size: smart_* 方法生成的 SQL 语句缓存条数, 0 为不缓存
+        :param json_columns: 转换列数据类型时额外按 JSON 解析的列名, JSON 类型的列总是会被解析
+        :param use_orjson: to_json=True 时是否使用 orjson 解析和序列化 JSON
+        :param kwargs: 其他 aiomysql 连接参数
+        """
+        super().__init__(ip, port, db, user_name, user_pass, sql_cache_size, json_columns, use_orjson)
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.pool_recycle = pool_recycle
+        self.ping_interval = ping_interval
+        self.connect_timeout = connect_timeout
+        self.connect_kwargs = kwargs
+        self.connect_pool = None
+        self._pool_lock = asyncio.Lock()
+        self._last_used = weakref.WeakKeyDictionary()
+        self._max_packet = None
+
+    async def connect(self):
+        """
+        创建连接池, 重复调用返回同一个连接池
+        :return: aiomysql.Pool
+        """
+        if self.connect_pool is not None:
+            return self.connect_pool
+        async with self._pool_lock:
+            if self.connect_pool is None:
+                try:
+                    self.connect_pool = await aiomysql.create_pool(
+                        minsize=self.minsize,
+                        maxsize=self.maxsize,
+                        pool_recycle=self.pool_recycle,
+                        host=self.ip,
+                        port=self.port,
+                        user=self.user_name,
+                        password=self.user_pass,
+                        db=self.db,
+                        charset="utf8mb4",
+                        autocommit=True,
+                        connect_timeout=self.connect_timeout,
+                        cursorclass=aiomysql.SSCursor,
+                        **self.connect_kwargs,
+                    )
+                except Exception as e:
+                    logger.error(f"连接数据库失败: {self.ip}:{self.port}，异常: {e}")
+                    raise
+                logger.debug(f"成功连接到 MySQL 数据库 {self.ip}:{self.db}")
+        return self.connect_pool
+
+    async def close(self):
+        """
+        关闭连接池并等待所有连接关闭
+        """
+        if self.connect_pool is not None:
+            self.connect_pool.close()
+            await self.connect_pool.wait_closed()
+            self.connect_pool = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _acquire(self):
+        """
+        从连接池取出连接, 空闲超过 ping_interval 的连接先 ping 检查, 失效时关闭并换新连接
+        :return: aiomysql.Connection
+        """
+        pool = await self.connect()
+        conn = await pool.acquire()
+        last = self._last_used.get(conn)
+        if self.ping_interval >= 0 and last is not None and time.monotonic() - last > self.ping_interval:
+            try:
+                await conn.ping(reconnect=False)
+            except Exception as e:
+                logger.warning(f"连接检查失败, 重新获取连接: {e}")
+                conn.close()
+                pool.release(conn)
+                conn = await pool.acquire()
+        return conn
+
+    @asynccontextmanager
+    async def get_connection(self):
+        """
+        获取数据库连接和游标的异步上下文管理器，确保资源正确释放
+        :return: 数据库连接和游标
+        """
+        conn = await self._acquire()
+        try:
+            # 创建游标失败时同样要把连接放回连接池
+            cursor = await conn.cursor()
+            try:
+                yield conn, cursor
+            finally:
+                await cursor.close()
+        finally:
+            self._last_used[conn] = time.monotonic()
+            self.connect_pool.release(conn)
+
+    def size_of_connections(self):
+        """
+        获取当前活跃的连接数
+        :return: 当前活跃连接数
+        """
+        if self.connect_pool is None:
+            return 0
+        return self.connect_pool.size - self.connect_pool.freesize
+
+    def size_of_connect_pool(self):
+        """
+        获取连接池中空闲的连接数
+        :return: 空闲连接数
+        """
+        if self.connect_pool is None:
+            return 0
+        return self.connect_pool.freesize
+
+    def enable_result_cache(self, max_size=1024, ttl=60, redis_url=None, redis_client=None):
+        """
+        启用进程内查询结果缓存, 通过本实例执行的写操作自动使涉及表的缓存失效
+        同步 Redis 客户端会阻塞事件循环, 异步版本不支持 Redis 后端
+        :param max_size: 进程内 LRU 缓存的最大条数
+        :param ttl: 默认缓存秒数
+        :return: ResultCache 实例
+        :raises ValueError: 当指定 Redis 后端时抛出异常
+        """
+        if redis_url or redis_client is not None:
+            raise ValueError("AsyncSmartSQL 的结果缓存不支持 Redis 后端")
+        self.result_cache = ResultCache(max_size=max_size, ttl=ttl)
+        return self.result_cache
+
+    async def smart_find(self, table, columns='*', where=None, limit=0, offset=0, to_json=False, convert_col=True,
+                         cache_ttl=None, columnar=False):
+        """
+        智能查询数据
+        :param table: 表名
+        :param columns: 要查询的列，默认为 '*'，表示查询所有列
+        :param where: 查询条件，例如 "age > 30"
+        :param limit: 限制返回结果数量，0 为不限制
+        :param offset: 查询结果的偏移量，用于分页
+        :param to_json: 是否将查询结果转换为 JSON 格式
+        :param convert_col: 是否转换列数据类型（如日期类型转字符串）
+        :param cache_ttl: 启用结果缓存时本次查询的缓存秒数, None 为默认值, 0 为不使用缓存
+        :param columnar: 是否按列返回结果 {"列名": [值, ...]}
+        :return: 查询结果，默认返回元组，若 to_json=True 则返回字典或字典列表
+        """
+        sql = self._cached_sql(("select", table, columns, where, limit, offset),
+                               lambda: self._make_select_sql(table, columns, where, limit, offset))
+        return await self.find(sql, to_json=to_json, convert_col=convert_col, cache_ttl=cache_ttl, columnar=columnar)
+
+    async def find(self, sql, params=None, limit=0, to_json=False, convert_col=True, cache_ttl=None, columnar=False):
+        """
+        查询数据
+        :param sql: SQL 查询语句
+        :param params: 可选的查询参数，用于参数化查询
+        :param limit: 限制返回结果数量，0 为不限制
+        :param to_json: 是否将查询结果转换为 JSON 格式
+        :param convert_col: 是否转换列数据类型（如日期类型转字符串）
+        :param cache_ttl: 启用结果缓存时本次查询的缓存秒数, None 为默认值, 0 为不使用缓存
+        :param columnar: 是否按列返回结果 {"列名": [值, ...]}, 可与 to_json 同时使用
+        :return: 查询结果，默认返回元组，若 to_json=True 则返回字典或字典列表
+        """
+        cache = self.result_cache if cache_ttl != 0 else None
+        if cache:
+            key, hit, value = cache.lookup(sql, params, (limit, to_json, convert_col, columnar))
+            if hit:
+                return value
+
+        result = await self._execute_sql(sql, params, limit, fetch=True)
+
+        if result["description"] is not None and (to_json or columnar):
+            description = result["description"]
+            rows = [result["data"]] if limit == 1 and result["data"] else result["data"] or []
+            if columnar:
+                result["data"] = self._rows_to_columns(rows, description, convert_col)
+            else:
+                result["data"] = self._rows_to_dict(rows, description, convert_col)
+                if limit == 1:
+                    result["data"] = result["data"][0] if result["data"] else None
+            if to_json:
+                result["data"] = self._convert_to_json(result["data"])
+
+        if cache and result["description"] is not None:
+            cache.store(key, result["data"], cache_ttl)
+        return result["data"]
+
+    async def stream_find(self, sql, params=None, chunk_size=1000, to_dict=False, convert_col=True):
+        """
+        流式查询数据, 按块返回结果, 查询期间一直占用同一个连接
+        提前结束迭代时请调用异步生成器的 aclose(), 以便及时归还连接
+        :param sql: SQL 查询语句
+        :param params: 可选的查询参数，用于参数化查询
+        :param chunk_size: 每块的行数
+        :param to_dict: 是否将每行转换为字典
+        :param convert_col: 是否转换列数据类型（如日期类型转字符串），仅在 to_dict=True 时生效
+        :return: 异步生成器, 每次返回一块查询结果(列表)
+        """
+        try:
+            async with self.get_connection() as (conn, cursor):
+                await cursor.execute(sql, params or ())
+                description = cursor.description or ()
+                while True:
+                    rows = await cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield self._rows_to_dict(rows, description, convert_col) if to_dict else list(rows)
+        except aiomysql.MySQLError as e:
+            logger.error(f"执行 SQL 出错: {e}, SQL: {sql}, 参数: {params}")
+
+    async def iter_find(self, sql, params=None, chunk_size=1000, to_dict=False, convert_col=True):
+        """
+        流式查询数据, 逐行返回结果, 每次从服务端读取 chunk_size 行
+        :param sql: SQL 查询语句
+        :param params: 可选的查询参数，用于参数化查询
+        :param chunk_size: 每次从服务端读取的行数
+        :param to_dict: 是否将每行转换为字典
+        :param convert_col: 是否转换列数据类型（如日期类型转字符串），仅在 to_dict=True 时生效
+        :return: 异步生成器, 每次返回一行(元组或字典)
+        """
+        async for rows in self.stream_find(sql, params, chunk_size, to_dict, convert_col):
+            for row in rows:
+                yield row
+
+    async def smart_stream_find(self, table, columns='*', where=None, params=None, key=None, start=None,
+                                chunk_size=1000, to_dict=False, convert_col=True):
+        """
+        智能流式查询数据, 按块返回结果, 指定 key 时使用键集分页, 见 SmartSQL.smart_stream_find
+        :param table: 表名
+        :param columns: 要查询的列，默认为 '*'，指定 key 时必须包含 key 列
+        :param where: 查询条件，例如 "age > 30"
+        :param params: 查询条件中的参数
+        :param key: 分页键, 需为唯一且有索引的列(如主键), 为空时不分页, 直接流式读取
+        :param start: 分页键的起始值(不包含), 可用于断点续传
+        :param chunk_size: 每块的行数
+        :param to_dict: 是否将每行转换为字典
+        :param convert_col: 是否转换列数据类型（如日期类型转字符串），仅在 to_dict=True 时生效
+        :return: 异步生成器, 每次返回一块查询结果(列表)
+        """
+        if not key:
+            sql = self._make_select_sql(table, columns, where)
+            async for rows in self.stream_find(sql, params, chunk_size, to_dict, convert_col):
+                yield rows
+            return
+
+        params = list(params or ())
+        last = start
+        try:
+            async with self.get_connection() as (conn, cursor):
+                key_index = None
+                while True:
+                    sql = self._make_keyset_sql(table, columns, where, key, last is not None, chunk_size)
+                    await cursor.execute(sql, params if last is None else params + [last])
+                    rows = await cursor.fetchall()
+                    if not rows:
+                        break
+                    column_names = [col[0] for col in cursor.description]
+                    if key_index is None:
+                        key_index = self._key_index(column_names, key)
+                    last = rows[-1][key_index]
+                    yield self._rows_to_dict(rows, cursor.description, convert_col) if to_dict else list(rows)
+                    if len(rows) < chunk_size:
+                        break
+        except aiomysql.MySQLError as e:
+            logger.error(f"执行 SQL 出错: {e}, 表: {table}, 分页键: {key}, 最后的值: {last}")
+
+    async def iter_record_batches(self, sql, params=None, batch_size=10000):
+        """
+        流式查询数据, 每块转换为一个 Arrow RecordBatch, 见 SmartSQL.iter_record_batches
+        :param sql: SQL 查询语句
+        :param params: 可选的查询参数，用于参数化查询
+        :param batch_size: 每块的行数
+        :return: 异步生成器, 每次返回一个 pyarrow.RecordBatch
+        """
+        if pa is None:
+            raise ImportError("导出 Arrow 数据需要安装 pyarrow: pip install pyarrow")
+        try:
+            async with self.get_connection() as (conn, cursor):
+                await cursor.execute(sql, params or ())
+                description = cursor.description or ()
+                types = self._arrow_types(description, getattr(getattr(cursor, "_result", None), "fields", None))
+                empty = True
+                while True:
+                    rows = await cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    empty = False
+                    yield self._rows_to_record_batch(rows, description, types)
+                if empty:
+                    yield self._rows_to_record_batch([], description, types)
+        except aiomysql.MySQLError as e:
+            logger.error(f"执行 SQL 出错: {e}, SQL: {sql}, 参数: {params}")
+
+    async def find_arrow(self, sql, params=None, batch_size=10000):
+        """
+        查询数据并返回 Arrow 表
+        :param sql: SQL 查询语句
+        :param params: 可选的查询参数，用于参数化查询
+        :param batch_size: 每次从服务端读取的行数
+        :return: pyarrow.Table, 查询出错时返回空表
+        """
+        return self._batches_to_table([batch async for batch in self.iter_record_batches(sql, params, batch_size)])
+
+    async def find_frame(self, sql, params=None, batch_size=10000):
+        """
+        查询数据并返回 pandas DataFrame
+        :param sql: SQL 查询语句
+        :param params: 可选的查询参数，用于参数化查询
+        :param batch_size: 每次从服务端读取的行数
+        :return: pandas.DataFrame
+        """
+        return self._table_to_frame(await self.find_arrow(sql, params, batch_size))
+
+    async def _execute_sql(self, sql, params=None, limit=0, fetch=False):
+        """
+        执行 SQL 语句的私有方法
+        :param sql: SQL 语句
+        :param params: SQL 参数
+        :param limit: 限制返回结果数量，0 为不限制
+        :param fetch: 是否需要获取结果
+        :return: 包含列描述和数据的字典，若 fetch=False 则返回影响行数
+        """
+        try:
+            async with self.get_connection() as (conn, cursor):
+                if fetch:
+                    await cursor.execute(sql, params or ())
+                    if limit == 1:
+                        data = await cursor.fetchone()
+                    elif limit > 1:
+                        data = await cursor.fetchmany(limit)
+                    else:
+                        data = await cursor.fetchall()
+                    return {"description": cursor.description or (), "data": data}
+                else:
+                    affect_count = await cursor.execute(sql, params or ())
+                    self._invalidate_cache(sql)
+                    return affect_count
+        except Exception as e:
+            logger.error(f"执行 SQL 出错: {e}, SQL: {sql}, 参数: {params}")
+            if fetch:
+                return {"description": None, "data": []}
+            return 0
+
+    async def add(self, sql, params=None):
+        """
+        添加单条数据到数据库
+        :param sql: SQL 插入语句
+        :param params: 可选的插入参数，用于参数化插入
+        :return: 影响的行数
+        """
+        return await self._execute_sql(sql, params, fetch=False)
+
+    async def add_smart(self, table, data, **kwargs):
+        """
+        根据给定的表名和数据字典，智能生成插入语句并插入数据
+        :param table: 表名
+        :param data: 要插入的数据，格式为字典 {"column": "value"}
+        :param kwargs: mode / update_columns, 同 SmartSQL.add_smart
+        :return: 影响的行数
+        :raises ValueError: 当数据字典为空时抛出异常
+        """
+        if not data:
+            raise ValueError("插入数据不能为空")
+
+        sql = self._make_insert_sql(table, data, **kwargs)
+        return await self.add(sql, tuple(data.values()))
+
+    async def add_many_smart(self, table, rows, mode=None, update_columns=None, chunk_size=1000, max_packet=None,
+                             on_error=None):
+        """
+        批量插入数据, 多行合并为一条 INSERT ... VALUES (...), (...) 语句, 参数同 SmartSQL.add_many_smart
+        :param table: 表名
+        :param rows: 要插入的数据列表, 格式为 [{"column": "value"}, ...], 所有字典的键需与第一行一致
+        :param mode: 冲突处理方式, None 为普通插入, 'ignore' 为 INSERT IGNORE, 'update' 为 ON DUPLICATE KEY UPDATE
+        :param update_columns: mode='update' 时冲突后更新的列, 默认为全部插入列
+        :param chunk_size: 每块最多的行数
+        :param max_packet: 每条语句的最大字节数, 默认读取服务端 max_allowed_packet
+        :param on_error: 块执行失败时的回调函数, 参数为 (该块的数据列表, 异常)
+        :return: 每块影响的行数列表, 执行失败的块记为 0
+        :raises ValueError: 当数据为空或各行的列不一致时抛出异常
+        """
+        rows = list(rows)
+        columns = self._insert_columns(rows)
+        head, tail = self._cached_sql(
+            ("insert_clauses", table, tuple(columns), mode, tuple(update_columns or ())),
+            lambda: self._make_insert_clauses(table, columns, mode, update_columns),
+        )
+        counts = []
+
+        async with self.get_connection() as (conn, cursor):
+            # 预留语句头尾和协议包头的空间
+            limit = (max_packet or await self._get_max_packet(cursor)) - len(head.encode()) - len(tail.encode()) - 1024
+            for first, values in self._iter_insert_chunks(rows, columns, cursor.mogrify, chunk_size, limit):
+                try:
+                    counts.append(await cursor.execute(f"{head}{', '.join(values)}{tail}"))
+                except aiomysql.MySQLError as e:
+                    counts.append(0)
+                    logger.error(f"批量插入出错: {e}, 表: {table}, 行: {first}-{first + len(values) - 1}")
+                    if on_error:
+                        on_error(rows[first:first + len(values)], e)
+
+        self._invalidate_cache(tables=[table])
+        return counts
+
+    async def _get_max_packet(self, cursor):
+        """
+        获取服务端 max_allowed_packet, 结果会被缓存
+        :param cursor: 数据库游标
+        :return: 字节数, 读取失败时返回 4MB
+        """
+        if self._max_packet is None:
+            try:
+                await cursor.execute("SELECT @@max_allowed_packet")
+                self._max_packet = int((await cursor.fetchone())[0])
+            except Exception as e:
+                logger.warning(f"读取 max_allowed_packet 失败, 使用默认值 4MB: {e}")
+                return 4 * 1024 * 1024
+        return self._max_packet
+
+    async def execute(self, sql, params=None):
+        """
+        执行任意 SQL 语句
+        :param sql: SQL 语句
+        :param params: 可选的参数，用于参数化执行
+        :return: 执行成功返回 True，否则返回 False
+        """
+        try:
+            async with self.get_connection() as (conn, cursor):
+                await cursor.execute(sql, params or ())
+                self._invalidate_cache(sql)
+                return True
+        except Exception as e:
+            logger.error(f"执行 SQL 出错: {e}, SQL: {sql}")
+            return False
+
+    async def update(self, sql, params=None):
+        """
+        更新数据库中的数据
+        :param sql: SQL 更新语句
+        :param params: 可选的更新参数，用于参数化更新
+        :return: 更新成功返回 True，否则返回 False
+        """
+        return await self.execute(sql, params)
+
+    async def delete(self, sql, params=None):
+        """
+        删除数据库中的数据
+        :param sql: SQL 删除语句
+        :param params: 可选的删除参数，用于参数化删除
+        :return: 删除成功返回 True，否则返回 False
+        """
+        return await self.execute(sql, params)
+
+    async def execute_smart(self, table, data, **kwargs):
+        """
+        根据给定的表名和数据字典，智能生成插入语句并执行
+        :param table: 表名
+        :param data: 要插入的数据，格式为字典 {"column": "value"}
+        :param kwargs: 其他参数用于生成 SQL 的辅助功能
+        :return: 执行成功返回 True，否则返回 False
+        """
+        sql = self._make_insert_sql(table, data, **kwargs)
+        return await self.execute(sql, tuple(data.values()))
+
+    async def update_smart(self, table, data, where, **kwargs):
+        """
+        根据给定的表名、数据字典和条件，智能生成更新 SQL 语句并执行
+        :param table: 表名
+        :param data: 要更新的数据，格式为字典 {"column": "value"}
+        :param where: 更新条件
+        :param kwargs: 其他参数用于生成 SQL 的辅助功能
+        :return: 执行成功返回 True，否则返回 False
+        """
+        sql = self._make_update_sql(table, data, where, **kwargs)
+        return await self.execute(sql, list(data.values()))
+
+    async def delete_smart(self, table, where, **kwargs):
+        """
+        根据给定的表名和条件，智能生成删除 SQL 语句并执行
+        :param table: 表名
+        :param where: 删除条件
+        :param kwargs: 其他参数用于生成 SQL 的辅助功能
+        :return: 执行成功返回 True，否则返回 False
+        """
+        sql = self._make_delete_sql(table, where, **kwargs)
+        return await self.execute(sql)
+
+
+async def test_async_smart_sql():
+    # 创建数据库连接, 需要本地 MySQL / MariaDB, 连接参数见 config.ini
+    async with AsyncSmartSQL(maxsize=5) as db:
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS test_table (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user VARCHAR(50),
+            age INT
+        );
+        """)
+
+        # 添加数据
+        print(f"添加数据影响的行数: {await db.add_smart('test_table', {'user': 'admin', 'age': 30})}")
+        rows = [{'user': f'user{i}', 'age': i} for i in range(100)]
+        print(f"批量添加每块影响的行数: {await db.add_many_smart('test_table', rows, chunk_size=30)}")
+
+        # 更新数据
+        update_result = await db.update_smart("test_table", {"age": 31}, "user='admin'")
+        print(f"更新数据成功: {update_result}")
+
+        # 查询数据
+        find_result = await db.find("SELECT * FROM test_table WHERE user=%s", params=("admin",), to_json=True)
+        print(f"查询数据结果: {find_result}")
+
+        # 并发查询
+        results = await asyncio.gather(*[db.smart_find('test_table', where=f'age = {i}') for i in range(20)])
+        print(f"并发查询结果数: {len(results)}, 活跃连接数: {db.size_of_connections()}")
+
+        # 键集分页流式查询
+        async for chunk in db.smart_stream_find('test_table', key='id', chunk_size=40, to_dict=True):
+            print(f"流式查询块大小: {len(chunk)}")
+
+        # 删除数据并清理测试表
+        delete_result = await db.delete_smart("test_table", "user='admin'")
+        print(f"删除数据成功: {delete_result}")
+        await db.execute("DROP TABLE IF EXISTS test_table;")
+
+# if __name__ == "__main__":
+#     asyncio.run(test_async_smart_sql())
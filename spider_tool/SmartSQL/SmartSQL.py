@@ -8,59 +8,89 @@
 import pymysql
 from dbutils.pooled_db import PooledDB
 from pymysql import cursors
+from pymysql.constants import FIELD_TYPE, FLAG
 from urllib import parse
 import json
+import atexit
+import base64
 import datetime
+import decimal
+import hashlib
+import re
+import queue
+import threading
+import time
+import weakref
+from collections import OrderedDict
 from contextlib import contextmanager
 from config import MYSQL_IP, MYSQL_PORT, MYSQL_DB, MYSQL_USER_NAME, MYSQL_USER_PASS, init
+from config import (MYSQL_MINCACHED, MYSQL_MAXCACHED, MYSQL_MAXCONNECTIONS, MYSQL_BLOCKING, MYSQL_MAXUSAGE,
+                    MYSQL_PING, MYSQL_PING_INTERVAL)
 from loguru import logger
 
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
 # 初始化配置
 init()
 
-class SmartSQL:
-    def __init__(self, ip=None, port=None, db=None, user_name=None, user_pass=None, **kwargs):
+# 转换为字符串的日期时间列类型, TIME 列在 pymysql 中为 timedelta
+_TEMPORAL_TYPES = {FIELD_TYPE.DATE, FIELD_TYPE.NEWDATE, FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP, FIELD_TYPE.TIME}
+
+# 耗时直方图的桶上限(秒)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class BaseSmartSQL:
+    """
+    SmartSQL 与 AsyncSmartSQL 共用的部分: SQL 语句生成与缓存、结果转换、结果缓存
+    """
+
+    def __init__(self, ip=None, port=None, db=None, user_name=None, user_pass=None, sql_cache_size=256,
+                 json_columns=None, use_orjson=False):
         """
-        初始化 MySQL 数据库连接池
-        :param ip: 数据库 IP 地址，默认从环境变量加载或 config 文件配置
-        :param port: 数据库端口号，默认从环境变量加载或 config 文件配置
-        :param db: 数据库名称，默认从环境变量加载或 config 文件配置
-        :param user_name: 数据库用户名，默认从环境变量加载或 config 文件配置
-        :param user_pass: 数据库密码，默认从环境变量加载或 config 文件配置
-        :param kwargs: 其他可选参数，用于扩展连接配置
+        :param ip: 数据库 IP 地址，默认从 config 文件配置加载
+        :param port: 数据库端口号，默认从 config 文件配置加载
+        :param db: 数据库名称，默认从 config 文件配置加载
+        :param user_name: 数据库用户名，默认从 config 文件配置加载
+        :param user_pass: 数据库密码，默认从 config 文件配置加载
+        :param sql_cache_size: smart_* 方法生成的 SQL 语句缓存条数, 0 为不缓存
+        :param json_columns: 转换列数据类型时额外按 JSON 解析的列名, 如 MariaDB 中以 LONGTEXT 存储的 JSON 列
+        :param use_orjson: to_json=True 时是否使用 orjson 解析和序列化 JSON
         """
+        if use_orjson and orjson is None:
+            raise ImportError("使用 orjson 需要安装 orjson: pip install orjson")
         self.ip = ip or MYSQL_IP
         self.port = port or MYSQL_PORT
         self.db = db or MYSQL_DB
         self.user_name = user_name or MYSQL_USER_NAME
         self.user_pass = user_pass or MYSQL_USER_PASS
-
-        try:
-            self.connect_pool = PooledDB(
-                creator=pymysql,
-                mincached=1,
-                maxcached=100,
-                maxconnections=100,
-                blocking=True,
-                ping=7,
-                host=self.ip,
-                port=self.port,
-                user=self.user_name,
-                passwd=self.user_pass,
-                db=self.db,
-                charset="utf8mb4",
-                cursorclass=cursors.SSCursor,
-            )
-        except Exception as e:
-            logger.error(f"连接数据库失败: {self.ip}:{self.port}，异常: {e}")
-        else:
-            logger.debug(f"成功连接到 MySQL 数据库 {self.ip}:{self.db}")
+        self.sql_cache_size = sql_cache_size
+        self._sql_cache = OrderedDict()
+        self._sql_cache_lock = threading.Lock()
+        self.sql_cache_hits = 0
+        self.sql_cache_misses = 0
+        self.result_cache = None
+        self.json_columns = frozenset(json_columns or ())
+        self.use_orjson = use_orjson
+        self._converters = {}
 
     @classmethod
     def from_url(cls, url, **kwargs):
         """
         通过数据库连接 URL 创建 SmartSQL 实例
-        :param url: 数据库连接 URL，格式为 mysql://username:password@ip:port/db
+        :param url: 数据库连接 URL，格式为 mysql://username:password@ip:port/db，可附带连接池参数，如 ?maxconnections=20
         :param kwargs: 其他可选参数，用于扩展连接配置
         :return: SmartSQL 实例
         :raises ValueError: 当 URL 格式不正确时抛出异常
@@ -76,38 +106,715 @@ class SmartSQL:
             "user_pass": url_parsed.password,
             "db": url_parsed.path.lstrip("/"),
         }
+        # 查询字符串中的连接池参数, 如 ?maxconnections=20&ping_interval=60
+        for name, value in parse.parse_qsl(url_parsed.query):
+            if value.lower() in ("true", "false"):
+                value = value.lower() == "true"
+            elif value.lstrip("-").isdigit():
+                value = int(value)
+            connect_params[name] = value
         connect_params.update(kwargs)
         return cls(**connect_params)
 
+    def _make_select_sql(self, table, columns='*', where=None, limit=0, offset=0):
+        """
+        生成查询 SQL 语句
+        :param table: 表名
+        :param columns: 要查询的列
+        :param where: 查询条件
+        :param limit: 限制返回结果数量，0 为不限制
+        :param offset: 查询结果的偏移量
+        :return: 生成的 SQL 语句
+        """
+        sql = f"SELECT {columns} FROM {table}"
+        if where:
+            sql += f" WHERE {where}"
+        if limit > 0:
+            sql += f" LIMIT {limit}"
+        if offset > 0:
+            sql += f" OFFSET {offset}"
+        return sql
+
+    def _make_keyset_sql(self, table, columns, where, key, after, chunk_size):
+        """
+        生成键集分页的查询语句
+        :param table: 表名
+        :param columns: 要查询的列
+        :param where: 查询条件
+        :param key: 分页键
+        :param after: 是否追加 "key > %s" 条件(第一页且无起始值时不追加)
+        :param chunk_size: 每页的行数
+        :return: SQL 语句
+        """
+        def build():
+            conditions = [f"({where})"] if where else []
+            if after:
+                conditions.append(f"{key} > %s")
+            sql = f"SELECT {columns} FROM {table}"
+            if conditions:
+                sql += f" WHERE {' AND '.join(conditions)}"
+            return sql + f" ORDER BY {key} LIMIT {int(chunk_size)}"
+
+        return self._cached_sql(("keyset", table, columns, where, key, after, chunk_size), build)
+
+    @staticmethod
+    def _key_index(columns, key):
+        """
+        获取分页键在查询列中的位置
+        :param columns: 列名列表
+        :param key: 分页键
+        :return: 序号
+        :raises ValueError: 当查询列中缺少分页键时抛出异常
+        """
+        if key not in columns:
+            raise ValueError(f"查询列中缺少分页键 {key}")
+        return columns.index(key)
+
+    def _cached_sql(self, key, build):
+        """
+        从 LRU 缓存中获取生成的 SQL 语句, 未命中时调用 build 生成并缓存
+        相同操作、表和列生成的语句不变, 高频单行写入时可省去重复拼接
+        :param key: 缓存键, 如 (操作, 表名, 列元组, ...)
+        :param build: 无参函数, 返回 SQL 语句
+        :return: SQL 语句
+        """
+        if self.sql_cache_size <= 0:
+            return build()
+        with self._sql_cache_lock:
+            sql = self._sql_cache.get(key)
+            if sql is not None:
+                self._sql_cache.move_to_end(key)
+                self.sql_cache_hits += 1
+                return sql
+            self.sql_cache_misses += 1
+        sql = build()
+        with self._sql_cache_lock:
+            self._sql_cache[key] = sql
+            if len(self._sql_cache) > self.sql_cache_size:
+                self._sql_cache.popitem(last=False)
+        return sql
+
+    def sql_cache_info(self):
+        """
+        获取 SQL 语句缓存的统计信息
+        :return: {"hits": 命中次数, "misses": 未命中次数, "size": 当前条数, "max_size": 最大条数}
+        """
+        with self._sql_cache_lock:
+            return {
+                "hits": self.sql_cache_hits,
+                "misses": self.sql_cache_misses,
+                "size": len(self._sql_cache),
+                "max_size": self.sql_cache_size,
+            }
+
+    def clear_sql_cache(self):
+        """
+        清空 SQL 语句缓存, 表结构变更后可调用
+        """
+        with self._sql_cache_lock:
+            self._sql_cache.clear()
+
+    def enable_result_cache(self, max_size=1024, ttl=60, redis_url=None, redis_client=None):
+        """
+        启用查询结果缓存, find / smart_find 先读缓存, 通过本实例执行的写操作自动使涉及表的缓存失效
+        使用 Redis 后端时多个进程共享缓存和失效信息; 绕过本实例直接修改数据库时缓存会在 ttl 后过期
+        :param max_size: 进程内 LRU 缓存的最大条数
+        :param ttl: 默认缓存秒数
+        :param redis_url: 共享缓存的 Redis 地址, 如 redis://127.0.0.1:6379/0
+        :param redis_client: 共享缓存的 Redis 客户端, 优先于 redis_url
+        :return: ResultCache 实例
+        """
+        if redis_client is None and redis_url:
+            if redis is None:
+                raise ImportError("使用 Redis 结果缓存需要安装 redis: pip install redis")
+            redis_client = redis.Redis.from_url(redis_url)
+        self.result_cache = ResultCache(max_size=max_size, ttl=ttl, redis_client=redis_client)
+        return self.result_cache
+
+    def disable_result_cache(self):
+        """
+        关闭查询结果缓存
+        """
+        self.result_cache = None
+
+    def _invalidate_cache(self, sql=None, tables=None):
+        """
+        写操作成功后使涉及表的查询结果缓存失效
+        :param sql: 执行的 SQL 语句, 用于解析涉及的表
+        :param tables: 涉及的表名列表, 优先于 sql
+        """
+        if self.result_cache is None:
+            return
+        if tables is None:
+            tables = write_tables(sql)
+            if tables is None:
+                return
+        self.result_cache.invalidate(tables or None)
+        if self._in_transaction():
+            # 事务提交或回滚前其他连接仍可能把旧数据写入缓存, 结束时需要再次失效
+            self._current_session().touch(tables)
+
+    def _current_session(self):
+        """
+        获取当前线程固定连接的会话, 没有时返回 None
+        :return: Session 实例
+        """
+        return None
+
+    def _in_transaction(self):
+        """
+        当前线程是否处于事务中, 事务中的执行错误会抛出异常以便整体回滚
+        :return: bool
+        """
+        session = self._current_session()
+        return session is not None and session.atomic
+
+    def _get_converters(self, description):
+        """
+        根据 cursor.description 中的列类型生成各列的转换函数, 相同结构的结果只生成一次
+        日期时间列转换为字符串, JSON 列(及 json_columns 中的列)解析为对象, 其他列不转换
+        :param description: 游标的 description
+        :return: [(列序号, 转换函数), ...]
+        """
+        key = tuple((col[0], col[1]) for col in description)
+        converters = self._converters.get(key)
+        if converters is not None:
+            return converters
+
+        loads = orjson.loads if self.use_orjson else json.loads
+
+        def parse_json(value):
+            try:
+                return loads(value)
+            except Exception:
+                return value
+
+        converters = []
+        for i, (name, type_code) in enumerate(key):
+            if type_code in _TEMPORAL_TYPES:
+                converters.append((i, str))
+            elif type_code == FIELD_TYPE.JSON or name in self.json_columns:
+                converters.append((i, parse_json))
+
+        if len(self._converters) >= 256:
+            self._converters.clear()
+        self._converters[key] = converters
+        return converters
+
+    def _convert_rows(self, rows, description):
+        """
+        按列类型转换多行数据
+        :param rows: 查询结果
+        :param description: 游标的 description
+        :return: 转换后的行列表, 无需转换时返回原数据
+        """
+        converters = self._get_converters(description)
+        if not converters:
+            return rows
+        result = []
+        for row in rows:
+            row = list(row)
+            for i, convert in converters:
+                value = row[i]
+                if value is not None:
+                    row[i] = convert(value)
+            result.append(row)
+        return result
+
+    def _rows_to_dict(self, rows, description, convert_col=True):
+        """
+        将多行数据转换为字典列表
+        :param rows: 查询结果
+        :param description: 游标的 description
+        :param convert_col: 是否转换列数据类型
+        :return: 字典列表
+        """
+        columns = [col[0] for col in description]
+        if convert_col:
+            rows = self._convert_rows(rows, description)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def _rows_to_columns(self, rows, description, convert_col=True):
+        """
+        将多行数据转换为按列存储的字典
+        :param rows: 查询结果
+        :param description: 游标的 description
+        :param convert_col: 是否转换列数据类型
+        :return: {"列名": [值, ...]}
+        """
+        columns = [col[0] for col in description]
+        if not rows:
+            return {column: [] for column in columns}
+        values = zip(*rows)
+        if convert_col:
+            converters = dict(self._get_converters(description))
+            values = (
+                [None if v is None else converters[i](v) for v in column] if i in converters else list(column)
+                for i, column in enumerate(values)
+            )
+        else:
+            values = (list(column) for column in values)
+        return dict(zip(columns, values))
+
+    def _arrow_types(self, description, fields=None):
+        """
+        根据列类型一次性确定各列的 Arrow 类型, 之后每块数据都按该类型转换, 保证各块的结构一致
+        :param description: 游标的 description
+        :param fields: 结果集的列信息(pymysql / aiomysql 的 cursor._result.fields), 用于区分无符号整数、
+                       二进制与文本列, 以及 DECIMAL 的精确精度; 为空时按 description 推算
+        :return: Arrow 类型列表, 非 MySQL 类型码的列为 None, 由第一块数据推断
+        """
+        if pa is None:
+            raise ImportError("导出 Arrow 数据需要安装 pyarrow: pip install pyarrow")
+        if fields is not None and len(fields) != len(description):
+            fields = None
+        types = []
+        for i, col in enumerate(description):
+            type_code = col[1]
+            field = fields[i] if fields is not None else None
+            unsigned = field is not None and bool(field.flags & FLAG.UNSIGNED)
+            if type_code in (FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.INT24, FIELD_TYPE.LONG, FIELD_TYPE.YEAR):
+                types.append(pa.int64())
+            elif type_code == FIELD_TYPE.LONGLONG:
+                types.append(pa.uint64() if unsigned else pa.int64())
+            elif type_code == FIELD_TYPE.FLOAT:
+                types.append(pa.float32())
+            elif type_code == FIELD_TYPE.DOUBLE:
+                types.append(pa.float64())
+            elif type_code in (FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL):
+                types.append(self._arrow_decimal(col, field))
+            elif type_code in (FIELD_TYPE.DATE, FIELD_TYPE.NEWDATE):
+                types.append(pa.date32())
+            elif type_code in (FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP):
+                types.append(pa.timestamp("us"))
+            elif type_code == FIELD_TYPE.TIME:
+                types.append(pa.duration("us"))
+            elif type_code == FIELD_TYPE.JSON:
+                types.append(pa.string())
+            elif type_code in (FIELD_TYPE.VARCHAR, FIELD_TYPE.VAR_STRING, FIELD_TYPE.STRING, FIELD_TYPE.ENUM,
+                               FIELD_TYPE.SET, FIELD_TYPE.TINY_BLOB, FIELD_TYPE.MEDIUM_BLOB, FIELD_TYPE.LONG_BLOB,
+                               FIELD_TYPE.BLOB):
+                # 字符集为 binary(63) 的列返回 bytes, 其余返回 str; 无列信息时按文本处理
+                types.append(pa.binary() if field is not None and field.charsetnr == 63 else pa.string())
+            elif type_code in (FIELD_TYPE.BIT, FIELD_TYPE.GEOMETRY):
+                types.append(pa.binary())
+            else:
+                types.append(None)
+        return types
+
+    @staticmethod
+    def _arrow_decimal(col, field=None):
+        """
+        根据列定义确定 DECIMAL 列的 Arrow 类型
+        列长度包括小数点和符号位: 有列信息时扣除小数点, 并按是否无符号扣除符号位, 得到精确的精度;
+        只有 description 时无法判断是否无符号, 只扣除小数点, 精度可能比列定义多 1 位, 但不会小于列定义
+        :param col: description 中的一列
+        :param field: 该列的列信息
+        :return: decimal128 / decimal256 类型, 无长度信息时为 None
+        """
+        length = field.length if field is not None else col[4]
+        scale = (field.scale if field is not None else col[5]) or 0
+        if not length:
+            return None
+        precision = length - (1 if scale else 0)
+        if field is not None and not field.flags & FLAG.UNSIGNED:
+            precision -= 1
+        precision = max(precision, scale, 1)
+        if precision > 38:
+            return pa.decimal256(min(precision, 76), scale)
+        return pa.decimal128(precision, scale)
+
+    def _rows_to_record_batch(self, rows, description, types):
+        """
+        将一块查询结果按列直接写入 Arrow 数组, 不再为每行创建字典
+        类型为 None 的列按本块数据推断后写回 types, 之后各块都按同一类型转换
+        :param rows: 查询结果
+        :param description: 游标的 description
+        :param types: _arrow_types 返回的类型列表
+        :return: pyarrow.RecordBatch
+        :raises TypeError: 数据无法转换为列类型时抛出异常
+        """
+        names = [col[0] for col in description]
+        columns = zip(*rows) if rows else ([] for _ in names)
+        arrays = []
+        for i, values in enumerate(columns):
+            if types[i] is None:
+                array = pa.array(values, type=None if rows else pa.null())
+                types[i] = array.type
+            else:
+                try:
+                    array = pa.array(values, type=types[i])
+                except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError) as e:
+                    raise TypeError(f"列 {names[i]} 的数据无法转换为 {types[i]}: {e}") from e
+            arrays.append(array)
+        return pa.RecordBatch.from_arrays(arrays, names=names)
+
+    @staticmethod
+    def _batches_to_table(batches):
+        """
+        合并多块数据为 Arrow 表
+        :param batches: RecordBatch 列表, 各块结构一致
+        :return: pyarrow.Table
+        """
+        if not batches:
+            return pa.table({})
+        return pa.Table.from_batches(batches)
+
+    @staticmethod
+    def _table_to_frame(table):
+        """
+        将 Arrow 表转换为 pandas DataFrame, 转换时释放 Arrow 内存以降低峰值
+        :param table: pyarrow.Table
+        :return: pandas.DataFrame
+        """
+        try:
+            return table.to_pandas(split_blocks=True, self_destruct=True)
+        except ImportError:
+            raise ImportError("导出 DataFrame 需要安装 pandas: pip install pandas")
+
+    def _convert_to_json(self, result):
+        """
+        将查询结果转换为 JSON 格式
+        :param result: 查询结果
+        :return: JSON 格式的结果
+        """
+        try:
+            if self.use_orjson:
+                return orjson.dumps(result).decode("utf-8")
+            return json.dumps(result)
+        except Exception as e:
+            logger.error(f"转换为 JSON 格式失败: {e}")
+            return result
+
+    def _make_insert_clauses(self, table, columns, mode=None, update_columns=None):
+        """
+        生成插入语句的头部和尾部, VALUES 部分由调用方拼接
+        :param table: 表名
+        :param columns: 列名列表
+        :param mode: 冲突处理方式, None / 'ignore' / 'update'
+        :param update_columns: mode='update' 时冲突后更新的列, 默认为全部插入列
+        :return: (头部, 尾部)
+        :raises ValueError: 当 mode 不支持时抛出异常
+        """
+        if mode not in (None, "ignore", "update"):
+            raise ValueError(f"不支持的插入模式: {mode}")
+
+        keyword = "INSERT IGNORE" if mode == "ignore" else "INSERT"
+        head = f"{keyword} INTO {table} ({', '.join(columns)}) VALUES "
+        tail = ""
+        if mode == "update":
+            tail = " ON DUPLICATE KEY UPDATE " + ", ".join(f"{col}=VALUES({col})" for col in update_columns or columns)
+        return head, tail
+
+    @staticmethod
+    def _insert_columns(rows):
+        """
+        取第一行的键作为插入列, 并检查每一行的键都与之一致, 保证在写入任何一块之前发现不一致的数据
+        :param rows: 数据列表
+        :return: 列名列表
+        :raises ValueError: 当数据为空或某行的键与第一行不一致时抛出异常
+        """
+        if not rows or not rows[0]:
+            raise ValueError("插入数据不能为空")
+        columns = list(rows[0].keys())
+        expected = set(columns)
+        for i, row in enumerate(rows):
+            if row.keys() != expected:
+                missing = sorted(expected - row.keys())
+                extra = sorted(row.keys() - expected)
+                raise ValueError(f"第 {i} 行的列与第一行不一致, 缺少: {missing}, 多出: {extra}")
+        return columns
+
+    @staticmethod
+    def _iter_insert_chunks(rows, columns, mogrify, chunk_size, limit):
+        """
+        将多行数据转义并按行数和字节数分块
+        :param rows: 数据列表
+        :param columns: 列名列表
+        :param mogrify: 游标的 mogrify 方法, 用于转义一行数据
+        :param chunk_size: 每块最多的行数
+        :param limit: 每块 VALUES 部分的最大字节数
+        :return: 生成器, 每次返回 (块中第一行的序号, 转义后的 "(...)" 列表)
+        """
+        placeholders = f"({', '.join(['%s'] * len(columns))})"
+        values, size, first = [], 0, 0
+        for i, row in enumerate(rows):
+            value = mogrify(placeholders, [row[col] for col in columns])
+            value_size = len(value.encode()) + 2
+            if values and (len(values) >= chunk_size or size + value_size > limit):
+                yield first, values
+                values, size, first = [], 0, i
+            values.append(value)
+            size += value_size
+        if values:
+            yield first, values
+
+    def _make_insert_sql(self, table, data, mode=None, update_columns=None, **kwargs):
+        """
+        生成插入 SQL 语句
+        :param table: 表名
+        :param data: 数据字典
+        :param mode: 冲突处理方式, None / 'ignore' / 'update'
+        :param update_columns: mode='update' 时冲突后更新的列, 默认为全部插入列
+        :param kwargs: 其他可选参数
+        :return: 生成的 SQL 语句
+        """
+        columns = tuple(data.keys())
+
+        def build():
+            head, tail = self._make_insert_clauses(table, columns, mode, update_columns)
+            placeholders = ', '.join(['%s'] * len(columns))
+            return f"{head}({placeholders}){tail}"
+
+        return self._cached_sql(("insert", table, columns, mode, tuple(update_columns or ())), build)
+
+    def _make_update_sql(self, table, data, where, **kwargs):
+        """
+        生成更新 SQL 语句
+        :param table: 表名
+        :param data: 要更新的数据，格式为字典 {"column": "value"}
+        :param where: 更新条件
+        :param kwargs: 其他参数用于辅助生成 SQL
+        :return: 更新语句字符串
+        """
+        if not data:
+            raise ValueError("更新数据不能为空")
+        if not where:
+            raise ValueError("更新条件不能为空")
+
+        columns = tuple(data.keys())
+
+        def build():
+            set_clause = ', '.join([f"{k}=%s" for k in columns])
+            return f"UPDATE {table} SET {set_clause} WHERE {where}"
+
+        return self._cached_sql(("update", table, columns, where), build)
+
+    def _make_delete_sql(self, table, where, **kwargs):
+        """
+        生成删除 SQL 语句
+        :param table: 表名
+        :param where: 删除条件
+        :param kwargs: 其他参数用于辅助生成 SQL
+        :return: 删除语句字符串
+        """
+        if not where:
+            raise ValueError("删除条件不能为空")
+
+        return self._cached_sql(("delete", table, where), lambda: f"DELETE FROM {table} WHERE {where}")
+
+
+class SmartSQL(BaseSmartSQL):
+    def __init__(self, ip=None, port=None, db=None, user_name=None, user_pass=None, sql_cache_size=256,
+                 mincached=None, maxcached=None, maxconnections=None, blocking=None, maxusage=None, ping=None,
+                 ping_interval=None, json_columns=None, use_orjson=False, **kwargs):
+        """
+        初始化 MySQL 数据库连接池, 连接池参数默认从 config 文件 [pool] 配置加载
+        :param ip: 数据库 IP 地址，默认从环境变量加载或 config 文件配置
+        :param port: 数据库端口号，默认从环境变量加载或 config 文件配置
+        :param db: 数据库名称，默认从环境变量加载或 config 文件配置
+        :param user_name: 数据库用户名，默认从环境变量加载或 config 文件配置
+        :param user_pass: 数据库密码，默认从环境变量加载或 config 文件配置
+        :param sql_cache_size: smart_* 方法生成的 SQL 语句缓存条数, 0 为不缓存
+        :param mincached: 启动时创建的空闲连接数
+        :param maxcached: 连接池中最多保留的空闲连接数, 0 为不限制
+        :param maxconnections: 最大连接数, 0 为不限制
+        :param blocking: 连接用尽时是否阻塞等待, 否则抛出异常
+        :param maxusage: 单个连接最多执行的查询次数, 达到后重建, 0 为不限制
+        :param ping: DBUtils 的 ping 策略, 0 为不检查, 7 为每次取出连接和执行查询都检查
+        :param ping_interval: 连接空闲超过该秒数后, 取出时先 ping 检查(失效时自动重连), -1 为不检查
+        :param json_columns: 转换列数据类型时额外按 JSON 解析的列名, JSON 类型的列总是会被解析
+        :param use_orjson: to_json=True 时是否使用 orjson 解析和序列化 JSON
+        :param kwargs: 其他可选参数，用于扩展连接配置
+        """
+        super().__init__(ip, port, db, user_name, user_pass, sql_cache_size, json_columns, use_orjson)
+        self.mincached = MYSQL_MINCACHED if mincached is None else mincached
+        self.maxcached = MYSQL_MAXCACHED if maxcached is None else maxcached
+        self.maxconnections = MYSQL_MAXCONNECTIONS if maxconnections is None else maxconnections
+        self.blocking = MYSQL_BLOCKING if blocking is None else blocking
+        self.maxusage = MYSQL_MAXUSAGE if maxusage is None else maxusage
+        self.ping = MYSQL_PING if ping is None else ping
+        self.ping_interval = MYSQL_PING_INTERVAL if ping_interval is None else ping_interval
+        self.pool_stats = PoolStats()
+        self._last_used = weakref.WeakKeyDictionary()
+        self._local = threading.local()
+
+        def creator(*args, **kwargs):
+            conn = pymysql.connect(*args, **kwargs)
+            self.pool_stats.record_connect()
+            return conn
+
+        creator.dbapi = pymysql
+
+        try:
+            self.connect_pool = PooledDB(
+                creator=creator,
+                mincached=self.mincached,
+                maxcached=self.maxcached,
+                maxconnections=self.maxconnections,
+                blocking=self.blocking,
+                maxusage=self.maxusage,
+                ping=self.ping,
+                host=self.ip,
+                port=self.port,
+                user=self.user_name,
+                passwd=self.user_pass,
+                db=self.db,
+                charset="utf8mb4",
+                cursorclass=cursors.SSCursor,
+            )
+        except Exception as e:
+            logger.error(f"连接数据库失败: {self.ip}:{self.port}，异常: {e}")
+        else:
+            logger.debug(f"成功连接到 MySQL 数据库 {self.ip}:{self.db}")
+
     @contextmanager
     def get_connection(self):
         """
         获取数据库连接和游标的上下文管理器，确保资源正确释放
+        当前线程处于 session() / transaction() 中时使用固定的连接, 提交由会话统一处理
         :return: 数据库连接和游标
         """
+        session = self._current_session()
+        if session is not None:
+            cursor = session.conn.cursor()
+            try:
+                yield session.proxy, cursor
+            finally:
+                cursor.close()
+            return
+
+        with self._checkout() as (conn, cursor):
+            yield conn, cursor
+
+    def _current_session(self):
+        """
+        获取当前线程固定连接的会话, 没有时返回 None
+        :return: Session 实例
+        """
+        return getattr(self._local, "session", None)
+
+    @contextmanager
+    def session(self):
+        """
+        会话: 当前线程内的操作共用一个连接, 减少取出连接的次数; 连接开启 autocommit, 每条语句单独提交
+        嵌套调用时复用外层会话
+        用法: with db.session(): db.find(...); db.add_smart(...)
+        :return: Session 实例
+        """
+        session = self._current_session()
+        if session is not None:
+            yield session
+            return
+
+        with self._checkout() as (conn, cursor):
+            conn.autocommit(True)
+            session = self._local.session = Session(self, conn)
+            try:
+                yield session
+            finally:
+                self._local.session = None
+                conn.autocommit(False)
+
+    @contextmanager
+    def transaction(self):
+        """
+        事务: 当前线程内的操作共用一个连接, 正常退出时统一提交, 发生异常时回滚并继续抛出异常
+        事务中 find / add_smart / update_smart / delete_smart 等方法执行出错时抛出异常而不是返回默认值;
+        嵌套调用时使用保存点, 内层异常只回滚到保存点
+        用法: with db.transaction() as tx: db.add_smart(...); db.update_smart(...)
+        :return: Session 实例
+        """
+        session = self._current_session()
+        if session is not None and session.atomic:
+            with session.savepoint():
+                yield session
+            return
+        if session is not None:
+            with session.begin():
+                yield session
+            return
+
+        with self._checkout() as (conn, cursor):
+            session = self._local.session = Session(self, conn)
+            try:
+                with session.begin():
+                    yield session
+            finally:
+                self._local.session = None
+
+    @contextmanager
+    def _checkout(self):
+        """
+        从连接池取出连接和游标, 空闲超过 ping_interval 的连接先 ping 检查
+        :return: 数据库连接和游标
+        """
+        start = time.perf_counter()
         conn = self.connect_pool.connection(shareable=False)
-        cursor = conn.cursor()
+        self.pool_stats.observe_checkout(time.perf_counter() - start)
+        # 底层连接在归还后会被复用, 按底层连接记录最后使用时间
+        raw = getattr(conn, "_con", conn)
+        last = self._last_used.get(raw)
+        if self.ping_interval >= 0 and last is not None and time.monotonic() - last > self.ping_interval:
+            try:
+                conn.ping()
+                self.pool_stats.record_ping(True)
+            except Exception as e:
+                self.pool_stats.record_ping(False)
+                logger.warning(f"连接检查失败: {e}")
         try:
-            yield conn, cursor
+            cursor = conn.cursor()
+            try:
+                yield conn, cursor
+            finally:
+                cursor.close()
         finally:
-            cursor.close()
+            self._last_used[raw] = time.monotonic()
+            self.pool_stats.release()
             conn.close()
 
+    def _execute(self, cursor, sql, params=None):
+        """
+        执行 SQL 并记录耗时
+        :param cursor: 数据库游标
+        :param sql: SQL 语句
+        :param params: SQL 参数
+        :return: 影响的行数
+        """
+        start = time.perf_counter()
+        try:
+            return cursor.execute(sql, params or ())
+        finally:
+            self.pool_stats.observe_query(time.perf_counter() - start)
+
     def size_of_connections(self):
         """
-        获取当前活跃的连接数
+        获取当前活跃(已取出)的连接数
         :return: 当前活跃连接数
         """
-        return len(self.connect_pool._connections)
+        return self.pool_stats.in_use
 
     def size_of_connect_pool(self):
         """
-        获取连接池中所有连接数
-        :return: 连接池中的连接数
+        获取连接池中空闲的连接数
+        :return: 空闲连接数
+        """
+        return len(getattr(self.connect_pool, "_idle_cache", ()))
+
+    def get_pool_metrics(self):
+        """
+        获取连接池指标, 用于按进程调整连接池大小
+        :return: {"in_use", "peak_in_use", "idle", "max_connections", "created", "checkouts", "pings",
+                  "ping_failures", "checkout_wait": 直方图, "query_latency": 直方图},
+                 直方图为 {"buckets": {桶上限: 累计次数}, "sum", "count", "max"}
         """
-        return len(self.connect_pool._idle_cache)
+        metrics = self.pool_stats.snapshot()
+        metrics["idle"] = self.size_of_connect_pool()
+        metrics["max_connections"] = self.maxconnections
+        return metrics
 
-    def smart_find(self, table, columns='*', where=None, limit=0, offset=0, to_json=False, convert_col=True):
+    def smart_find(self, table, columns='*', where=None, limit=0, offset=0, to_json=False, convert_col=True,
+                   cache_ttl=None, columnar=False):
         """
         智能查询数据
         :param table: 表名
@@ -117,40 +824,186 @@ class SmartSQL:
         :param offset: 查询结果的偏移量，用于分页
         :param to_json: 是否将查询结果转换为 JSON 格式
         :param convert_col: 是否转换列数据类型（如日期类型转字符串）
+        :param cache_ttl: 启用结果缓存时本次查询的缓存秒数, None 为默认值, 0 为不使用缓存
+        :param columnar: 是否按列返回结果 {"列名": [值, ...]}
         :return: 查询结果，默认返回元组，若 to_json=True 则返回字典或字典列表
         """
-        sql = f"SELECT {columns} FROM {table}"
-        if where:
-            sql += f" WHERE {where}"
-        if limit > 0:
-            sql += f" LIMIT {limit}"
-        if offset > 0:
-            sql += f" OFFSET {offset}"
+        sql = self._cached_sql(("select", table, columns, where, limit, offset),
+                               lambda: self._make_select_sql(table, columns, where, limit, offset))
+        result = self.find(sql, to_json=to_json, convert_col=convert_col, cache_ttl=cache_ttl, columnar=columnar)
+        return result
+
+    def find(self, sql, params=None, limit=0, to_json=False, convert_col=True, cache_ttl=None, columnar=False):
+        """
+        查询数据
+        :param sql: SQL 查询语句
+        :param params: 可选的查询参数，用于参数化查询
+        :param limit: 限制返回结果数量，0 为不限制
+        :param to_json: 是否将查询结果转换为 JSON 格式
+        :param convert_col: 是否转换列数据类型（如日期类型转字符串）
+        :param cache_ttl: 启用结果缓存时本次查询的缓存秒数, None 为默认值, 0 为不使用缓存
+        :param columnar: 是否按列返回结果 {"列名": [值, ...]}, 可与 to_json 同时使用
+        :return: 查询结果，默认返回元组，若 to_json=True 则返回字典或字典列表
+        """
+        # 事务中可能读到未提交的数据, 不使用缓存
+        cache = self.result_cache if cache_ttl != 0 and not self._in_transaction() else None
+        if cache:
+            key, hit, value = cache.lookup(sql, params, (limit, to_json, convert_col, columnar))
+            if hit:
+                return value
+
+        result = self._execute_sql(sql, params, limit, fetch=True)
+
+        if result["cursor"] is not None and (to_json or columnar):
+            description = result["cursor"].description
+            rows = [result["data"]] if limit == 1 and result["data"] else result["data"] or []
+            if columnar:
+                result["data"] = self._rows_to_columns(rows, description, convert_col)
+            else:
+                result["data"] = self._rows_to_dict(rows, description, convert_col)
+                if limit == 1:
+                    result["data"] = result["data"][0] if result["data"] else None
+            if to_json:
+                result["data"] = self._convert_to_json(result["data"])
+
+        if cache and result["cursor"] is not None:
+            cache.store(key, result["data"], cache_ttl)
+        return result["data"]
+
+    def stream_find(self, sql, params=None, chunk_size=1000, to_dict=False, convert_col=True):
+        """
+        流式查询数据, 按块返回结果, 查询期间一直占用同一个连接
+        连接池使用 SSCursor(非缓冲游标), 每次只从服务端读取 chunk_size 行, 内存占用与结果集大小无关
+        注意: 提前结束迭代时, 关闭游标会读完服务端剩余的结果, 大结果集请在 SQL 中限制范围
+        :param sql: SQL 查询语句
+        :param params: 可选的查询参数，用于参数化查询
+        :param chunk_size: 每块的行数
+        :param to_dict: 是否将每行转换为字典
+        :param convert_col: 是否转换列数据类型（如日期类型转字符串），仅在 to_dict=True 时生效
+        :return: 生成器, 每次返回一块查询结果(列表)
+        """
+        try:
+            with self.get_connection() as (conn, cursor):
+                self._execute(cursor, sql, params)
+                description = cursor.description or ()
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield self._rows_to_dict(rows, description, convert_col) if to_dict else list(rows)
+        except pymysql.MySQLError as e:
+            logger.error(f"执行 SQL 出错: {e}, SQL: {sql}, 参数: {params}")
+            if self._in_transaction():
+                raise
+
+    def iter_find(self, sql, params=None, chunk_size=1000, to_dict=False, convert_col=True):
+        """
+        流式查询数据, 逐行返回结果, 每次从服务端读取 chunk_size 行
+        :param sql: SQL 查询语句
+        :param params: 可选的查询参数，用于参数化查询
+        :param chunk_size: 每次从服务端读取的行数
+        :param to_dict: 是否将每行转换为字典
+        :param convert_col: 是否转换列数据类型（如日期类型转字符串），仅在 to_dict=True 时生效
+        :return: 生成器, 每次返回一行(元组或字典)
+        """
+        for rows in self.stream_find(sql, params, chunk_size, to_dict, convert_col):
+            yield from rows
 
-        result = self.find(sql, to_json=to_json, convert_col=convert_col)
-        return result
+    def smart_stream_find(self, table, columns='*', where=None, params=None, key=None, start=None,
+                          chunk_size=1000, to_dict=False, convert_col=True):
+        """
+        智能流式查询数据, 按块返回结果
+        指定 key 时使用键集分页: 每块执行一次 "WHERE key > 上一块最后的值 ORDER BY key LIMIT chunk_size",
+        走索引定位, 不会像 OFFSET 一样越翻越慢, 每块查询结束后服务端不保留游标, 适合导出大表
+        :param table: 表名
+        :param columns: 要查询的列，默认为 '*'，指定 key 时必须包含 key 列
+        :param where: 查询条件，例如 "age > 30"
+        :param params: 查询条件中的参数
+        :param key: 分页键, 需为唯一且有索引的列(如主键), 为空时不分页, 直接流式读取
+        :param start: 分页键的起始值(不包含), 可用于断点续传
+        :param chunk_size: 每块的行数
+        :param to_dict: 是否将每行转换为字典
+        :param convert_col: 是否转换列数据类型（如日期类型转字符串），仅在 to_dict=True 时生效
+        :return: 生成器, 每次返回一块查询结果(列表)
+        """
+        if not key:
+            sql = self._make_select_sql(table, columns, where)
+            yield from self.stream_find(sql, params, chunk_size, to_dict, convert_col)
+            return
+
+        params = list(params or ())
+        last = start
+        try:
+            with self.get_connection() as (conn, cursor):
+                key_index = None
+                while True:
+                    sql = self._make_keyset_sql(table, columns, where, key, last is not None, chunk_size)
+                    self._execute(cursor, sql, params if last is None else params + [last])
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    column_names = [col[0] for col in cursor.description]
+                    if key_index is None:
+                        key_index = self._key_index(column_names, key)
+                    last = rows[-1][key_index]
+                    yield self._rows_to_dict(rows, cursor.description, convert_col) if to_dict else list(rows)
+                    if len(rows) < chunk_size:
+                        break
+        except pymysql.MySQLError as e:
+            logger.error(f"执行 SQL 出错: {e}, 表: {table}, 分页键: {key}, 最后的值: {last}")
+            if self._in_transaction():
+                raise
 
-    def find(self, sql, params=None, limit=0, to_json=False, convert_col=True):
+    def iter_record_batches(self, sql, params=None, batch_size=10000):
         """
-        查询数据
+        流式查询数据, 每块转换为一个 Arrow RecordBatch, 适合导出大表
+        列类型在查询开始时按 cursor.description 一次性确定, 各块结构一致; 查询期间一直占用同一个连接, 结果为空时返回一个空块
         :param sql: SQL 查询语句
         :param params: 可选的查询参数，用于参数化查询
-        :param limit: 限制返回结果数量，0 为不限制
-        :param to_json: 是否将查询结果转换为 JSON 格式
-        :param convert_col: 是否转换列数据类型（如日期类型转字符串）
-        :return: 查询结果，默认返回元组，若 to_json=True 则返回字典或字典列表
+        :param batch_size: 每块的行数
+        :return: 生成器, 每次返回一个 pyarrow.RecordBatch
+        :raises TypeError: 数据无法转换为列类型时(如 '0000-00-00' 这类无效日期)抛出异常
         """
-        result = self._execute_sql(sql, params, limit, fetch=True)
+        if pa is None:
+            raise ImportError("导出 Arrow 数据需要安装 pyarrow: pip install pyarrow")
+        try:
+            with self.get_connection() as (conn, cursor):
+                self._execute(cursor, sql, params)
+                description = cursor.description or ()
+                types = self._arrow_types(description, getattr(getattr(cursor, "_result", None), "fields", None))
+                empty = True
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    empty = False
+                    yield self._rows_to_record_batch(rows, description, types)
+                if empty:
+                    yield self._rows_to_record_batch([], description, types)
+        except pymysql.MySQLError as e:
+            logger.error(f"执行 SQL 出错: {e}, SQL: {sql}, 参数: {params}")
+            if self._in_transaction():
+                raise
 
-        if to_json:
-            columns = [col[0] for col in result["cursor"].description]
-            if convert_col:
-                result["data"] = [self._convert_row(row, columns) for row in result["data"]]
-            else:
-                result["data"] = [dict(zip(columns, row)) for row in result["data"]]
-            result["data"] = self._convert_to_json(result["data"])
+    def find_arrow(self, sql, params=None, batch_size=10000):
+        """
+        查询数据并返回 Arrow 表
+        :param sql: SQL 查询语句
+        :param params: 可选的查询参数，用于参数化查询
+        :param batch_size: 每次从服务端读取的行数
+        :return: pyarrow.Table, 查询出错时返回空表
+        """
+        return self._batches_to_table(list(self.iter_record_batches(sql, params, batch_size)))
 
-        return result["data"]
+    def find_frame(self, sql, params=None, batch_size=10000):
+        """
+        查询数据并返回 pandas DataFrame, 数据先按列写入 Arrow 再整体转换, 不逐行创建 Python 对象
+        :param sql: SQL 查询语句
+        :param params: 可选的查询参数，用于参数化查询
+        :param batch_size: 每次从服务端读取的行数
+        :return: pandas.DataFrame
+        """
+        return self._table_to_frame(self.find_arrow(sql, params, batch_size))
 
     def _execute_sql(self, sql, params=None, limit=0, fetch=False):
         """
@@ -164,20 +1017,25 @@ class SmartSQL:
         try:
             with self.get_connection() as (conn, cursor):
                 if fetch:
-                    cursor.execute(sql, params or ())
+                    self._execute(cursor, sql, params)
                     data = self._fetch_results(cursor, limit)
                     return {"cursor": cursor, "data": data}
                 else:
-                    affect_count = cursor.execute(sql, params or ())
+                    affect_count = self._execute(cursor, sql, params)
                     conn.commit()
+                    self._invalidate_cache(sql)
                     return affect_count
         except pymysql.MySQLError as e:
             logger.error(f"执行 SQL 出错: {e}, SQL: {sql}, 参数: {params}")
+            if self._in_transaction():
+                raise
             if fetch:
                 return {"cursor": None, "data": []}
             return 0
         except Exception as e:
             logger.error(f"执行 SQL 出错: {e}, SQL: {sql}, 参数: {params}")
+            if self._in_transaction():
+                raise
             if fetch:
                 return {"cursor": None, "data": []}
             return 0
@@ -196,38 +1054,6 @@ class SmartSQL:
         else:
             return cursor.fetchall()
 
-    def _convert_row(self, row, columns):
-        """
-        转换行数据的列数据类型
-        :param row: 查询结果中的一行数据
-        :param columns: 列名列表
-        :return: 转换后的行数据
-        """
-        def convert(col):
-            if isinstance(col, (datetime.date, datetime.time)):
-                return str(col)
-            elif isinstance(col, str) and (col.startswith("{") or col.startswith("[")):
-                try:
-                    return json.loads(col)
-                except Exception:
-                    return col
-            else:
-                return col
-
-        return dict(zip(columns, [convert(col) for col in row]))
-
-    def _convert_to_json(self, result):
-        """
-        将查询结果转换为 JSON 格式
-        :param result: 查询结果
-        :return: JSON 格式的结果
-        """
-        try:
-            return json.dumps(result)
-        except Exception as e:
-            logger.error(f"转换为 JSON 格式失败: {e}")
-            return result
-
     def add(self, sql, params=None):
         """
         添加单条数据到数据库
@@ -253,19 +1079,76 @@ class SmartSQL:
         params = tuple(data.values())
         return self.add(sql, params)
 
-    def _make_insert_sql(self, table, data, **kwargs):
+    def add_many_smart(self, table, rows, mode=None, update_columns=None, chunk_size=1000, max_packet=None,
+                       on_error=None):
         """
-        生成插入 SQL 语句
+        批量插入数据, 多行合并为一条 INSERT ... VALUES (...), (...) 语句, 每块一个事务
+        每块的大小受 chunk_size 和服务端 max_allowed_packet 共同限制, 整个调用只占用一个连接
         :param table: 表名
-        :param data: 数据字典
-        :param kwargs: 其他可选参数
-        :return: 生成的 SQL 语句
+        :param rows: 要插入的数据列表, 格式为 [{"column": "value"}, ...], 所有字典的键需与第一行一致, 写入前检查
+        :param mode: 冲突处理方式, None 为普通插入, 'ignore' 为 INSERT IGNORE, 'update' 为 ON DUPLICATE KEY UPDATE
+        :param update_columns: mode='update' 时冲突后更新的列, 默认为全部插入列
+        :param chunk_size: 每块最多的行数
+        :param max_packet: 每条语句的最大字节数, 默认读取服务端 max_allowed_packet
+        :param on_error: 块执行失败时的回调函数, 参数为 (该块的数据列表, 异常)
+        :return: 每块影响的行数列表, 执行失败的块记为 0
+        :raises ValueError: 当数据为空或各行的列不一致时抛出异常
         """
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join(['%s'] * len(data))
-        sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
-        return sql
+        rows = list(rows)
+        columns = self._insert_columns(rows)
+        head, tail = self._cached_sql(
+            ("insert_clauses", table, tuple(columns), mode, tuple(update_columns or ())),
+            lambda: self._make_insert_clauses(table, columns, mode, update_columns),
+        )
+        counts = []
+
+        with self.get_connection() as (conn, cursor):
+            # 预留语句头尾和协议包头的空间
+            limit = (max_packet or self._get_max_packet(cursor)) - len(head.encode()) - len(tail.encode()) - 1024
+
+            def flush(values, first):
+                sql = f"{head}{', '.join(values)}{tail}"
+                try:
+                    counts.append(self._execute(cursor, sql))
+                    conn.commit()
+                except pymysql.MySQLError as e:
+                    logger.error(f"批量插入出错: {e}, 表: {table}, 行: {first}-{first + len(values) - 1}")
+                    if self._in_transaction():
+                        raise
+                    conn.rollback()
+                    counts.append(0)
+                    if on_error:
+                        on_error(rows[first:first + len(values)], e)
+
+            for first, values in self._iter_insert_chunks(rows, columns, cursor.mogrify, chunk_size, limit):
+                flush(values, first)
+
+        self._invalidate_cache(tables=[table])
+        return counts
+
+    def write_behind(self, **kwargs):
+        """
+        创建异步批量写入器, 参数见 WriteBehindWriter
+        用法: with db.write_behind(batch_size=500) as writer: writer.add("table", {"column": "value"})
+        :param kwargs: WriteBehindWriter 的参数
+        :return: WriteBehindWriter 实例
+        """
+        return WriteBehindWriter(self, **kwargs)
 
+    def _get_max_packet(self, cursor):
+        """
+        获取服务端 max_allowed_packet, 结果会被缓存
+        :param cursor: 数据库游标
+        :return: 字节数, 读取失败时返回 4MB
+        """
+        if getattr(self, "_max_packet", None) is None:
+            try:
+                self._execute(cursor, "SELECT @@max_allowed_packet")
+                self._max_packet = int(cursor.fetchone()[0])
+            except Exception as e:
+                logger.warning(f"读取 max_allowed_packet 失败, 使用默认值 4MB: {e}")
+                return 4 * 1024 * 1024
+        return self._max_packet
 
     def update(self, sql, params=None):
         """
@@ -276,11 +1159,14 @@ class SmartSQL:
         """
         try:
             with self.get_connection() as (conn, cursor):
-                cursor.execute(sql, params or (()))
+                self._execute(cursor, sql, params)
                 conn.commit()
+                self._invalidate_cache(sql)
                 return True
         except Exception as e:
             logger.error(f"更新数据出错: {e}, SQL: {sql}")
+            if self._in_transaction():
+                raise
             return False
 
     def delete(self, sql, params=None):
@@ -292,11 +1178,14 @@ class SmartSQL:
         """
         try:
             with self.get_connection() as (conn, cursor):
-                cursor.execute(sql, params or (()))
+                self._execute(cursor, sql, params)
                 conn.commit()
+                self._invalidate_cache(sql)
                 return True
         except Exception as e:
             logger.error(f"删除数据出错: {e}, SQL: {sql}")
+            if self._in_transaction():
+                raise
             return False
 
     def execute(self, sql, params=None):
@@ -308,11 +1197,14 @@ class SmartSQL:
         """
         try:
             with self.get_connection() as (conn, cursor):
-                cursor.execute(sql, params or ())
+                self._execute(cursor, sql, params)
                 conn.commit()
+                self._invalidate_cache(sql)
                 return True
         except Exception as e:
             logger.error(f"执行 SQL 出错: {e}, SQL: {sql}")
+            if self._in_transaction():
+                raise
             return False
 
     def execute_smart(self, table, data, **kwargs):
@@ -324,25 +1216,7 @@ class SmartSQL:
         :return: 执行成功返回 True，否则返回 False
         """
         sql = self._make_insert_sql(table, data, **kwargs)
-        return self.execute(sql)
-
-    def _make_update_sql(self, table, data, where, **kwargs):
-        """
-        生成更新 SQL 语句
-        :param table: 表名
-        :param data: 要更新的数据，格式为字典 {"column": "value"}
-        :param where: 更新条件
-        :param kwargs: 其他参数用于辅助生成 SQL
-        :return: 更新语句字符串
-        """
-        if not data:
-            raise ValueError("更新数据不能为空")
-        if not where:
-            raise ValueError("更新条件不能为空")
-
-        set_clause = ', '.join([f"{k}=%s" for k in data.keys()])
-        sql = f"UPDATE {table} SET {set_clause} WHERE {where}"
-        return sql
+        return self.execute(sql, tuple(data.values()))
 
     def update_smart(self, table, data, where, **kwargs):
         """
@@ -357,20 +1231,6 @@ class SmartSQL:
         params = list(data.values())
         return self.execute(sql, params)
 
-    def _make_delete_sql(self, table, where, **kwargs):
-        """
-        生成删除 SQL 语句
-        :param table: 表名
-        :param where: 删除条件
-        :param kwargs: 其他参数用于辅助生成 SQL
-        :return: 删除语句字符串
-        """
-        if not where:
-            raise ValueError("删除条件不能为空")
-
-        sql = f"DELETE FROM {table} WHERE {where}"
-        return sql
-
     def delete_smart(self, table, where, **kwargs):
         """
         根据给定的表名和条件，智能生成删除 SQL 语句并执行
@@ -383,6 +1243,748 @@ class SmartSQL:
         return self.execute(sql)
 
 
+# 读语句中的表名
+_TABLE_NAME_RE = re.compile(r"`?[\w$]+`?(?:\.`?[\w$]+`?)?")
+_FROM_RE = re.compile(r"\bFROM\b\s*", re.I)
+_JOIN_RE = re.compile(r"\b(?:STRAIGHT_JOIN|JOIN)\b\s*", re.I)
+# FROM 子句之后的子句
+_FROM_END_RE = re.compile(
+    r"(?:WHERE|GROUP|HAVING|ORDER|LIMIT|UNION|EXCEPT|INTERSECT|WINDOW|FOR|LOCK|INTO|PROCEDURE|ON\s+DUPLICATE)\b",
+    re.I,
+)
+_SUBQUERY_RE = re.compile(r"\(\s*(?:SELECT|WITH|VALUES|TABLE)\b", re.I)
+# 写语句中的目标表名
+_WRITE_MODIFIERS = r"(?:\s+(?:LOW_PRIORITY|DELAYED|HIGH_PRIORITY|QUICK|IGNORE)\b)*"
+_WRITE_TABLES_RE = re.compile(
+    rf"^\s*(?:(?P<multi>UPDATE{_WRITE_MODIFIERS}|DELETE{_WRITE_MODIFIERS}\s+FROM)"
+    rf"|(?:INSERT|REPLACE){_WRITE_MODIFIERS}(?:\s+INTO)?"
+    r"|TRUNCATE(?:\s+TABLE)?|(?:DROP|ALTER|CREATE|RENAME)\s+TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?)\s+",
+    re.I,
+)
+# 写语句中不能作为表名的关键字, 出现时说明语句无法可靠解析
+_WRITE_KEYWORDS = {"LOW_PRIORITY", "DELAYED", "HIGH_PRIORITY", "QUICK", "IGNORE", "INTO", "FROM", "TABLE", "SET",
+                   "USING", "WHERE", "VALUES", "SELECT"}
+# UPDATE / DELETE 目标表列表之后的子句
+_WRITE_TARGETS_END_RE = re.compile(r"(?:SET|USING|WHERE|ORDER|LIMIT)\b", re.I)
+# 不修改数据的语句
+_READ_ONLY_RE = re.compile(r"^\s*(?:SELECT|SHOW|DESC|DESCRIBE|EXPLAIN|SET|USE)\b", re.I)
+
+
+def _normalize_table(name):
+    """去掉反引号和库名前缀, 统一小写"""
+    return name.replace("`", "").split(".")[-1].lower()
+
+
+def _skip_quoted(sql, i):
+    """
+    跳过从 i 开始的引号内容
+    :param sql: SQL 语句
+    :param i: 引号的位置
+    :return: 闭合引号之后的位置
+    """
+    end = sql.find(sql[i], i + 1)
+    while end != -1 and sql[end - 1] == "\\":
+        end = sql.find(sql[i], end + 1)
+    return len(sql) if end == -1 else end + 1
+
+
+def _is_multi_statement(sql):
+    """
+    判断 SQL 是否包含多条以分号分隔的语句, 忽略引号内和末尾的分号
+    :param sql: SQL 语句
+    :return: 是否为多条语句
+    """
+    i = 0
+    while i < len(sql):
+        ch = sql[i]
+        if ch in "'\"`":
+            i = _skip_quoted(sql, i)
+            continue
+        if ch == ";" and sql[i + 1:].strip(" \t\r\n;"):
+            return True
+        i += 1
+    return False
+
+
+def _from_clause(sql, start, end_re=_FROM_END_RE):
+    """
+    截取 FROM 子句的顶层文本, 子查询替换为 (), 其他括号内的内容(函数参数、括号内的表)替换为 (*)
+    :param sql: SQL 语句
+    :param start: FROM 之后的位置
+    :param end_re: 子句结束关键字的正则
+    :return: FROM 子句文本
+    """
+    parts = []
+    depth = 0
+    i = start
+    while i < len(sql):
+        ch = sql[i]
+        if ch in "'\"`":
+            end = _skip_quoted(sql, i)
+            if depth == 0:
+                parts.append(sql[i:end])
+            i = end
+            continue
+        if ch == "(":
+            if depth == 0:
+                parts.append("()" if _SUBQUERY_RE.match(sql, i) else "(*)")
+            depth += 1
+        elif ch == ")":
+            if depth == 0:
+                break
+            depth -= 1
+        elif depth == 0:
+            if ch == ";":
+                break
+            if not (sql[i - 1].isalnum() or sql[i - 1] in "_$") and end_re.match(sql, i):
+                break
+            parts.append(ch)
+        i += 1
+    return "".join(parts)
+
+
+def read_tables(sql):
+    """
+    解析查询语句涉及的表, 包括 FROM 后逗号分隔的多个表和 JOIN 的表, 子查询中的表由其自身的 FROM 解析
+    :param sql: SQL 语句
+    :return: 表名集合; FROM / JOIN 后无法识别表名时返回 None, 表示无法确定涉及的表
+    """
+    tables = set()
+    for keyword in _FROM_RE.finditer(sql):
+        for ref in _from_clause(sql, keyword.end()).split(","):
+            ref = ref.strip()
+            if ref.startswith("()"):
+                continue
+            match = _TABLE_NAME_RE.match(ref)
+            if match is None:
+                return None
+            tables.add(_normalize_table(match.group(0)))
+    for keyword in _JOIN_RE.finditer(sql):
+        if _SUBQUERY_RE.match(sql, keyword.end()):
+            continue
+        match = _TABLE_NAME_RE.match(sql, keyword.end())
+        if match is None:
+            return None
+        tables.add(_normalize_table(match.group(0)))
+    return tables
+
+
+def write_tables(sql):
+    """
+    解析写语句涉及的表, 支持 LOW_PRIORITY 等修饰符和 UPDATE / DELETE 的多表列表
+    :param sql: SQL 语句
+    :return: 表名列表; 只读语句返回 None; 多条语句或无法可靠解析时返回空列表, 表示可能涉及所有表
+    """
+    if _is_multi_statement(sql):
+        return []
+    match = _WRITE_TABLES_RE.match(sql)
+    if match:
+        if match.group("multi"):
+            refs = _from_clause(sql, match.end(), _WRITE_TARGETS_END_RE).split(",")
+        else:
+            refs = [sql[match.end():]]
+        targets = set()
+        for ref in refs:
+            name = _TABLE_NAME_RE.match(ref.strip())
+            if name is None or name.group(0).strip("`").upper() in _WRITE_KEYWORDS:
+                return []
+            targets.add(_normalize_table(name.group(0)))
+        tables = read_tables(sql)
+        if tables is None:
+            return []
+        return sorted(targets | tables)
+    if _READ_ONLY_RE.match(sql):
+        return None
+    return []
+
+
+def _pack_value(value):
+    """
+    将查询结果转换为可 JSON 序列化的结构, 元组、日期时间、Decimal、bytes 等类型带类型标记, 读取时可完整还原
+    :param value: 查询结果
+    :return: 可 JSON 序列化的对象
+    :raises TypeError: 包含不支持的类型时抛出异常
+    """
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, list):
+        return [_pack_value(v) for v in value]
+    if isinstance(value, tuple):
+        return {"$t": "tuple", "v": [_pack_value(v) for v in value]}
+    if isinstance(value, dict):
+        if "$t" not in value and all(isinstance(k, str) for k in value):
+            return {k: _pack_value(v) for k, v in value.items()}
+        return {"$t": "dict", "v": [[_pack_value(k), _pack_value(v)] for k, v in value.items()]}
+    if isinstance(value, datetime.datetime):
+        return {"$t": "datetime", "v": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"$t": "date", "v": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {"$t": "time", "v": value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {"$t": "timedelta", "v": [value.days, value.seconds, value.microseconds]}
+    if isinstance(value, decimal.Decimal):
+        return {"$t": "decimal", "v": str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return {"$t": "bytes", "v": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, set):
+        return {"$t": "set", "v": [_pack_value(v) for v in value]}
+    raise TypeError(f"不支持缓存的数据类型: {type(value).__name__}")
+
+
+def _unpack_value(value):
+    """
+    还原 _pack_value 转换的结构
+    :param value: JSON 反序列化后的对象
+    :return: 查询结果
+    """
+    if isinstance(value, list):
+        return [_unpack_value(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    tag = value.get("$t")
+    if tag is None:
+        return {k: _unpack_value(v) for k, v in value.items()}
+    data = value["v"]
+    if tag == "tuple":
+        return tuple(_unpack_value(v) for v in data)
+    if tag == "dict":
+        return {_unpack_value(k): _unpack_value(v) for k, v in data}
+    if tag == "datetime":
+        return datetime.datetime.fromisoformat(data)
+    if tag == "date":
+        return datetime.date.fromisoformat(data)
+    if tag == "time":
+        return datetime.time.fromisoformat(data)
+    if tag == "timedelta":
+        return datetime.timedelta(days=data[0], seconds=data[1], microseconds=data[2])
+    if tag == "decimal":
+        return decimal.Decimal(data)
+    if tag == "bytes":
+        return base64.b64decode(data)
+    if tag == "set":
+        return {_unpack_value(v) for v in data}
+    raise ValueError(f"未知的缓存数据类型: {tag}")
+
+
+class ResultCache:
+    """
+    查询结果缓存: 进程内 LRU, 可选 Redis 作为多进程共享的二级缓存
+    每个表维护一个版本号, 缓存键包含查询涉及的各表版本号, 写操作只需递增表版本号即可使旧缓存全部失效
+    Redis 中的结果以带类型标记的 JSON 存储, 不使用 pickle, 避免反序列化 Redis 中的数据时执行任意代码
+    """
+
+    def __init__(self, max_size=1024, ttl=60, redis_client=None, prefix="smart_sql_cache"):
+        """
+        :param max_size: 进程内 LRU 缓存的最大条数
+        :param ttl: 默认缓存秒数
+        :param redis_client: 共享缓存的 Redis 客户端, 为空时只使用进程内缓存
+        :param prefix: Redis 键前缀
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis = redis_client
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self._local = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def _get_versions(self, tables):
+        """
+        获取各表及全局的版本号
+        :param tables: 表名列表
+        :return: 版本号列表, 最后一项为全局版本号
+        """
+        names = list(tables) + ["*"]
+        if self.redis is not None:
+            try:
+                return [int(v or 0) for v in self.redis.mget([f"{self.prefix}:version:{t}" for t in names])]
+            except redis.RedisError as e:
+                logger.error(f"操作 Redis 时发生异常: {e}")
+                return None
+        with self._lock:
+            return [self._versions.get(t, 0) for t in names]
+
+    def lookup(self, sql, params=None, extra=None):
+        """
+        查询缓存
+        :param sql: SQL 语句
+        :param params: SQL 参数
+        :param extra: 影响结果格式的其他参数
+        :return: (缓存键, 是否命中, 缓存值), 缓存键为 None 时不应写入缓存
+        """
+        tables = read_tables(sql)
+        if tables is None:
+            # 无法确定涉及的表时不缓存, 避免写操作后读到旧数据
+            return None, False, None
+        tables = sorted(tables)
+        versions = self._get_versions(tables)
+        if versions is None:
+            return None, False, None
+        text = " ".join(sql.split())
+        digest = hashlib.sha1(repr((text, params, extra, tables, versions)).encode("utf-8")).hexdigest()
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._local.get(digest)
+            if entry is not None and entry[0] > now:
+                self._local.move_to_end(digest)
+                self.hits += 1
+                return digest, True, self._copy(entry[1])
+
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.get(f"{self.prefix}:{digest}")
+                pipe.ttl(f"{self.prefix}:{digest}")
+                data, ttl = pipe.execute()
+            except redis.RedisError as e:
+                logger.error(f"操作 Redis 时发生异常: {e}")
+                data = None
+            if data is not None:
+                try:
+                    value = _unpack_value(json.loads(data))
+                except (ValueError, TypeError, KeyError, IndexError) as e:
+                    logger.error(f"解析 Redis 缓存数据时发生异常: {e}")
+                    data = None
+            if data is not None:
+                self._store_local(digest, value, ttl if ttl and ttl > 0 else self.ttl)
+                with self._lock:
+                    self.hits += 1
+                return digest, True, self._copy(value)
+
+        with self._lock:
+            self.misses += 1
+        return digest, False, None
+
+    def store(self, key, value, ttl=None):
+        """
+        写入缓存
+        :param key: lookup 返回的缓存键
+        :param value: 查询结果
+        :param ttl: 缓存秒数, None 为默认值
+        """
+        if key is None:
+            return
+        ttl = ttl or self.ttl
+        self._store_local(key, value, ttl)
+        if self.redis is not None:
+            try:
+                data = json.dumps(_pack_value(value), ensure_ascii=False, separators=(",", ":"))
+            except TypeError as e:
+                logger.error(f"查询结果无法写入 Redis 缓存: {e}")
+                return
+            try:
+                self.redis.set(f"{self.prefix}:{key}", data, ex=max(1, int(ttl)))
+            except redis.RedisError as e:
+                logger.error(f"操作 Redis 时发生异常: {e}")
+
+    def _store_local(self, key, value, ttl):
+        """写入进程内 LRU 缓存"""
+        with self._lock:
+            self._local[key] = (time.monotonic() + ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    @staticmethod
+    def _copy(value):
+        """返回列表的浅拷贝, 避免调用方修改缓存中的结果"""
+        return list(value) if isinstance(value, list) else value
+
+    def invalidate(self, tables=None):
+        """
+        使表的缓存失效
+        :param tables: 表名列表, 为空时使全部缓存失效
+        """
+        names = [_normalize_table(t) for t in tables] if tables else ["*"]
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for name in names:
+                    pipe.incr(f"{self.prefix}:version:{name}")
+                pipe.execute()
+            except redis.RedisError as e:
+                logger.error(f"操作 Redis 时发生异常: {e}")
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+            if not tables:
+                self._local.clear()
+
+    def info(self):
+        """
+        获取缓存统计信息
+        :return: {"hits": 命中次数, "misses": 未命中次数, "size": 进程内缓存条数, "max_size": 最大条数}
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._local), "max_size": self.max_size}
+
+
+class Session:
+    """
+    固定连接的会话, 由 SmartSQL.session() / SmartSQL.transaction() 创建
+    """
+
+    def __init__(self, db, conn):
+        """
+        :param db: SmartSQL 实例
+        :param conn: 固定的数据库连接
+        """
+        self.db = db
+        self.conn = conn
+        self.atomic = False
+        self.proxy = _SessionConnection(conn)
+        self._tables = set()
+        self._invalidate_all = False
+        self._savepoints = 0
+
+    @contextmanager
+    def begin(self):
+        """
+        开始事务, 正常退出时提交, 发生异常时回滚并继续抛出异常
+        """
+        self.atomic = True
+        self.conn.begin()
+        try:
+            yield self
+        except BaseException:
+            self.conn.rollback()
+            raise
+        else:
+            self.conn.commit()
+        finally:
+            self.atomic = False
+            self._flush_invalidation()
+
+    @contextmanager
+    def savepoint(self, name=None):
+        """
+        保存点, 正常退出时释放, 发生异常时回滚到保存点并继续抛出异常, 只能在事务中使用
+        :param name: 保存点名称, 默认自动生成
+        :return: 保存点名称
+        """
+        if not self.atomic:
+            raise RuntimeError("保存点只能在事务中使用")
+        self._savepoints += 1
+        name = name or f"sp_{self._savepoints}"
+        self._run(f"SAVEPOINT {name}")
+        try:
+            yield name
+        except BaseException:
+            self._run(f"ROLLBACK TO SAVEPOINT {name}")
+            raise
+        else:
+            self._run(f"RELEASE SAVEPOINT {name}")
+
+    def _run(self, sql):
+        """在固定连接上执行一条语句"""
+        cursor = self.conn.cursor()
+        try:
+            self.db._execute(cursor, sql)
+        finally:
+            cursor.close()
+
+    def touch(self, tables):
+        """
+        记录事务中写过的表, 事务结束时使其查询缓存再次失效
+        :param tables: 表名列表, 为空时表示可能涉及所有表
+        """
+        if tables:
+            self._tables.update(tables)
+        else:
+            self._invalidate_all = True
+
+    def _flush_invalidation(self):
+        """事务结束时使写过的表的查询缓存失效"""
+        if self.db.result_cache is not None and (self._tables or self._invalidate_all):
+            self.db.result_cache.invalidate(None if self._invalidate_all else sorted(self._tables))
+        self._tables.clear()
+        self._invalidate_all = False
+
+
+class _SessionConnection:
+    """
+    会话中交给各方法使用的连接代理: 单条操作后的 commit / rollback 由会话统一处理, 这里不执行
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class PoolStats:
+    """
+    连接池指标: 取出连接的等待耗时、活跃连接数、新建连接数(连接更替)、ping 检查与查询耗时, 线程安全
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        :param buckets: 耗时直方图的桶上限(秒)
+        """
+        self.buckets = buckets
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.created = 0
+        self.checkouts = 0
+        self.pings = 0
+        self.ping_failures = 0
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def _observe(self, name, value):
+        """记录一次直方图观测值, 各桶为累计计数, 最后三项为总和、次数与最大值"""
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = [0] * len(self.buckets) + [0, 0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                histogram[i] += 1
+        histogram[-3] += value
+        histogram[-2] += 1
+        histogram[-1] = max(histogram[-1], value)
+
+    def observe_checkout(self, seconds):
+        """记录一次取出连接及其等待耗时"""
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self._observe("checkout_wait", seconds)
+
+    def release(self):
+        """记录一次归还连接"""
+        with self._lock:
+            self.in_use -= 1
+
+    def record_connect(self):
+        """记录一次新建连接"""
+        with self._lock:
+            self.created += 1
+
+    def record_ping(self, ok):
+        """记录一次 ping 检查"""
+        with self._lock:
+            self.pings += 1
+            if not ok:
+                self.ping_failures += 1
+
+    def observe_query(self, seconds):
+        """记录一次查询耗时"""
+        with self._lock:
+            self._observe("query_latency", seconds)
+
+    def snapshot(self):
+        """
+        获取指标快照
+        :return: 指标字典
+        """
+        with self._lock:
+            snapshot = {
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "created": self.created,
+                "checkouts": self.checkouts,
+                "pings": self.pings,
+                "ping_failures": self.ping_failures,
+            }
+            for name in ("checkout_wait", "query_latency"):
+                value = self._histograms.get(name) or [0] * len(self.buckets) + [0, 0, 0]
+                snapshot[name] = {
+                    "buckets": dict(zip(self.buckets, value[:-3])),
+                    "sum": value[-3],
+                    "count": value[-2],
+                    "max": value[-1],
+                }
+        return snapshot
+
+
+class WriteBehindWriter:
+    """
+    异步批量写入器: 数据先放入有界缓冲队列, 由后台线程按表分批调用 add_many_smart 写入,
+    抓取线程不再等待数据库往返和提交; 缓冲区满时 add 阻塞(背压), 进程退出时自动写完缓冲区
+    """
+
+    def __init__(self, db, batch_size=500, flush_interval=1.0, max_buffer=10000, mode=None,
+                 update_columns=None, on_error=None, dead_letter=None):
+        """
+        :param db: SmartSQL 实例
+        :param batch_size: 单表缓冲的行数达到该值时立即写入
+        :param flush_interval: 最早缓冲的数据等待超过该秒数时写入全部缓冲
+        :param max_buffer: 缓冲队列的最大行数, 队列满时 add 阻塞
+        :param mode: 冲突处理方式, None / 'ignore' / 'update', 同 add_many_smart
+        :param update_columns: mode='update' 时冲突后更新的列
+        :param on_error: 写入失败时的回调函数, 参数为 (表名, 数据列表, 异常)
+        :param dead_letter: 写入失败的数据追加到该文件, 每行一个 JSON {"table", "row", "error"}
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.mode = mode
+        self.update_columns = update_columns
+        self.on_error = on_error
+        self.dead_letter = dead_letter
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_buffer)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="smart-sql-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, table, data, block=True, timeout=None):
+        """
+        将一行数据放入缓冲区
+        :param table: 表名
+        :param data: 要插入的数据，格式为字典 {"column": "value"}
+        :param block: 缓冲区满时是否阻塞等待
+        :param timeout: 阻塞等待的最长秒数, None 为一直等待
+        :return: 放入成功返回 True, 缓冲区满且等待超时返回 False
+        :raises ValueError: 当数据为空时抛出异常
+        :raises RuntimeError: 当写入器已关闭时抛出异常
+        """
+        if not data:
+            raise ValueError("插入数据不能为空")
+        if self._closed:
+            raise RuntimeError("写入器已关闭")
+        try:
+            self._queue.put((table, data), block=block, timeout=timeout)
+            return True
+        except queue.Full:
+            logger.warning(f"写入缓冲区已满, 丢弃数据: {table}")
+            return False
+
+    def pending(self):
+        """
+        获取缓冲队列中尚未被后台线程取出的行数
+        :return: 行数
+        """
+        return self._queue.qsize()
+
+    def flush(self, timeout=None):
+        """
+        立即写入当前缓冲的全部数据并等待完成
+        :param timeout: 最长等待秒数, None 为一直等待
+        :return: 在超时前写完返回 True
+        """
+        if not self._thread.is_alive():
+            return self._queue.empty()
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=None):
+        """
+        写完缓冲的数据并停止后台线程, 重复调用无副作用
+        :param timeout: 最长等待秒数, None 为一直等待
+        """
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+        logger.info(f"写入器已关闭, 写入 {self.written} 行, 失败 {self.failed} 行")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _run(self):
+        """
+        后台写入线程: 按 (表名, 列) 分组缓冲, 达到 batch_size 或超过 flush_interval 时写入
+        """
+        batches = {}
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._flush_all(batches)
+                deadline = None
+                continue
+
+            if item is None or isinstance(item, threading.Event):
+                self._flush_all(batches)
+                deadline = None
+                if item is None:
+                    break
+                item.set()
+                continue
+
+            table, data = item
+            key = (table, tuple(data.keys()))
+            rows = batches.setdefault(key, [])
+            rows.append(data)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if len(rows) >= self.batch_size:
+                self._write(table, batches.pop(key))
+
+    def _flush_all(self, batches):
+        """写入全部缓冲"""
+        for (table, _), rows in list(batches.items()):
+            self._write(table, rows)
+        batches.clear()
+
+    def _write(self, table, rows):
+        """
+        写入一批数据, 失败的数据交给错误回调和死信文件
+        :param table: 表名
+        :param rows: 数据列表
+        """
+        failed = []
+
+        def on_error(chunk, error):
+            failed.extend(chunk)
+            self._handle_error(table, chunk, error)
+
+        try:
+            self.db.add_many_smart(table, rows, mode=self.mode, update_columns=self.update_columns,
+                                   chunk_size=self.batch_size, on_error=on_error)
+        except Exception as e:
+            logger.error(f"批量写入出错: {e}, 表: {table}, 行数: {len(rows)}")
+            failed = rows
+            self._handle_error(table, rows, e)
+        self.written += len(rows) - len(failed)
+        self.failed += len(failed)
+
+    def _handle_error(self, table, rows, error):
+        """
+        处理写入失败的数据
+        :param table: 表名
+        :param rows: 数据列表
+        :param error: 异常
+        """
+        if self.on_error:
+            try:
+                self.on_error(table, rows, error)
+            except Exception as e:
+                logger.error(f"写入失败回调出错: {e}")
+        if self.dead_letter:
+            try:
+                with open(self.dead_letter, "a", encoding="utf-8") as f:
+                    for row in rows:
+                        f.write(json.dumps({"table": table, "row": row, "error": str(error)},
+                                           ensure_ascii=False, default=str) + "\n")
+            except Exception as e:
+                logger.error(f"写入死信文件出错: {e}, 文件: {self.dead_letter}")
+
+
 def test_smart_sql():
     # 创建数据库连接
     db = SmartSQL()
@@ -18,6 +18,15 @@ MYSQL_DB = config.get('mysql', 'db', fallback='test_db')
 MYSQL_USER_NAME = config.get('mysql', 'user_name', fallback='root')
 MYSQL_USER_PASS = config.get('mysql', 'user_pass', fallback='password')
 
+# 加载连接池配置
+MYSQL_MINCACHED = config.getint('pool', 'mincached', fallback=1)
+MYSQL_MAXCACHED = config.getint('pool', 'maxcached', fallback=100)
+MYSQL_MAXCONNECTIONS = config.getint('pool', 'maxconnections', fallback=100)
+MYSQL_BLOCKING = config.getboolean('pool', 'blocking', fallback=True)
+MYSQL_MAXUSAGE = config.getint('pool', 'maxusage', fallback=0)
+MYSQL_PING = config.getint('pool', 'ping', fallback=0)
+MYSQL_PING_INTERVAL = config.getint('pool', 'ping_interval', fallback=30)
+
 # 加载日志配置
 LOG_LEVEL = config.get('logging', 'level', fallback='DEBUG')
 
@@ -0,0 +1,645 @@
+'''
+@Project ：TaskQueue.py
+@File    ：AsyncTaskQueue.py
+@Author  ：agent
+@Date    ：2026/10/18 20:43
+'''
+
+import time
+import asyncio
+import itertools
+import threading
+import redis
+from redis import asyncio as aioredis
+from loguru import logger
+from TaskQueue import BaseTaskQueue, to_str
+from Metrics import start_metrics_server
+
+# 进程级异步连接池注册表, 连接池中的连接绑定创建时的事件循环, 同一进程内应只使用一个事件循环
+_ASYNC_CONNECTION_POOLS = {}
+_ASYNC_CONNECTION_POOLS_LOCK = threading.Lock()
+_ASYNC_REGISTERED_TOPICS = set()
+
+
+def get_async_connection_pool(host: str, port: int, db: int, decode_responses: bool = True, max_connections: int = 50):
+    """
+    获取进程内共享的异步 Redis 连接池; 连接在第一次执行命令时才建立
+    :param host: Redis 主机
+    :param port: Redis 端口
+    :param db: Redis 数据库编号
+    :param decode_responses: 是否将返回值解码为字符串
+    :param max_connections: 连接池最大连接数, 连接用尽时等待空闲连接
+    :return: redis.asyncio.BlockingConnectionPool
+    """
+    key = (host, port, db, decode_responses)
+    with _ASYNC_CONNECTION_POOLS_LOCK:
+        pool = _ASYNC_CONNECTION_POOLS.get(key)
+        if pool is None:
+            pool = aioredis.BlockingConnectionPool(
+                host=host,
+                port=port,
+                db=db,
+                encoding="utf-8",
+                decode_responses=decode_responses,
+                max_connections=max_connections
+            )
+            _ASYNC_CONNECTION_POOLS[key] = pool
+        return pool
+
+
+class AsyncTaskQueue(BaseTaskQueue):
+    """
+    基于 redis.asyncio 的异步任务队列, 方法与 TaskQueue 一致, 键名、Lua 脚本与任务格式完全兼容,
+    同步与异步 worker 可以同时读写同一个队列
+    """
+
+    def _create_client(self, config: dict):
+        """初始化异步 Redis 连接, 使用进程内共享连接池"""
+        return aioredis.Redis(connection_pool=get_async_connection_pool(
+            config['REDIS_HOST'],
+            config['REDIS_PORT'],
+            config['REDIS_DB'],
+            decode_responses=not self.codec.binary,  # 二进制编码需要原样返回 bytes
+            max_connections=config.get('MAX_CONNECTIONS', 50)
+        ))
+
+    async def add_task(self, task: dict = None, level: str = None, is_distinct: bool = True,
+                       delay: float = None, eta=None):
+        """
+        增加单条任务
+        :param task: 任务字典
+        :param level: 队列类型, 默认 normal
+        :param is_distinct: 是否去重插入
+        :param delay: 延迟入队秒数, 到期后由 promote_delayed 移入队列
+        :param eta: 到期时间, datetime 或时间戳, 优先级高于 delay
+        """
+        if task is None:
+            logger.error("未指定任务字典!!!")
+            return
+
+        level = level or self.level
+        due = self._due(delay, eta)
+
+        try:
+            added = await self._push_tasks(self._push_key(level, due), [task], is_distinct, due)
+            if added:
+                logger.success(f"{'不去重·' if not is_distinct else ''}添加任务成功: {task}")
+            else:
+                logger.warning(f"任务已存在: {task}")
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+
+    async def add_tasks(self, tasks=None, level: str = None, is_distinct: bool = True, chunk_size: int = 1000,
+                        delay: float = None, eta=None):
+        """
+        批量增加任务, 每批任务的去重、入队与 TTL 维护在一次往返内完成
+        :param tasks: 任务字典列表, 也可以是生成器或异步生成器
+        :param level: 队列类型, 默认 normal
+        :param is_distinct: 是否去重插入
+        :param chunk_size: 每批提交的任务数量
+        :param delay: 延迟入队秒数
+        :param eta: 到期时间, datetime 或时间戳
+        :return: 实际入队的任务数量
+        """
+        if not tasks or isinstance(tasks, (dict, str)):
+            logger.error("任务列表无效或未指定任务列表!!!")
+            return 0
+
+        level = level or self.level
+        due = self._due(delay, eta)
+        task_title = self._push_key(level, due)
+
+        total = added = 0
+        try:
+            async for chunk in self._iter_chunks(tasks, chunk_size):
+                for task in chunk:
+                    if not task.get('retry'):
+                        task['retry'] = 0
+                added += await self._push_tasks(task_title, chunk, is_distinct, due)
+                total += len(chunk)
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+
+        logger.success(f"{'不去重·' if not is_distinct else ''}批量添加任务: 共 {total} 条, "
+                       f"入队 {added} 条, 重复 {total - added} 条")
+        return added
+
+    @staticmethod
+    async def _iter_chunks(tasks, chunk_size: int):
+        """按 chunk_size 切分同步或异步可迭代对象"""
+        if hasattr(tasks, '__aiter__'):
+            chunk = []
+            async for task in tasks:
+                chunk.append(task)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+            return
+
+        iterator = iter(tasks)
+        while True:
+            chunk = list(itertools.islice(iterator, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    async def _push_tasks(self, task_title: str, tasks: list, is_distinct: bool = True, due: float = None):
+        """
+        通过 Lua 脚本登记去重索引并入队
+        :return: 实际入队的任务数量
+        """
+        await self._register_topic()
+        pushed = await self._add_tasks(keys=[task_title, self.dedup_key], args=self._push_args(tasks, is_distinct, due))
+        self._record_push(task_title, len(tasks), pushed, is_distinct)
+        return pushed
+
+    async def _register_topic(self):
+        """第一次写入任务时把队列名称添加到 Redis 集合, 每个进程在每个 Redis 库上每个队列只登记一次"""
+        if not self.topic_name:
+            return
+        key = self._topic_key()
+        if key in _ASYNC_REGISTERED_TOPICS:
+            return
+        if await self.conn.sadd("spider_topic_list", self.topic_name):
+            logger.info(f"新增队列名: {self.topic_name}")
+        _ASYNC_REGISTERED_TOPICS.add(key)
+
+    async def get_task(self, level: str = None, fifo: bool = True):
+        """
+        获取单条任务
+        :param level: 队列紧急程度
+        :param fifo: 是否按先入先出（FIFO）模式获取任务
+        :return: 任务字典或 None
+        """
+        level = level or self.level
+        task_title = f"spider_task:{self.key_name}:{level}"
+
+        started = time.perf_counter()
+        try:
+            if self.throttle:
+                tasks = await self._throttle_tasks([level], 1, fifo)
+                task = tasks[0] if tasks else None
+            elif self.reliable:
+                tasks = await self._lease_tasks(level, 1, fifo)
+                task = tasks[0] if tasks else None
+            else:
+                task_data = await (self.conn.lpop(task_title) if fifo else self.conn.rpop(task_title))
+                task = self.codec.loads(task_data) if task_data else None
+                self._record_dequeue({level: 1 if task else 0}, started)
+
+            if task:
+                logger.info(f"获取任务成功: {task}")
+                return task
+            else:
+                logger.info("没有更多任务可获取。")
+                return None
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return None
+
+    async def get_tasks(self, level: str = None, num: int = 0, fifo: bool = True):
+        """
+        批量获取任务, 一次往返完成
+        :param level: 队列紧急程度
+        :param num: 获取任务数量, 默认全部获取
+        :param fifo: 是否按先入先出（FIFO）模式获取任务
+        :return: 任务字典列表
+        """
+        level = level or self.level
+        task_title = f"spider_task:{self.key_name}:{level}"
+
+        started = time.perf_counter()
+        try:
+            if self.throttle:
+                tasks = await self._throttle_tasks([level], num, fifo)
+            elif self.reliable:
+                tasks = await self._lease_tasks(level, num, fifo)
+            else:
+                tasks_data = await self._batch_pop(keys=[task_title], args=[num, 1 if fifo else 0])
+                tasks = [self.codec.loads(task_data) for task_data in tasks_data]
+                self._record_dequeue({level: len(tasks)}, started)
+
+            if tasks:
+                logger.info(f"获取 {len(tasks)} 个任务成功。")
+            else:
+                logger.info("没有更多任务可获取。")
+
+            return tasks
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return []
+
+    async def get_tasks_by_priority(self, levels: list = None, num: int = 1, strategy: str = 'strict',
+                                    weights: dict = None, batch_sizes: dict = None, fifo: bool = True):
+        """
+        按优先级跨多个级别批量获取任务, 一次往返完成, 参数同 TaskQueue.get_tasks_by_priority
+        :return: 任务字典列表
+        """
+        levels = levels or ['urgent', 'normal']
+        if num <= 0:
+            logger.error("获取任务数量必须大于 0!!!")
+            return []
+
+        try:
+            if self.throttle:
+                return await self._throttle_tasks(levels, num, fifo, strategy, weights, batch_sizes)
+
+            started = time.perf_counter()
+            keys, args = self._priority_args(levels, num, strategy, weights, batch_sizes, fifo)
+            tasks, counts = self._parse_priority(await self._priority_pop(keys=keys, args=args))
+            self._record_dequeue(counts, started)
+
+            if tasks:
+                logger.info(f"获取 {len(tasks)} 个任务成功: {counts}")
+            else:
+                logger.info("没有更多任务可获取。")
+            return tasks
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return []
+
+    async def get_task_blocking(self, levels: list = None, timeout: int = 5, fifo: bool = True,
+                                poll_interval: float = 0.2):
+        """
+        阻塞获取单条任务, 按 levels 顺序优先获取, 等待期间不占用事件循环
+        可靠模式下改为按 poll_interval 轮询带租约的出队脚本, 见 TaskQueue.get_task_blocking
+        :param levels: 按优先级排列的队列级别, 默认 ['urgent', 'normal']
+        :param timeout: 最长阻塞时间(秒), 0 表示一直阻塞
+        :param fifo: 是否按先入先出（FIFO）模式获取任务
+        :param poll_interval: 可靠模式下的轮询间隔(秒), 限流模式使用 Throttle.poll_interval
+        :return: 任务字典或 None
+        """
+        levels = levels or ['urgent', 'normal']
+        task_titles = [f"spider_task:{self.key_name}:{level}" for level in levels]
+
+        try:
+            if self.throttle:
+                # 限流模式下改为短间隔轮询, 等待期间顺带提升到期的延迟任务
+                end = time.time() + timeout if timeout else None
+                while True:
+                    tasks = await self._throttle_tasks(levels, 1, fifo)
+                    if tasks:
+                        logger.info(f"获取任务成功: {tasks[0]}")
+                        return tasks[0]
+                    if end is not None and time.time() >= end:
+                        return None
+                    await asyncio.sleep(self.throttle.poll_interval)
+                    await self.promote_delayed()
+
+            if self.reliable:
+                # 出队与登记租约必须在同一脚本内完成, 因此轮询而不使用 BLPOP
+                end = time.time() + timeout if timeout else None
+                while True:
+                    tasks = await self.get_tasks_by_priority(levels=levels, num=1, fifo=fifo)
+                    if tasks:
+                        return tasks[0]
+                    if end is not None and time.time() >= end:
+                        return None
+                    await asyncio.sleep(poll_interval)
+
+            result = await (self.conn.blpop(task_titles, timeout) if fifo else self.conn.brpop(task_titles, timeout))
+            if not result:
+                return None
+
+            task_title, task_data = result
+            task = self.codec.loads(task_data)
+            self._record_dequeue({to_str(task_title).rsplit(':', 1)[-1]: 1})
+            logger.info(f"获取任务成功: {task}")
+            return task
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return None
+
+    async def _lease_tasks(self, level: str, num: int, fifo: bool):
+        """可靠模式出队: 出队与登记租约在同一脚本内完成"""
+        started = time.perf_counter()
+        keys, args = self._lease_args(level, num, fifo)
+        tasks = self._parse_leases(await self._reliable_pop(keys=keys, args=args))
+        self._record_dequeue({level: len(tasks)}, started)
+        return tasks
+
+    async def _throttle_tasks(self, levels: list, num: int, fifo: bool, strategy: str = 'strict',
+                              weights: dict = None, batch_sizes: dict = None):
+        """限流模式出队: 出队与限流检查在同一脚本内完成, 被限流的任务推迟到延迟队列"""
+        started = time.perf_counter()
+        keys, args = self._throttle_args(levels, num, strategy, weights, batch_sizes, fifo)
+        tasks, counts, deferred = self._parse_throttle(await self._throttle_pop(keys=keys, args=args))
+        self._record_dequeue(counts, started, deferred)
+        if deferred:
+            logger.info(f"{deferred} 个任务被限流, 已推迟出队")
+        if tasks:
+            logger.info(f"获取 {len(tasks)} 个任务成功: {counts}")
+        return tasks
+
+    async def ack_task(self, task: dict = None):
+        """
+        确认任务处理完成, 可靠模式下释放租约, 限流模式下归还并发令牌
+        :param task: get_task/get_tasks 返回的任务字典
+        :return: 租约仍有效并成功释放返回 True, 租约已过期(任务已被回收)返回 False
+        """
+        token = task.pop('_throttle', None) if task else None
+        lease = task.pop('_lease', None) if task else None
+
+        try:
+            if token is not None:
+                await self._release_throttle(keys=[self.inflight_key, self.inflight_token_key], args=[token])
+            if lease is None:
+                if token is None:
+                    logger.error("任务不包含租约信息, 无法确认!!!")
+                    return False
+                self.metrics.inc('spider_task_acked_total', queue=self.task_name)
+                return True
+
+            async with self.conn.pipeline() as pipe:
+                pipe.zrem(self.processing_key, lease)
+                pipe.hdel(self.lease_key, lease)
+                removed, _ = await pipe.execute()
+            if removed:
+                self.metrics.inc('spider_task_acked_total', queue=self.task_name)
+                logger.info(f"确认任务成功: {task}")
+                return True
+            logger.warning(f"任务租约已过期, 任务可能已被重新投递: {task}")
+            return False
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return False
+
+    async def nack_task(self, task: dict = None, requeue: bool = True):
+        """
+        可靠模式下拒绝任务, 释放租约
+        :param task: get_task/get_tasks 返回的任务字典
+        :param requeue: 是否按 retry_task 的规则重新入队, 否则直接插入失败队列
+        """
+        if task is None:
+            logger.error("未指定任务字典!!!")
+            return
+
+        await self.ack_task(task)
+        if requeue:
+            await self.retry_task(task)
+        else:
+            try:
+                await self.conn.lpush(f"spider_task:{self.key_name}:fail", self.codec.dumps(task))
+                self.metrics.inc('spider_task_failed_total', queue=self.task_name)
+                logger.warning(f"任务已拒绝, 已插入失败队列: {task}")
+            except redis.RedisError as e:
+                logger.error(f"操作 Redis 时发生异常: {e}")
+
+    async def touch_task(self, task: dict = None, visibility_timeout: int = None):
+        """
+        为处理中的任务续租, 限流模式下同时续期并发令牌
+        :param task: get_task/get_tasks 返回的任务字典
+        :param visibility_timeout: 续租时长(秒), 默认为实例的租约时长
+        :return: 续租成功返回 True
+        """
+        lease = task.get('_lease') if task else None
+        token = task.get('_throttle') if task else None
+        if lease is None and token is None:
+            logger.error("任务不包含租约信息, 无法续租!!!")
+            return False
+
+        deadline = time.time() + (visibility_timeout or self.visibility_timeout)
+        try:
+            if token is not None:
+                touched = bool(await self.conn.zadd(self.inflight_token_key, {token: deadline}, xx=True, ch=True))
+                if lease is None:
+                    return touched
+            return bool(await self.conn.zadd(self.processing_key, {lease: deadline}, xx=True, ch=True))
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return False
+
+    async def requeue_expired(self, limit: int = 1000):
+        """
+        回收租约已过期的任务, 放回原队列头部重新投递
+        :param limit: 单次回收的最大任务数
+        :return: 回收的任务数量
+        """
+        try:
+            keys, args = self._requeue_args(limit)
+            count = await self._requeue_expired(keys=keys, args=args)
+            if count:
+                logger.warning(f"回收 {count} 个租约过期的任务")
+            return count
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return 0
+
+    async def promote_delayed(self, limit: int = 1000):
+        """
+        把到期的延迟任务批量移入对应队列头部
+        :param limit: 每个级别单次提升的最大任务数
+        :return: 提升的任务数量
+        """
+        try:
+            keys, args = self._promote_args(limit)
+            count = await self._promote_delayed(keys=keys, args=args)
+            if count:
+                logger.info(f"提升 {count} 个到期的延迟任务")
+            return count
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return 0
+
+    async def _maintain(self):
+        """消费循环内的定时维护: 提升到期的延迟任务, 可靠模式下回收过期租约"""
+        now = time.time()
+        if now >= self._next_promote:
+            await self.promote_delayed()
+            if self._export_gauges:
+                await self.collect_metrics()
+            self._next_promote = now + self.promote_interval
+        if self.reliable and now >= self._next_reap:
+            await self.requeue_expired()
+            self._next_reap = now + self.reaper_interval
+
+    async def retry_task(self, task: dict = None, is_distinct: bool = True):
+        """
+        单个任务重试, 重试次数达到最大重试次数, 插入失败队列
+        :param task: 失败任务
+        :param is_distinct: 是否去重插入
+        """
+        if task is None:
+            logger.error("未指定任务字典!!!")
+            return
+
+        if '_lease' in task or '_throttle' in task:
+            await self.ack_task(task)
+
+        fail_task_title = f"spider_task:{self.key_name}:fail"
+
+        task_data = self.codec.dumps(task)
+
+        try:
+            retry_count = task.get('retry', 0)
+            if retry_count < self.max_retries:
+                task['retry'] = retry_count + 1
+                updated_task_data = self.codec.dumps(task)
+                # 开启退避时按指数退避延迟重试, 避免被限流或封禁的任务立即再次失败
+                due = self._retry_due(retry_count)
+                task_title = self._push_key(self.level, due)
+
+                # 指纹/布隆去重忽略 retry 字段, 重试任务本身已登记过, 不再参与去重
+                if is_distinct and self.dedup.track_retry:
+                    if await self._push_tasks(task_title, [task], due=due):
+                        self.metrics.inc('spider_task_retried_total', queue=self.task_name)
+                        logger.success(f"重试任务成功: {task}")
+                    else:
+                        logger.warning(f"重试任务已存在: {task}")
+                else:
+                    if due is None:
+                        await self.conn.lpush(task_title, updated_task_data)
+                    else:
+                        await self.conn.zadd(task_title, {updated_task_data: due})
+                    self.metrics.inc('spider_task_retried_total', queue=self.task_name)
+                    self.metrics.inc('spider_task_enqueued_total', queue=self.task_name, level=self.level)
+                    logger.success(f"{'不去重·' if not is_distinct else ''}重试任务成功: {task}")
+
+            else:
+                await self.conn.lpush(fail_task_title, task_data)
+                self.metrics.inc('spider_task_failed_total', queue=self.task_name)
+                logger.error(f"任务重试次数已达上限, 已插入失败队列: {task}")
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+
+    async def monitor_tasks(self):
+        """
+        任务预警, 一次往返获取各队列长度
+        :return: 各队列任务数量
+        """
+        async with self.conn.pipeline(transaction=False) as pipe:
+            for level in ('urgent', 'normal', 'fail'):
+                pipe.llen(f"spider_task:{self.key_name}:{level}")
+            if self.reliable:
+                pipe.zcard(self.processing_key)
+            counts = await pipe.execute()
+
+        task_counts = dict(zip(('urgent', 'normal', 'fail', 'processing'), counts))
+        logger.info(f"任务统计: {task_counts}")
+
+        if task_counts['fail'] > self.fail_alert_threshold:
+            logger.warning(f"失败队列中的任务数量超过阈值: {task_counts['fail']} > {self.fail_alert_threshold}")
+        return task_counts
+
+    async def collect_metrics(self):
+        """
+        读取各级别队列深度、延迟任务与处理中任务等瞬时指标, 一次往返完成
+        :return: [(指标名, 标签字典, 值), ...]
+        """
+        try:
+            async with self.conn.pipeline(transaction=False) as pipe:
+                self._gauge_commands(pipe)
+                self._gauges = self._parse_gauges(await pipe.execute())
+            return self._gauges
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return []
+
+    async def get_metrics(self):
+        """
+        获取当前队列的指标快照, 参见 TaskQueue.get_metrics
+        :return: 见 Metrics.snapshot
+        """
+        snapshot = self.metrics.snapshot(collect=False, queue=self.task_name)
+        for name, labels, value in await self.collect_metrics():
+            snapshot['gauges'][(name, tuple(sorted(labels.items())))] = value
+        return snapshot
+
+    def start_metrics_server(self, port: int = None, host: str = '127.0.0.1'):
+        """
+        启动 Prometheus 指标服务; HTTP 线程无法访问事件循环中的连接,
+        瞬时指标导出的是 consume 循环中按 PROMOTE_INTERVAL 定时采集的最近一次结果
+        :param port: 监听端口, 默认读取 METRICS_PORT, 未配置时为 9108
+        :param host: 监听地址, 默认只监听本机
+        """
+        self.metrics.register_collector(self.task_name, lambda: self._gauges)
+        start_metrics_server(port or self.metrics_port or 9108, host, self.metrics)
+        self._export_gauges = True
+
+    def register_handler(self, handler):
+        """
+        注册 consume 使用的异步任务处理函数, 可作为装饰器使用
+        :param handler: 接收任务字典的协程函数
+        :return: 原处理函数
+        """
+        self.handler = handler
+        return handler
+
+    async def consume(self, handler=None, levels: list = None, concurrency: int = 100, batch_size: int = 100,
+                      timeout: int = 5, fifo: bool = True):
+        """
+        异步消费循环: 同时最多运行 concurrency 个处理协程, 有空闲槽位时按优先级批量出队补充,
+        所有队列为空时阻塞等待新任务; 处理函数抛出异常时调用 retry_task, 可靠或限流模式下处理成功后自动 ack_task
+        :param handler: 异步任务处理函数, 默认使用 register_handler 注册的函数
+        :param levels: 按优先级排列的队列级别, 默认 ['urgent', 'normal']
+        :param concurrency: 最大并发处理数
+        :param batch_size: 单次批量出队的最大数量
+        :param timeout: 队列为空时单次阻塞等待时间(秒)
+        :param fifo: 是否按先入先出（FIFO）模式获取任务
+        """
+        handler = handler or self.handler
+        if handler is None:
+            logger.error("未指定任务处理函数!!!")
+            return
+
+        if self.metrics_port:
+            self.start_metrics_server()
+
+        self._consuming = True
+        running = set()
+        try:
+            while self._consuming:
+                # 定时提升到期的延迟任务、回收过期租约, 无需额外启动调度器
+                await self._maintain()
+
+                free = concurrency - len(running)
+                if free <= 0:
+                    await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+
+                tasks = await self.get_tasks_by_priority(levels=levels, num=min(free, batch_size), fifo=fifo)
+                if not tasks:
+                    task = await self.get_task_blocking(levels=levels, timeout=timeout, fifo=fifo)
+                    tasks = [task] if task else []
+
+                for task in tasks:
+                    job = asyncio.create_task(self._handle(handler, task))
+                    running.add(job)
+                    job.add_done_callback(running.discard)
+
+        finally:
+            self._consuming = False
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+            logger.info("消费已停止")
+
+    async def _handle(self, handler, task: dict):
+        """执行单个任务的处理函数, 失败重试, 成功确认"""
+        try:
+            await handler(task)
+        except Exception as e:
+            logger.error(f"处理任务时发生异常: {e}, 任务: {task}")
+            await self.retry_task(task)
+        else:
+            if self.reliable or '_throttle' in task:
+                await self.ack_task(task)
+
+    def stop(self):
+        """停止 consume 消费循环, 等待正在处理的任务完成后退出"""
+        self._consuming = False
+
+    async def close(self):
+        """释放当前客户端占用的连接"""
+        await self.conn.aclose()
@@ -0,0 +1,237 @@
+'''
+@Project ：TaskQueue.py
+@File    ：Metrics.py
+@Author  ：agent
+@Date    ：2026/10/18 20:57
+'''
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from loguru import logger
+import psutil
+
+# 指标说明与类型, 用于导出 Prometheus 文本格式
+METRIC_HELP = {
+    'spider_task_enqueued_total': ('counter', '实际入队的任务数'),
+    'spider_task_dequeued_total': ('counter', '出队的任务数'),
+    'spider_task_acked_total': ('counter', '确认的任务数, 包括重试前释放租约的任务'),
+    'spider_task_retried_total': ('counter', '重试入队的任务数'),
+    'spider_task_failed_total': ('counter', '插入失败队列的任务数'),
+    'spider_task_deferred_total': ('counter', '被限流推迟的任务数'),
+    'spider_task_dedup_checked_total': ('counter', '参与去重检查的任务数'),
+    'spider_task_dedup_hits_total': ('counter', '因重复被跳过的任务数'),
+    'spider_task_dequeue_latency_seconds': ('histogram', '非阻塞出队的耗时(秒)'),
+    'spider_task_queue_depth': ('gauge', '各级别队列中等待的任务数'),
+    'spider_task_delayed_depth': ('gauge', '各级别延迟队列中的任务数'),
+    'spider_task_processing': ('gauge', '可靠模式下处理中的任务数'),
+    'spider_task_oldest_processing_age_seconds': ('gauge', '可靠模式下最早出队且仍未确认的任务已处理时长(秒)'),
+    'spider_task_delayed_lag_seconds': ('gauge', '最早到期的延迟任务超过到期时间仍未提升的时长(秒)'),
+    'spider_system_cpu_percent': ('gauge', '系统 CPU 使用率'),
+    'spider_system_memory_percent': ('gauge', '系统内存使用率'),
+}
+
+# 出队耗时直方图的桶上限(秒)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(labels: tuple, extra: str = ''):
+    """把标签元组格式化为 Prometheus 标签字符串"""
+    parts = ['{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+             for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def system_gauges():
+    """
+    系统资源指标, cpu_percent 不阻塞, 返回自上次调用以来的平均使用率(第一次调用返回 0)
+    :return: [(指标名, 标签字典, 值), ...]
+    """
+    return [
+        ('spider_system_cpu_percent', {}, psutil.cpu_percent(interval=None)),
+        ('spider_system_memory_percent', {}, psutil.virtual_memory().percent),
+    ]
+
+
+class Metrics:
+    """
+    进程内指标注册表: 计数器与直方图在内存中累加, 线程安全, 记录时不访问 Redis;
+    队列深度等瞬时值由注册的采集函数在导出时才读取, 不占用调度器线程
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        """
+        :param buckets: 直方图的桶上限
+        """
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = {'system': system_gauges}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        计数器累加
+        :param name: 指标名
+        :param value: 累加值
+        :param labels: 指标标签
+        """
+        if not value:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        记录一次直方图观测值
+        :param name: 指标名
+        :param value: 观测值
+        :param labels: 指标标签
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # 各桶的累计计数(观测值不大于桶上限的次数), 最后两项为观测值总和与观测次数
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def register_collector(self, key: str, collector):
+        """
+        注册瞬时值采集函数, 相同 key 的采集函数会被替换
+        :param key: 采集函数标识, 通常为队列名
+        :param collector: 无参函数, 返回 [(指标名, 标签字典, 值), ...]
+        """
+        with self._lock:
+            self._collectors[key] = collector
+
+    def unregister_collector(self, key: str):
+        """移除采集函数"""
+        with self._lock:
+            self._collectors.pop(key, None)
+
+    def collect(self):
+        """
+        调用所有采集函数, 单个采集函数异常时只记录日志
+        :return: [(指标名, 标签元组, 值), ...]
+        """
+        with self._lock:
+            collectors = list(self._collectors.items())
+        gauges = []
+        for key, collector in collectors:
+            try:
+                for name, labels, value in collector():
+                    gauges.append((name, tuple(sorted(labels.items())), value))
+            except Exception as e:
+                logger.error(f"采集指标 '{key}' 时发生异常: {e}")
+        return gauges
+
+    def snapshot(self, collect: bool = True, **labels):
+        """
+        获取指标快照, 可按标签过滤, 如 snapshot(queue='my_queue')
+        :param collect: 是否调用已注册的采集函数读取瞬时指标
+        :return: {'counters': {...}, 'histograms': {...}, 'gauges': {...}, 'dedup_hit_ratio': {...}}
+                 键为 (指标名, 标签元组), 直方图各桶为累计计数
+        """
+        def matched(key):
+            return all(dict(key[1]).get(k) == v for k, v in labels.items())
+
+        with self._lock:
+            counters = {key: value for key, value in self._counters.items() if matched(key)}
+            histograms = {
+                key: {
+                    'buckets': dict(zip(self.buckets, value[:-2])),
+                    'sum': value[-2],
+                    'count': value[-1],
+                }
+                for key, value in self._histograms.items() if matched(key)
+            }
+        gauges = {}
+        if collect:
+            gauges = {(name, key): value for name, key, value in self.collect() if matched((name, key))}
+
+        ratios = {}
+        for (name, key), checked in counters.items():
+            if name == 'spider_task_dedup_checked_total' and checked:
+                ratios[key] = counters.get(('spider_task_dedup_hits_total', key), 0) / checked
+
+        return {'counters': counters, 'histograms': histograms, 'gauges': gauges, 'dedup_hit_ratio': ratios}
+
+    def render(self):
+        """
+        导出 Prometheus 文本格式
+        :return: 文本
+        """
+        samples = {}
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                samples.setdefault(name, []).append((name, _format_labels(labels), value))
+            for (name, labels), value in self._histograms.items():
+                lines = samples.setdefault(name, [])
+                for bound, count in zip(self.buckets, value[:-2]):
+                    lines.append((f"{name}_bucket", _format_labels(labels, f'le="{bound}"'), count))
+                lines.append((f"{name}_bucket", _format_labels(labels, 'le="+Inf"'), value[-1]))
+                lines.append((f"{name}_sum", _format_labels(labels), value[-2]))
+                lines.append((f"{name}_count", _format_labels(labels), value[-1]))
+        for name, labels, value in self.collect():
+            samples.setdefault(name, []).append((name, _format_labels(labels), value))
+
+        output = []
+        for name in sorted(samples):
+            kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {kind}")
+            for sample, label_text, value in samples[name]:
+                output.append(f"{sample}{label_text} {value}")
+        return '\n'.join(output) + '\n'
+
+
+# 进程内默认指标注册表, 所有队列实例共享
+METRICS = Metrics()
+
+# 已启动的指标服务, 同一地址只启动一次
+_METRICS_SERVERS = {}
+_METRICS_SERVERS_LOCK = threading.Lock()
+
+
+def start_metrics_server(port: int = 9108, host: str = '127.0.0.1', registry: Metrics = None):
+    """
+    在后台线程中启动 HTTP 指标服务, GET /metrics 返回 Prometheus 文本格式
+    :param port: 监听端口
+    :param host: 监听地址, 默认只监听本机
+    :param registry: 指标注册表, 默认为进程内共享的 METRICS
+    :return: ThreadingHTTPServer
+    """
+    registry = registry or METRICS
+    with _METRICS_SERVERS_LOCK:
+        server = _METRICS_SERVERS.get((host, port))
+        if server is not None:
+            return server
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        _METRICS_SERVERS[(host, port)] = server
+        logger.info(f"指标服务已启动: http://{host}:{port}/metrics")
+        return server
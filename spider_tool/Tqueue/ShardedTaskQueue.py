@@ -0,0 +1,334 @@
+'''
+@Project ：TaskQueue.py
+@File    ：ShardedTaskQueue.py
+@Author  ：agent
+@Date    ：2026/10/18 21:00
+'''
+
+import time
+import math
+import random
+import bisect
+import hashlib
+import itertools
+import redis
+from loguru import logger
+from TaskQueue import TaskQueue, FingerprintDedup, get_config
+
+
+def parse_shards(shards, config: dict):
+    """
+    解析分片配置
+    :param shards: 分片数量(同一 Redis 节点上的多个分区), 或 "host:port/db" 列表, 或逗号分隔的 "host:port/db" 字符串
+    :param config: 基础配置字典
+    :return: 各分片的配置字典列表
+    """
+    if isinstance(shards, int):
+        return [dict(config) for _ in range(max(shards, 1))]
+    if isinstance(shards, str):
+        shards = [shard.strip() for shard in shards.split(',') if shard.strip()]
+    if not shards:
+        return [dict(config)]
+
+    shard_configs = []
+    for shard in shards:
+        address, _, db = shard.partition('/')
+        host, _, port = address.rpartition(':')
+        shard_configs.append(dict(
+            config,
+            REDIS_HOST=host or config['REDIS_HOST'],
+            REDIS_PORT=int(port) if port else config['REDIS_PORT'],
+            REDIS_DB=int(db) if db else config['REDIS_DB'],
+        ))
+    return shard_configs
+
+
+class HashRing:
+    """
+    一致性哈希环: 每个节点映射为 replicas 个虚拟节点, 增加或减少分片时只有约 1/N 的任务改变归属
+    """
+
+    def __init__(self, nodes: list, replicas: int = 160):
+        """
+        :param nodes: 节点标识列表, 标识应在所有 worker 间保持一致
+        :param replicas: 每个节点的虚拟节点数量
+        """
+        ring = sorted(
+            (self.hash(f"{node}#{i}".encode('utf-8')), index)
+            for index, node in enumerate(nodes) for i in range(replicas)
+        )
+        self._hashes = [h for h, _ in ring]
+        self._nodes = [index for _, index in ring]
+
+    @staticmethod
+    def hash(value: bytes):
+        return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'big')
+
+    def get(self, key: bytes):
+        """
+        :param key: 路由键
+        :return: 节点在 nodes 中的下标
+        """
+        i = bisect.bisect(self._hashes, self.hash(key)) % len(self._hashes)
+        return self._nodes[i]
+
+
+class ShardedTaskQueue(TaskQueue):
+    """
+    分片任务队列: 一个逻辑队列分布在多个分片上, 分片可以位于不同的 Redis 节点, 也可以是同一节点上的多个分区;
+    每个分片是一个键名带哈希标签的独立 TaskQueue, 各分片的键分布在 Redis Cluster 的不同槽位上。
+    入队按任务指纹一致性哈希到固定分片, 去重在分片内完成; 出队优先读取本 worker 的主分片, 不足时从其他分片窃取。
+    所有 worker 必须使用相同顺序的分片配置; 限流状态在各分片内独立计算
+    """
+
+    def __init__(self, task_name: str, shards=None, replicas: int = 160, steal_interval: float = 1,
+                 config=None, **kwargs):
+        """
+        :param task_name: 逻辑队列名称, 第 i 个分片的队列名为 "{task_name}:{i}"
+        :param shards: 分片数量, 或 "host:port/db" 列表, 默认读取 SHARDS, 未配置时只有一个分片
+        :param replicas: 一致性哈希每个分片的虚拟节点数量
+        :param steal_interval: 阻塞出队时在主分片上单次等待的时长(秒), 超时后重新尝试从其他分片窃取
+        :param config: 配置字典, 默认读取 config.ini
+        :param kwargs: 其余参数同 TaskQueue, 传给每个分片
+        """
+        config = config or get_config()
+        kwargs['hash_tag'] = True
+        super().__init__(task_name, config=config, **kwargs)
+
+        kwargs.setdefault('worker_id', self.worker_id)
+        self.shards = [
+            TaskQueue(f"{task_name}:{i}", config=shard_config, **kwargs)
+            for i, shard_config in enumerate(parse_shards(shards or config.get('SHARDS'), config))
+        ]
+        for shard in self.shards:
+            # spider_topic_list 中只登记逻辑队列名, 分片名只在内部使用
+            shard.topic_name = task_name
+        self.ring = HashRing([shard.task_name for shard in self.shards], replicas)
+        # 路由只看任务标识, 与去重方式无关, 重试任务(retry 字段变化)仍落在同一分片
+        self.router = FingerprintDedup(fields=getattr(self.dedup, 'fields', None))
+        self.home = HashRing.hash(self.worker_id.encode('utf-8')) % len(self.shards)
+        self.steal_interval = steal_interval
+
+    def shard_for(self, task: dict):
+        """
+        按任务指纹在一致性哈希环上选择分片
+        :param task: 任务字典
+        :return: 分片 TaskQueue
+        """
+        return self.shards[self.ring.get(self.router.digest(task))]
+
+    def _owner(self, task: dict, pop: bool = False):
+        """出队任务所属的分片, 非出队得到的任务按指纹路由"""
+        index = task.pop('_shard', None) if pop else task.get('_shard')
+        return self.shards[index] if index is not None else self.shard_for(task)
+
+    def _steal_order(self):
+        """出队顺序: 主分片优先, 其余分片随机排列, 避免所有 worker 同时窃取同一个分片"""
+        others = [i for i in range(len(self.shards)) if i != self.home]
+        random.shuffle(others)
+        return [self.home] + others
+
+    @staticmethod
+    def _tag(tasks: list, index: int):
+        for task in tasks:
+            task['_shard'] = index
+        return tasks
+
+    def add_task(self, task: dict = None, level: str = None, is_distinct: bool = True,
+                 delay: float = None, eta=None):
+        """增加单条任务, 参数同 TaskQueue.add_task"""
+        if task is None:
+            logger.error("未指定任务字典!!!")
+            return
+        self.shard_for(task).add_task(task, level, is_distinct, delay, eta)
+
+    def add_tasks(self, tasks=None, level: str = None, is_distinct: bool = True, chunk_size: int = 1000,
+                  delay: float = None, eta=None):
+        """
+        批量增加任务, 每批任务按分片分组, 每个分片一次往返, 参数同 TaskQueue.add_tasks
+        :return: 实际入队的任务数量
+        """
+        if not tasks or isinstance(tasks, (dict, str)):
+            logger.error("任务列表无效或未指定任务列表!!!")
+            return 0
+
+        level = level or self.level
+        due = self._due(delay, eta)
+
+        total = added = 0
+        iterator = iter(tasks)
+        try:
+            while True:
+                chunk = list(itertools.islice(iterator, chunk_size))
+                if not chunk:
+                    break
+                groups = {}
+                for task in chunk:
+                    if not task.get('retry'):
+                        task['retry'] = 0
+                    groups.setdefault(self.ring.get(self.router.digest(task)), []).append(task)
+                for index, group in groups.items():
+                    shard = self.shards[index]
+                    added += shard._push_tasks(shard._push_key(level, due), group, is_distinct, due)
+                total += len(chunk)
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+
+        logger.success(f"{'不去重·' if not is_distinct else ''}批量添加任务: 共 {total} 条, "
+                       f"入队 {added} 条, 重复 {total - added} 条, 分片 {len(self.shards)} 个")
+        return added
+
+    def get_task(self, level: str = None, fifo: bool = True):
+        """获取单条任务, 主分片为空时从其他分片窃取, 任务字典中附带 '_shard' 分片下标"""
+        for index in self._steal_order():
+            task = self.shards[index].get_task(level, fifo)
+            if task:
+                task['_shard'] = index
+                return task
+        return None
+
+    def get_tasks(self, level: str = None, num: int = 0, fifo: bool = True):
+        """批量获取任务, 主分片不足时从其他分片补足, num <= 0 表示获取所有分片的全部任务"""
+        tasks = []
+        for index in self._steal_order():
+            need = num - len(tasks) if num > 0 else 0
+            tasks += self._tag(self.shards[index].get_tasks(level, need, fifo), index)
+            if 0 < num <= len(tasks):
+                break
+        return tasks
+
+    def get_tasks_by_priority(self, levels: list = None, num: int = 1, strategy: str = 'strict',
+                              weights: dict = None, batch_sizes: dict = None, fifo: bool = True):
+        """
+        按优先级批量获取任务, 优先级与配额在每个分片内生效, 主分片不足时从其他分片补足,
+        参数同 TaskQueue.get_tasks_by_priority
+        """
+        if num <= 0:
+            logger.error("获取任务数量必须大于 0!!!")
+            return []
+
+        tasks = []
+        for index in self._steal_order():
+            shard_tasks = self.shards[index].get_tasks_by_priority(
+                levels, num - len(tasks), strategy, weights, batch_sizes, fifo)
+            tasks += self._tag(shard_tasks, index)
+            if len(tasks) >= num:
+                break
+        return tasks
+
+    def get_task_blocking(self, levels: list = None, timeout: int = 5, fifo: bool = True):
+        """
+        阻塞获取单条任务: 先从各分片非阻塞获取, 都为空时在主分片上阻塞等待 steal_interval 秒, 超时后重新窃取
+        :param levels: 按优先级排列的队列级别, 默认 ['urgent', 'normal']
+        :param timeout: 最长阻塞时间(秒), 0 表示一直阻塞
+        :param fifo: 是否按先入先出（FIFO）模式获取任务
+        :return: 任务字典或 None
+        """
+        end = time.time() + timeout if timeout else None
+        while True:
+            tasks = self.get_tasks_by_priority(levels=levels, num=1, fifo=fifo)
+            if tasks:
+                return tasks[0]
+
+            wait = self.steal_interval if end is None else min(self.steal_interval, end - time.time())
+            if wait <= 0:
+                return None
+            # BLPOP 的超时参数在旧版本 Redis 中只支持整数秒
+            task = self.shards[self.home].get_task_blocking(levels, max(math.ceil(wait), 1), fifo)
+            if task:
+                task['_shard'] = self.home
+                return task
+
+    def ack_task(self, task: dict = None):
+        """确认任务处理完成, 由任务所在的分片释放租约与并发令牌"""
+        if not task:
+            logger.error("任务不包含租约信息, 无法确认!!!")
+            return False
+        return self._owner(task, pop=True).ack_task(task)
+
+    def nack_task(self, task: dict = None, requeue: bool = True):
+        """拒绝任务, 参数同 TaskQueue.nack_task"""
+        if task is None:
+            logger.error("未指定任务字典!!!")
+            return
+        self._owner(task, pop=True).nack_task(task, requeue)
+
+    def touch_task(self, task: dict = None, visibility_timeout: int = None):
+        """为处理中的任务续租, 参数同 TaskQueue.touch_task"""
+        if not task:
+            logger.error("任务不包含租约信息, 无法续租!!!")
+            return False
+        return self._owner(task).touch_task(task, visibility_timeout)
+
+    def retry_task(self, task: dict = None, is_distinct: bool = True):
+        """任务重试, 重新放回任务所在的分片, 参数同 TaskQueue.retry_task"""
+        if task is None:
+            logger.error("未指定任务字典!!!")
+            return
+        self._owner(task, pop=True).retry_task(task, is_distinct)
+
+    def requeue_expired(self, limit: int = 1000):
+        """回收所有分片中租约已过期的任务"""
+        return sum(shard.requeue_expired(limit) for shard in self.shards)
+
+    def promote_delayed(self, limit: int = 1000):
+        """提升所有分片中到期的延迟任务"""
+        return sum(shard.promote_delayed(limit) for shard in self.shards)
+
+    def monitor_tasks(self):
+        """
+        任务预警, 汇总所有分片的队列长度
+        :return: 各队列任务数量
+        """
+        task_counts = {}
+        for shard in self.shards:
+            for key, count in shard.monitor_tasks().items():
+                task_counts[key] = task_counts.get(key, 0) + count
+        logger.info(f"任务统计({len(self.shards)} 个分片): {task_counts}")
+
+        if task_counts['fail'] > self.fail_alert_threshold:
+            logger.warning(f"失败队列中的任务数量超过阈值: {task_counts['fail']} > {self.fail_alert_threshold}")
+        return task_counts
+
+    def _export_header(self):
+        """导出文件的首条记录, 附带分片数量"""
+        header = super()._export_header()
+        header['shards'] = len(self.shards)
+        return header
+
+    def _export_records(self, levels: list, include_delayed: bool, include_processing: bool, include_dedup: bool,
+                        page_size: int):
+        """依次导出各分片, 去重索引记录附带分片下标"""
+        for index, shard in enumerate(self.shards):
+            records = shard._export_records(levels, include_delayed, include_processing, include_dedup, page_size)
+            for kind, record in records:
+                if kind in ('dedup', 'bloom'):
+                    record['shard'] = index
+                yield kind, record
+
+    def _import_target(self, record: dict):
+        """
+        导入记录按路由写入分片: 任务与集合去重成员按任务指纹, 指纹去重成员按指纹本身;
+        布隆位图无法拆分, 写回导出时的同一下标分片, 分片数量变化后可能产生少量重复任务
+        """
+        if 'task' in record:
+            return self.shard_for(record['task'])
+        if 'dedup' in record:
+            member = record['dedup']
+            if isinstance(member, dict):
+                return self.shard_for(member)
+            return self.shards[self.ring.get(bytes.fromhex(member))]
+        index = record.get('shard', 0)
+        return self.shards[index] if index < len(self.shards) else None
+
+    def collect_metrics(self):
+        """读取所有分片的瞬时指标, 以分片队列名作为 queue 标签"""
+        return [gauge for shard in self.shards for gauge in shard.collect_metrics()]
+
+    def get_metrics(self):
+        """
+        获取所有分片的指标快照
+        :return: {分片队列名: 见 Metrics.snapshot}
+        """
+        return {shard.task_name: shard.get_metrics() for shard in self.shards}
@@ -6,17 +6,487 @@
 '''
 
 import time
+import random
+import datetime
+import itertools
 from loguru import logger
 import redis
 import sys
 import os
 import configparser
 import json
+import gzip
+import base64
+import math
+import socket
+import hashlib
+import functools
+import threading
+import signal
+import weakref
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.cron import CronTrigger
 import psutil
+from Metrics import METRICS, start_metrics_server
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# 按方向截取 N 条任务的 Lua 函数, 供各出队脚本复用; n <= 0 表示全部, fifo 为 true 时按 LPOP 方向
+POP_ITEMS_LUA = """
+local function pop_items(key, n, fifo)
+    local len = redis.call('LLEN', key)
+    if n <= 0 or n > len then
+        n = len
+    end
+    if n == 0 then
+        return {}
+    end
+    if fifo then
+        local items = redis.call('LRANGE', key, 0, n - 1)
+        redis.call('LTRIM', key, n, -1)
+        return items
+    end
+    local items = redis.call('LRANGE', key, -n, -1)
+    redis.call('LTRIM', key, 0, -n - 1)
+    local reversed = {}
+    for i = #items, 1, -1 do
+        reversed[#reversed + 1] = items[i]
+    end
+    return reversed
+end
+"""
+
+# 批量出队脚本: 一次往返内按方向截取 N 条任务, 多个 worker 并发出队时也不会抢到同一批任务
+# KEYS[1]: 任务队列; ARGV[1]: 获取数量, <=0 表示全部; ARGV[2]: 1 为 LPOP 方向, 0 为 RPOP 方向
+BATCH_POP_SCRIPT = POP_ITEMS_LUA + """
+return pop_items(KEYS[1], tonumber(ARGV[1]), ARGV[2] == '1')
+"""
+
+# 可靠出队脚本: 出队的同时登记租约, 返回 [租约ID, 任务, 租约ID, 任务, ...]
+# KEYS[1]: 任务队列; KEYS[2]: 租约 ZSET(分值为租约到期时间); KEYS[3]: 租约任务 HASH; KEYS[4]: 租约序号
+# ARGV[1]: 获取数量; ARGV[2]: 出队方向; ARGV[3]: 租约到期时间戳; ARGV[4]: 租约ID前缀 "{level}:{worker_id}"
+RELIABLE_POP_SCRIPT = POP_ITEMS_LUA + """
+local items = pop_items(KEYS[1], tonumber(ARGV[1]), ARGV[2] == '1')
+local result = {}
+for _, item in ipairs(items) do
+    local lease = ARGV[4] .. ':' .. redis.call('INCR', KEYS[4])
+    redis.call('ZADD', KEYS[2], ARGV[3], lease)
+    redis.call('HSET', KEYS[3], lease, item)
+    result[#result + 1] = lease
+    result[#result + 1] = item
+end
+return result
+"""
+
+# 多级别优先出队脚本: 在一次往返内按级别顺序与配额出队, 返回 [级别或租约ID, 任务, ...]
+# KEYS[1..n]: 按优先级排列的各级别队列; 可靠模式下追加 KEYS[n+1..n+3]: 租约 ZSET、租约任务 HASH、租约序号
+# ARGV[1]: 总数量; ARGV[2]: 出队方向; ARGV[3]: 1 表示配额用完后按优先级补足剩余数量
+# ARGV[4]: 租约到期时间戳, 空串表示非可靠模式; ARGV[5]: worker_id; ARGV[6]: 级别数量 n
+# ARGV[7..6+n]: 各级别配额, -1 表示不限; ARGV[7+n..6+2n]: 各级别名称
+PRIORITY_POP_SCRIPT = POP_ITEMS_LUA + """
+local remaining = tonumber(ARGV[1])
+local fifo = ARGV[2] == '1'
+local deadline = ARGV[4]
+local n = tonumber(ARGV[6])
+local result = {}
+local function take(i, count)
+    local level = ARGV[6 + n + i]
+    local items = pop_items(KEYS[i], count, fifo)
+    for _, item in ipairs(items) do
+        if deadline ~= '' then
+            local lease = level .. ':' .. ARGV[5] .. ':' .. redis.call('INCR', KEYS[n + 3])
+            redis.call('ZADD', KEYS[n + 1], deadline, lease)
+            redis.call('HSET', KEYS[n + 2], lease, item)
+            result[#result + 1] = lease
+        else
+            result[#result + 1] = level
+        end
+        result[#result + 1] = item
+    end
+    remaining = remaining - #items
+end
+for i = 1, n do
+    if remaining <= 0 then
+        break
+    end
+    local quota = tonumber(ARGV[6 + i])
+    if quota < 0 or quota > remaining then
+        quota = remaining
+    end
+    if quota > 0 then
+        take(i, quota)
+    end
+end
+if ARGV[3] == '1' then
+    for i = 1, n do
+        if remaining <= 0 then
+            break
+        end
+        take(i, remaining)
+    end
+end
+return result
+"""
+
+# 租约回收脚本: 把到期未确认的任务放回其原队列头部, 返回回收数量
+# KEYS[1]: 租约 ZSET; KEYS[2]: 租约任务 HASH; KEYS[3..]: 各级别队列
+# ARGV[1]: 当前时间戳; ARGV[2]: 单次回收上限; ARGV[3..]: 与 KEYS[3..] 对应的级别名称
+REQUEUE_EXPIRED_SCRIPT = """
+local queues = {}
+for i = 3, #KEYS do
+    queues[ARGV[i]] = KEYS[i]
+end
+local leases = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+local count = 0
+for _, lease in ipairs(leases) do
+    local item = redis.call('HGET', KEYS[2], lease)
+    local level = string.match(lease, '^([^:]+)')
+    redis.call('ZREM', KEYS[1], lease)
+    redis.call('HDEL', KEYS[2], lease)
+    if item then
+        redis.call('LPUSH', queues[level] or queues['fail'], item)
+        count = count + 1
+    end
+end
+return count
+"""
+
+# 批量去重入队脚本: 去重、入队与去重索引 TTL 维护在一次往返内完成, 返回实际入队数量
+# KEYS[1]: 任务队列, 延迟入队时为延迟 ZSET; KEYS[2]: 去重索引
+# ARGV[1]: 1 表示去重插入, 0 表示只登记索引不去重; ARGV[2]: 去重方式 set/bloom; ARGV[3]: 去重索引 TTL
+# ARGV[4]: 每条任务的去重参数个数 w, 0 表示直接以任务内容作为集合成员; ARGV[5]: 到期时间戳, 空串表示立即入队
+# ARGV[6..]: 每条任务依次为 w 个去重参数与任务内容
+ADD_TASKS_SCRIPT = """
+local distinct = ARGV[1] == '1'
+local bloom = ARGV[2] == 'bloom'
+local width = tonumber(ARGV[4])
+local due = ARGV[5]
+local pushed = 0
+local batch = {}
+local function flush()
+    if due == '' then
+        redis.call('LPUSH', KEYS[1], unpack(batch))
+    else
+        local args = {}
+        for _, task in ipairs(batch) do
+            args[#args + 1] = due
+            args[#args + 1] = task
+        end
+        redis.call('ZADD', KEYS[1], unpack(args))
+    end
+    batch = {}
+end
+for i = 6, #ARGV, width + 1 do
+    local task = ARGV[i + width]
+    local added = 0
+    if bloom then
+        for j = i, i + width - 1 do
+            if redis.call('SETBIT', KEYS[2], ARGV[j], 1) == 0 then
+                added = 1
+            end
+        end
+    elseif width == 0 then
+        added = redis.call('SADD', KEYS[2], task)
+    else
+        added = redis.call('SADD', KEYS[2], ARGV[i])
+    end
+    if added == 1 or not distinct then
+        batch[#batch + 1] = task
+        pushed = pushed + 1
+        if #batch >= 1000 then
+            flush()
+        end
+    end
+end
+if #batch > 0 then
+    flush()
+end
+if redis.call('TTL', KEYS[2]) == -1 then
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+end
+return pushed
+"""
+
+# 延迟任务提升脚本: 把到期的延迟任务批量移入对应队列头部, 返回提升数量
+# KEYS: 依次为各级别的延迟 ZSET 与对应的任务队列; ARGV[1]: 当前时间戳; ARGV[2]: 每个级别单次提升上限
+PROMOTE_DELAYED_SCRIPT = """
+local total = 0
+for i = 1, #KEYS, 2 do
+    local items = redis.call('ZRANGEBYSCORE', KEYS[i], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+    if #items > 0 then
+        redis.call('ZREM', KEYS[i], unpack(items))
+        redis.call('LPUSH', KEYS[i + 1], unpack(items))
+        total = total + #items
+    end
+end
+return total
+"""
+
+
+# 限流出队脚本: 在多级别优先出队的基础上逐条检查任务的限流键, 被限流的任务推迟到对应级别的延迟 ZSET,
+# 不阻塞其他键的任务, 返回 [推迟数量, 级别或租约ID, 任务, 并发令牌, ...]
+# KEYS 与 ARGV[1..6+2n] 同多级别优先出队脚本, 之后追加 KEYS: 各级别延迟 ZSET、令牌桶 HASH、并发计数 HASH、
+# 并发令牌 ZSET(分值为令牌到期时间)、令牌序号
+# ARGV[7+2n..]: 限流字段、1 表示取 URL 的 host、每秒速率、桶容量、最大并发数、并发超限时的推迟秒数、
+# 当前时间戳、并发令牌到期时间戳、单次最多推迟的任务数; 速率与最大并发数为空串表示不限
+THROTTLE_POP_SCRIPT = POP_ITEMS_LUA + """
+local remaining = tonumber(ARGV[1])
+local fifo = ARGV[2] == '1'
+local deadline = ARGV[4]
+local n = tonumber(ARGV[6])
+local base = n
+if deadline ~= '' then
+    base = n + 3
+end
+local t = 6 + 2 * n
+local field = ARGV[t + 1]
+local by_host = ARGV[t + 2] == '1'
+local rate = tonumber(ARGV[t + 3])
+local burst = tonumber(ARGV[t + 4])
+local max_inflight = tonumber(ARGV[t + 5])
+local defer = tonumber(ARGV[t + 6])
+local now = tonumber(ARGV[t + 7])
+local token_deadline = ARGV[t + 8]
+local max_defer = tonumber(ARGV[t + 9])
+local bucket_key = KEYS[base + n + 1]
+local inflight_key = KEYS[base + n + 2]
+local token_key = KEYS[base + n + 3]
+local seq_key = KEYS[base + n + 4]
+
+-- 释放到期未归还的并发令牌, 避免 worker 崩溃后并发计数无法回落
+if max_inflight then
+    local expired = redis.call('ZRANGEBYSCORE', token_key, '-inf', now, 'LIMIT', 0, 1000)
+    for _, token in ipairs(expired) do
+        redis.call('ZREM', token_key, token)
+        local key = string.match(token, '^%d+|(.*)$')
+        if redis.call('HINCRBY', inflight_key, key, -1) <= 0 then
+            redis.call('HDEL', inflight_key, key)
+        end
+    end
+end
+
+local function throttle_key(item)
+    local ok, task
+    if string.byte(item, 1) == 255 then
+        ok, task = pcall(function() return cmsgpack.unpack(string.sub(item, 4)) end)
+    else
+        ok, task = pcall(cjson.decode, item)
+    end
+    if not ok or type(task) ~= 'table' then
+        return nil
+    end
+    local value = task[field]
+    if type(value) ~= 'string' and type(value) ~= 'number' then
+        return nil
+    end
+    value = tostring(value)
+    if by_host then
+        local host = string.match(value, '^%a[%w+.-]*://([^/?#]*)')
+        if host then
+            host = string.gsub(string.match(host, '([^@]*)$'), ':%d+$', '')
+            value = string.lower(host)
+        end
+    end
+    return value
+end
+
+local buckets = {}
+local backlog = {}
+-- 为限流键申请出队许可, 返回 true 与并发令牌, 或 false 与推迟到期时间
+local function acquire(key)
+    local waiting = backlog[key] or 0
+    if max_inflight then
+        local count = tonumber(redis.call('HGET', inflight_key, key) or '0')
+        if count >= max_inflight then
+            backlog[key] = waiting + 1
+            return false, now + defer
+        end
+    end
+    if rate then
+        local tokens = buckets[key]
+        if not tokens then
+            tokens = burst
+            local saved = redis.call('HGET', bucket_key, key)
+            if saved then
+                local level, ts = string.match(saved, '^([^:]+):(.+)$')
+                tokens = math.min(burst, tonumber(level) + math.max(now - tonumber(ts), 0) * rate)
+            end
+        end
+        if tokens < 1 then
+            -- 同一键被推迟的任务按令牌补充速度依次错开到期时间
+            buckets[key] = tokens
+            backlog[key] = waiting + 1
+            return false, now + (1 - tokens + waiting) / rate
+        end
+        buckets[key] = tokens - 1
+    end
+    local token = ''
+    if max_inflight then
+        redis.call('HINCRBY', inflight_key, key, 1)
+        token = redis.call('INCR', seq_key) .. '|' .. key
+        redis.call('ZADD', token_key, token_deadline, token)
+    end
+    return true, token
+end
+
+local result = {0}
+local deferred = 0
+local function take(i, count)
+    local level = ARGV[6 + n + i]
+    local taken = 0
+    while taken < count and deferred < max_defer do
+        local items = pop_items(KEYS[i], 1, fifo)
+        if #items == 0 then
+            break
+        end
+        local item = items[1]
+        local key = throttle_key(item)
+        local allowed, token = true, ''
+        if key then
+            allowed, token = acquire(key)
+        end
+        if allowed then
+            if deadline ~= '' then
+                local lease = level .. ':' .. ARGV[5] .. ':' .. redis.call('INCR', KEYS[n + 3])
+                redis.call('ZADD', KEYS[n + 1], deadline, lease)
+                redis.call('HSET', KEYS[n + 2], lease, item)
+                result[#result + 1] = lease
+            else
+                result[#result + 1] = level
+            end
+            result[#result + 1] = item
+            result[#result + 1] = token
+            taken = taken + 1
+        else
+            redis.call('ZADD', KEYS[base + i], token, item)
+            deferred = deferred + 1
+        end
+    end
+    remaining = remaining - taken
+end
+for i = 1, n do
+    if remaining <= 0 then
+        break
+    end
+    local quota = tonumber(ARGV[6 + i])
+    if quota < 0 or quota > remaining then
+        quota = remaining
+    end
+    if quota > 0 then
+        take(i, quota)
+    end
+end
+if ARGV[3] == '1' then
+    for i = 1, n do
+        if remaining <= 0 then
+            break
+        end
+        take(i, remaining)
+    end
+end
+
+for key, tokens in pairs(buckets) do
+    redis.call('HSET', bucket_key, key, tokens .. ':' .. now)
+end
+if next(buckets) then
+    redis.call('EXPIRE', bucket_key, 86400)
+end
+result[1] = deferred
+return result
+"""
+
+# 并发令牌归还脚本: 令牌仍有效时删除令牌并减少对应键的并发计数, 返回是否归还成功
+# KEYS[1]: 并发计数 HASH; KEYS[2]: 并发令牌 ZSET; ARGV[1]: 并发令牌
+RELEASE_THROTTLE_SCRIPT = """
+if redis.call('ZREM', KEYS[2], ARGV[1]) == 0 then
+    return 0
+end
+local key = string.match(ARGV[1], '^%d+|(.*)$')
+if redis.call('HINCRBY', KEYS[1], key, -1) <= 0 then
+    redis.call('HDEL', KEYS[1], key)
+end
+return 1
+"""
+
+
+# 进程级 Redis 连接池注册表, 相同 host/port/db 的 TaskQueue 实例共享同一个有上限的连接池
+_CONNECTION_POOLS = {}
+_CONNECTION_POOLS_LOCK = threading.Lock()
+# 按原连接池缓存的不解码返回值的连接池
+_RAW_CONNECTION_POOLS = weakref.WeakKeyDictionary()
+# 已登记到 spider_topic_list 的 (host, port, db, 队列名), 每个进程在每个 Redis 库上每个队列只登记一次
+_REGISTERED_TOPICS = set()
+# 当前日志级别, 避免每个实例都重新配置 loguru
+_LOGGER_LEVEL = None
+
+
+def get_connection_pool(host: str, port: int, db: int, decode_responses: bool = True, max_connections: int = 50):
+    """
+    获取进程内共享的 Redis 连接池, 线程安全; 连接在第一次执行命令时才建立
+    :param host: Redis 主机
+    :param port: Redis 端口
+    :param db: Redis 数据库编号
+    :param decode_responses: 是否将返回值解码为字符串
+    :param max_connections: 连接池最大连接数, 连接用尽时阻塞等待空闲连接
+    :return: redis.BlockingConnectionPool
+    """
+    key = (host, port, db, decode_responses)
+    with _CONNECTION_POOLS_LOCK:
+        pool = _CONNECTION_POOLS.get(key)
+        if pool is None:
+            pool = redis.BlockingConnectionPool(
+                host=host,
+                port=port,
+                db=db,
+                encoding="utf-8",
+                decode_responses=decode_responses,
+                max_connections=max_connections
+            )
+            _CONNECTION_POOLS[key] = pool
+        return pool
+
+
+def get_raw_connection_pool(pool):
+    """
+    获取与给定连接池配置相同、但不解码返回值的连接池, 用于读取位图等二进制数据
+    复制原连接池的全部连接参数(密码、SSL、socket 选项等)与最大连接数, 每个原连接池只创建一次
+    :param pool: 原连接池
+    :return: 不解码返回值的连接池, 原连接池本身不解码时直接返回原连接池
+    """
+    if not pool.connection_kwargs.get('decode_responses'):
+        return pool
+    with _CONNECTION_POOLS_LOCK:
+        raw = _RAW_CONNECTION_POOLS.get(pool)
+        if raw is None:
+            kwargs = dict(pool.connection_kwargs, decode_responses=False)
+            if isinstance(pool, redis.BlockingConnectionPool):
+                kwargs['timeout'] = pool.timeout
+            raw = pool.__class__(connection_class=pool.connection_class, max_connections=pool.max_connections,
+                                 **kwargs)
+            _RAW_CONNECTION_POOLS[pool] = raw
+        return raw
+
+
+def setup_logger(log_level: str):
+    """配置日志输出, 级别不变时不重复配置"""
+    global _LOGGER_LEVEL
+    if _LOGGER_LEVEL != log_level:
+        logger.remove()
+        logger.add(sys.stderr, level=log_level)
+        _LOGGER_LEVEL = log_level
+
+
+@functools.lru_cache(maxsize=None)
 def get_config():
     config_path = 'config.ini'
     if not os.path.exists(config_path):
@@ -33,6 +503,18 @@ def get_config():
     log_level = config.get('DEFAULT', 'LOG_LEVEL', fallback='warning').upper()
     max_retries = config.getint('DEFAULT', 'MAX_RETRIES', fallback=3)
     max_ttl = config.getint('DEFAULT', 'MAX_TTL', fallback=60 * 60 * 24 * 30)  # 默认30天
+    visibility_timeout = config.getint('DEFAULT', 'VISIBILITY_TIMEOUT', fallback=300)
+    reaper_interval = config.getint('DEFAULT', 'REAPER_INTERVAL', fallback=30)
+    dedup = config.get('DEFAULT', 'DEDUP', fallback='set')
+    codec = config.get('DEFAULT', 'CODEC', fallback='json')
+    max_connections = config.getint('DEFAULT', 'MAX_CONNECTIONS', fallback=50)
+    retry_backoff = config.getfloat('DEFAULT', 'RETRY_BACKOFF', fallback=0)
+    retry_backoff_max = config.getfloat('DEFAULT', 'RETRY_BACKOFF_MAX', fallback=600)
+    promote_interval = config.getint('DEFAULT', 'PROMOTE_INTERVAL', fallback=1)
+    metrics_port = config.getint('DEFAULT', 'METRICS_PORT', fallback=0)
+    fail_alert_threshold = config.getint('DEFAULT', 'FAIL_ALERT_THRESHOLD', fallback=100)
+    hash_tag = config.getboolean('DEFAULT', 'HASH_TAG', fallback=False)
+    shards = config.get('DEFAULT', 'SHARDS', fallback='')
 
     scheduling_strategy = config.get('SCHEDULING', 'SCHEDULING_STRATEGY', fallback='interval')
     interval_seconds = config.getint('SCHEDULING', 'INTERVAL_SECONDS', fallback=60)
@@ -50,20 +532,271 @@ def get_config():
         'LOG_LEVEL': log_level,
         'MAX_RETRIES': max_retries,
         'MAX_TTL': max_ttl,
+        'VISIBILITY_TIMEOUT': visibility_timeout,
+        'REAPER_INTERVAL': reaper_interval,
+        'DEDUP': dedup,
+        'CODEC': codec,
+        'MAX_CONNECTIONS': max_connections,
+        'RETRY_BACKOFF': retry_backoff,
+        'RETRY_BACKOFF_MAX': retry_backoff_max,
+        'PROMOTE_INTERVAL': promote_interval,
+        'METRICS_PORT': metrics_port,
+        'FAIL_ALERT_THRESHOLD': fail_alert_threshold,
+        'HASH_TAG': hash_tag,
+        'SHARDS': shards,
         'SCHEDULING_STRATEGY': scheduling_strategy,
         'INTERVAL_SECONDS': interval_seconds,
         'CRON_EXPRESSION': cron_expression
     }
 
 
-class TaskQueue:
+# 导出文件格式标识与版本
+EXPORT_FORMAT = 'spider_task_export'
+EXPORT_VERSION = 1
+
+
+# 二进制任务的版本头: 魔数 + 头版本 + 编码ID, JSON 任务不带版本头, 与旧版本保持兼容
+PAYLOAD_MAGIC = b'\xff'
+PAYLOAD_HEADER_VERSION = 1
+
+
+def to_str(value):
+    """Redis 返回 bytes 时解码为字符串, 用于租约ID、队列名等非任务数据"""
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class JsonCodec:
+    """
+    标准库 JSON 编码, 与旧版本任务格式完全一致
+    所有编码器都可以解码其他编码器写入的任务, 但 JSON 编码使用 decode_responses=True,
+    读取 msgpack 任务前需要先把 worker 切换为 orjson 等二进制编码
+    """
+    name = 'json'
+    codec_id = 0
+    binary = False
+
+    def dumps(self, task: dict):
+        return json.dumps(task, ensure_ascii=False)
+
+    def loads(self, data):
+        if isinstance(data, bytes) and data[:1] == PAYLOAD_MAGIC:
+            codec = CODECS_BY_ID.get(data[2])
+            if codec is None:
+                raise ValueError(f"未知的任务编码: 版本 {data[1]}, 编码ID {data[2]}")
+            return codec.decode_body(data[3:])
+        return self.decode_json(data)
+
+    def decode_json(self, data):
+        return json.loads(data)
+
+    def header(self):
+        return PAYLOAD_MAGIC + bytes([PAYLOAD_HEADER_VERSION, self.codec_id])
+
+
+class OrjsonCodec(JsonCodec):
+    """orjson 编码, 输出仍是 JSON, 无需版本头, 旧版本 worker 可以直接读取"""
+    name = 'orjson'
+    binary = True
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("使用 orjson 编码需要安装 orjson: pip install orjson")
+
+    def dumps(self, task: dict):
+        return orjson.dumps(task)
+
+    def decode_json(self, data):
+        return orjson.loads(data)
+
+
+class MsgpackCodec(JsonCodec):
+    """msgpack 编码, 任务体积更小, 带版本头, 只能被支持版本头的 worker 读取"""
+    name = 'msgpack'
+    codec_id = 1
+    binary = True
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("使用 msgpack 编码需要安装 msgpack: pip install msgpack")
+
+    def dumps(self, task: dict):
+        return self.header() + msgpack.packb(task, use_bin_type=True)
+
+    @staticmethod
+    def decode_body(body: bytes):
+        if msgpack is None:
+            raise ImportError("解码 msgpack 任务需要安装 msgpack: pip install msgpack")
+        return msgpack.unpackb(body, raw=False)
+
+
+CODECS = {
+    'json': JsonCodec,
+    'orjson': OrjsonCodec,
+    'msgpack': MsgpackCodec,
+}
+CODECS_BY_ID = {
+    MsgpackCodec.codec_id: MsgpackCodec,
+}
+
+
+class SetDedup:
+    """
+    默认去重方式: 以完整任务 JSON 作为集合成员
+    任务字段顺序不同或 retry 字段变化都会被视为新任务, 重试任务同样参与去重
+    """
+    kind = 'set'
+    track_retry = True
+
+    def key(self, task_name: str):
+        return f"spider_task_backup:{task_name}"
+
+    def member(self, task: dict, task_data: str):
+        return task_data
+
+
+class FingerprintDedup(SetDedup):
+    """
+    指纹去重: 对任务规范化(键排序、忽略 retry 与 '_' 开头的内部字段)后取固定长度哈希存入集合,
+    也可以只取 fields 指定的标识字段计算指纹, 内存占用与任务大小无关
+    """
+    kind = 'fingerprint'
+    track_retry = False
+
+    def __init__(self, fields: list = None, digest_size: int = 16):
+        """
+        :param fields: 参与指纹计算的标识字段, 默认为除 retry 与内部字段外的全部字段
+        :param digest_size: 指纹字节数, 默认 16 字节
+        """
+        self.fields = fields
+        self.digest_size = digest_size
+
+    def key(self, task_name: str):
+        return f"spider_task_fingerprint:{task_name}"
+
+    def digest(self, task: dict):
+        if self.fields:
+            identity = {field: task.get(field) for field in self.fields}
+        else:
+            identity = {k: v for k, v in task.items() if k != 'retry' and not k.startswith('_')}
+        canonical = json.dumps(identity, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.blake2b(canonical.encode('utf-8'), digest_size=self.digest_size).digest()
+
+    def member(self, task: dict, task_data: str):
+        return self.digest(task).hex()
+
+
+class BloomDedup(FingerprintDedup):
+    """
+    布隆过滤器去重: 基于 SETBIT 位图实现, 内存只与预期容量和误判率有关, 存在一定误判(把新任务当作已存在)
+    """
+    kind = 'bloom'
+
+    def __init__(self, capacity: int = 10000000, error_rate: float = 0.001, fields: list = None):
+        """
+        :param capacity: 预期任务数量
+        :param error_rate: 达到预期数量时的误判率
+        :param fields: 参与指纹计算的标识字段, 默认为除 retry 与内部字段外的全部字段
+        """
+        super().__init__(fields=fields)
+        # Redis 位图最大 2^32 位
+        self.bits = min(int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)), 2 ** 32)
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+
+    def key(self, task_name: str):
+        return f"spider_task_bloom:{task_name}"
+
+    def member(self, task: dict, task_data: str):
+        # 双重哈希由一个摘要派生出 k 个位偏移量
+        digest = self.digest(task)
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+
+DEDUP_CLASSES = {
+    'set': SetDedup,
+    'fingerprint': FingerprintDedup,
+    'bloom': BloomDedup,
+}
+
+
+class Throttle:
+    """
+    按任务字段限流: 出队时以 field 字段(默认取其中 URL 的 host)作为限流键, 每个键按令牌桶限速或限制处理中的任务数,
+    限流状态保存在 Redis 中由所有 worker 共享; 被限流的任务推迟到延迟队列, 不阻塞其他键的任务, 取不到限流键的任务不受限制
+    """
+
+    def __init__(self, field: str = 'url', by_host: bool = True, rate: float = None, burst: int = None,
+                 max_inflight: int = None, defer: float = 1, max_defer: int = 100, max_batch: int = 100,
+                 poll_interval: float = 0.2):
+        """
+        :param field: 限流键所在的任务字段
+        :param by_host: 字段值为 URL 时是否只取其中的 host(小写, 不含端口)作为限流键
+        :param rate: 每个键每秒允许出队的任务数, 默认不限速
+        :param burst: 令牌桶容量, 即每个键允许的突发任务数, 默认与 rate 相同(至少为 1)
+        :param max_inflight: 每个键处理中(已出队未确认)的最大任务数, 默认不限制
+        :param defer: 并发超限时任务推迟的秒数
+        :param max_defer: 单次出队最多推迟的任务数, 避免大量同键任务堆积时单次脚本扫描过久
+        :param max_batch: 单次出队最多取出的任务数(包括不受限的任务), 限制单次脚本的执行时间, get_tasks 获取全部时同样按此上限
+        :param poll_interval: 阻塞出队改为轮询时的间隔(秒)
+        """
+        if rate is None and max_inflight is None:
+            raise ValueError("rate 与 max_inflight 至少需要指定一个")
+        if max_batch < 1:
+            raise ValueError("max_batch 必须大于 0")
+        self.field = field
+        self.by_host = by_host
+        self.rate = rate
+        self.burst = burst or max(int(math.ceil(rate or 1)), 1)
+        self.max_inflight = max_inflight
+        self.defer = defer
+        self.max_defer = max_defer
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+
+    def args(self):
+        """限流脚本中除时间戳外的参数"""
+        return [self.field, 1 if self.by_host else 0, '' if self.rate is None else self.rate, self.burst,
+                '' if self.max_inflight is None else self.max_inflight, self.defer]
+
+
+class BaseTaskQueue:
+    """
+    任务队列公共部分: 配置解析、去重与编码、Lua 脚本参数构造, 不包含任何 Redis IO,
+    由同步的 TaskQueue 与异步的 AsyncTaskQueue 分别实现 Redis 客户端与各项操作
+    """
     ALLOWED_LEVELS = ["normal", "fail", "urgent"]
     ALLOWED_LOG_LEVELS = ["TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL"]
 
-    def __init__(self, task_name: str, level: str = 'normal', log_level: str = 'warning', config=None):
+    def __init__(self, task_name: str, level: str = 'normal', log_level: str = 'warning', config=None,
+                 reliable: bool = False, visibility_timeout: int = None, worker_id: str = None, dedup=None,
+                 codec=None, retry_backoff: float = None, retry_backoff_max: float = None, throttle: Throttle = None,
+                 metrics=None, hash_tag: bool = None):
+        """
+        :param task_name: 队列名称
+        :param level: 默认队列级别
+        :param log_level: 日志级别
+        :param config: 配置字典, 默认读取 config.ini
+        :param reliable: 是否开启可靠队列模式, 出队任务需 ack_task 确认, 超时未确认的任务会被重新放回队列
+        :param visibility_timeout: 可靠模式下的租约时长(秒), 默认读取 VISIBILITY_TIMEOUT
+        :param worker_id: 可靠模式下的 worker 标识, 默认为 "主机名-进程号"
+        :param dedup: 去重方式, 'set'、'fingerprint'、'bloom' 或去重实例, 默认读取 DEDUP
+        :param codec: 任务编码, 'json'、'orjson'、'msgpack' 或编码实例, 默认读取 CODEC
+        :param retry_backoff: 重试退避基数(秒), 第 n 次重试延迟约 retry_backoff * 2^n 秒, 0 表示立即重试, 默认读取 RETRY_BACKOFF
+        :param retry_backoff_max: 重试退避上限(秒), 默认读取 RETRY_BACKOFF_MAX
+        :param throttle: 按任务字段限流的 Throttle 实例, 默认不限流
+        :param metrics: 指标注册表, 默认为进程内共享的 METRICS
+        :param hash_tag: 是否在键名中以 {task_name} 作为哈希标签, 使同一队列的所有键落在 Redis Cluster 的同一个槽位,
+                         开启后键名与旧版本不同, 默认读取 HASH_TAG
+        """
         config = config or get_config()
 
         self.task_name = task_name
+        # 登记到 spider_topic_list 的队列名, 分片队列的各分片登记逻辑队列名
+        self.topic_name = task_name
+        # 键名中的队列名部分, 开启哈希标签时为 "{task_name}"
+        hash_tag = hash_tag if hash_tag is not None else config.get('HASH_TAG', False)
+        self.key_name = f"{{{task_name}}}" if hash_tag else task_name
         self.level = level if level in self.ALLOWED_LEVELS else config['LEVEL']
         self.log_level = log_level.upper() if log_level.upper() in self.ALLOWED_LOG_LEVELS else config['LOG_LEVEL']
         self.max_retries = config['MAX_RETRIES']
@@ -72,111 +805,436 @@ class TaskQueue:
         self.interval_seconds = config.get('INTERVAL_SECONDS', 60)
         self.cron_expression = config.get('CRON_EXPRESSION', '0')
         self.scheduler = None
+        self.handler = None
+        self._consuming = False
+        self._wrr_weights = {}
+        self._next_reap = 0
+        self._next_promote = 0
 
-        # 初始化 Redis 连接
-        self.conn = redis.Redis(
-            host=config['REDIS_HOST'],
-            port=config['REDIS_PORT'],
-            db=config['REDIS_DB'],
-            charset="utf-8",
-            decode_responses=True
-        )
+        # 延迟任务与重试退避配置
+        self.retry_backoff = retry_backoff if retry_backoff is not None else config.get('RETRY_BACKOFF', 0)
+        self.retry_backoff_max = retry_backoff_max or config.get('RETRY_BACKOFF_MAX', 600)
+        self.promote_interval = config.get('PROMOTE_INTERVAL', 1)
 
-        logger.remove()
-        logger.add(sys.stderr, level=self.log_level)
+        # 可靠队列配置
+        self.reliable = reliable
+        self.visibility_timeout = visibility_timeout or config.get('VISIBILITY_TIMEOUT', 300)
+        self.reaper_interval = config.get('REAPER_INTERVAL', 30)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.processing_key = f"spider_task_processing:{self.key_name}"
+        self.lease_key = f"spider_task_lease:{self.key_name}"
+        self.lease_seq_key = f"spider_task_lease_seq:{self.key_name}"
 
-        # 添加队列名称到 Redis 集合
-        if self.task_name:
-            if self.conn.sadd("spider_topic_list", self.task_name):
-                logger.info(f"新增队列名: {self.task_name}")
-            else:
-                logger.warning(f"队列名 '{self.task_name}' 已存在。")
+        # 限流配置
+        self.throttle = throttle
+        self.throttle_bucket_key = f"spider_task_throttle:{self.key_name}"
+        self.inflight_key = f"spider_task_inflight:{self.key_name}"
+        self.inflight_token_key = f"spider_task_inflight_token:{self.key_name}"
+
+        # 指标配置
+        self.metrics = metrics or METRICS
+        self.metrics_port = config.get('METRICS_PORT', 0)
+        self.fail_alert_threshold = config.get('FAIL_ALERT_THRESHOLD', 100)
+        # 异步队列由消费循环定时采集瞬时指标, 供指标服务线程导出
+        self._gauges = []
+        self._export_gauges = False
+
+        # 去重配置
+        dedup = dedup or config.get('DEDUP', 'set')
+        if isinstance(dedup, str):
+            if dedup not in DEDUP_CLASSES:
+                logger.warning(f"无效的去重方式 '{dedup}'，使用默认方式 'set'")
+                dedup = 'set'
+            dedup = DEDUP_CLASSES[dedup]()
+        self.dedup = dedup
+        self.dedup_key = self.dedup.key(self.key_name)
+
+        # 任务编码配置
+        codec = codec or config.get('CODEC', 'json')
+        if isinstance(codec, str):
+            if codec not in CODECS:
+                logger.warning(f"无效的任务编码 '{codec}'，使用默认编码 'json'")
+                codec = 'json'
+            codec = CODECS[codec]()
+        self.codec = codec
+
+        self.conn = self._create_client(config)
+        self._batch_pop = self.conn.register_script(BATCH_POP_SCRIPT)
+        self._reliable_pop = self.conn.register_script(RELIABLE_POP_SCRIPT)
+        self._requeue_expired = self.conn.register_script(REQUEUE_EXPIRED_SCRIPT)
+        self._priority_pop = self.conn.register_script(PRIORITY_POP_SCRIPT)
+        self._add_tasks = self.conn.register_script(ADD_TASKS_SCRIPT)
+        self._promote_delayed = self.conn.register_script(PROMOTE_DELAYED_SCRIPT)
+        self._throttle_pop = self.conn.register_script(THROTTLE_POP_SCRIPT)
+        self._release_throttle = self.conn.register_script(RELEASE_THROTTLE_SCRIPT)
+
+        setup_logger(self.log_level)
+
+    def _create_client(self, config: dict):
+        """
+        创建 Redis 客户端, 由子类实现
+        :param config: 配置字典
+        :return: Redis 客户端
+        """
+        raise NotImplementedError
+
+    def _push_args(self, tasks: list, is_distinct: bool = True, due: float = None):
+        """
+        构造批量去重入队脚本的参数, 每条任务只序列化一次
+        :param tasks: 任务字典列表
+        :param is_distinct: 是否去重插入, 否则只登记去重索引
+        :param due: 到期时间戳, 为空表示立即入队
+        :return: 脚本参数列表
+        """
+        args = []
+        width = 0
+        for task in tasks:
+            task_data = self.codec.dumps(task)
+            member = self.dedup.member(task, task_data)
+            # 以任务内容本身作为集合成员时不再重复传输
+            if member is not task_data:
+                if not isinstance(member, list):
+                    member = [member]
+                width = len(member)
+                args.extend(member)
+            args.append(task_data)
+        return [1 if is_distinct else 0, self.dedup.kind, self.max_ttl, width, '' if due is None else due] + args
+
+    def _push_key(self, level: str, due: float = None):
+        """立即入队时为任务队列, 延迟入队时为该级别的延迟 ZSET"""
+        if due is None:
+            return f"spider_task:{self.key_name}:{level}"
+        return f"spider_task_delayed:{self.key_name}:{level}"
+
+    @staticmethod
+    def _due(delay: float = None, eta=None):
+        """
+        计算任务到期时间戳
+        :param delay: 延迟秒数
+        :param eta: 到期时间, datetime 或时间戳
+        :return: 到期时间戳, 无需延迟时返回 None
+        """
+        if eta is not None:
+            return eta.timestamp() if isinstance(eta, datetime.datetime) else float(eta)
+        if delay:
+            return time.time() + delay
+        return None
+
+    def _retry_due(self, retry_count: int):
+        """
+        按指数退避与随机抖动计算重试任务的到期时间戳
+        :param retry_count: 已重试次数
+        :return: 到期时间戳, 未开启退避时返回 None
+        """
+        if not self.retry_backoff:
+            return None
+        delay = min(self.retry_backoff * 2 ** retry_count, self.retry_backoff_max)
+        return time.time() + delay * random.uniform(0.5, 1)
+
+    def _promote_args(self, limit: int):
+        """
+        构造延迟任务提升脚本的参数
+        :return: (keys, args)
+        """
+        keys = []
+        for level in self.ALLOWED_LEVELS:
+            keys += [f"spider_task_delayed:{self.key_name}:{level}", f"spider_task:{self.key_name}:{level}"]
+        return keys, [time.time(), limit]
+
+    def _lease_args(self, level: str, num: int, fifo: bool):
+        """
+        构造可靠出队脚本的参数
+        :return: (keys, args)
+        """
+        keys = [f"spider_task:{self.key_name}:{level}", self.processing_key, self.lease_key, self.lease_seq_key]
+        args = [num, 1 if fifo else 0, time.time() + self.visibility_timeout, f"{level}:{self.worker_id}"]
+        return keys, args
+
+    def _parse_leases(self, result: list):
+        """
+        解析可靠出队脚本的返回值
+        :param result: [租约ID, 任务, ...]
+        :return: 附带 '_lease' 的任务字典列表
+        """
+        tasks = []
+        for lease, task_data in zip(result[::2], result[1::2]):
+            task = self.codec.loads(task_data)
+            task['_lease'] = to_str(lease)
+            tasks.append(task)
+        return tasks
+
+    def _priority_args(self, levels: list, num: int, strategy: str, weights: dict, batch_sizes: dict, fifo: bool):
+        """
+        构造多级别优先出队脚本的参数
+        :return: (keys, args)
+        """
+        if strategy == 'weighted':
+            quotas = self._weighted_quotas(levels, num, weights or {})
+            fill = 1
+        else:
+            if strategy != 'strict':
+                logger.warning(f"未知的出队策略 '{strategy}'，使用默认策略 'strict'")
+            batch_sizes = batch_sizes or {}
+            quotas = [batch_sizes.get(level, -1) for level in levels]
+            fill = 0
+
+        keys = [f"spider_task:{self.key_name}:{level}" for level in levels]
+        deadline = ''
+        if self.reliable:
+            keys += [self.processing_key, self.lease_key, self.lease_seq_key]
+            deadline = time.time() + self.visibility_timeout
+
+        args = [num, 1 if fifo else 0, fill, deadline, self.worker_id, len(levels)] + quotas + levels
+        return keys, args
+
+    def _parse_priority(self, result: list):
+        """
+        解析多级别优先出队脚本的返回值
+        :param result: [级别或租约ID, 任务, ...]
+        :return: (任务字典列表, 各级别出队数量)
+        """
+        tasks = []
+        counts = {}
+        for tag, task_data in zip(result[::2], result[1::2]):
+            task = self.codec.loads(task_data)
+            tag = to_str(tag)
+            if self.reliable:
+                task['_lease'] = tag
+                tag = tag.split(':', 1)[0]
+            counts[tag] = counts.get(tag, 0) + 1
+            tasks.append(task)
+        return tasks, counts
+
+    def _throttle_args(self, levels: list, num: int, strategy: str = 'strict', weights: dict = None,
+                       batch_sizes: dict = None, fifo: bool = True):
+        """
+        构造限流出队脚本的参数, 在多级别优先出队参数之后追加限流参数
+        出队数量不超过 throttle.max_batch, num 不大于 0 时取 max_batch, 避免单次脚本遍历整个队列阻塞 Redis
+        :return: (keys, args)
+        """
+        num = min(num, self.throttle.max_batch) if num > 0 else self.throttle.max_batch
+        keys, args = self._priority_args(levels, num, strategy, weights, batch_sizes, fifo)
+        keys += [f"spider_task_delayed:{self.key_name}:{level}" for level in levels]
+        keys += [self.throttle_bucket_key, self.inflight_key, self.inflight_token_key, self.lease_seq_key]
+        now = time.time()
+        args += self.throttle.args() + [now, now + self.visibility_timeout, self.throttle.max_defer]
+        return keys, args
+
+    def _parse_throttle(self, result: list):
+        """
+        解析限流出队脚本的返回值, 并发令牌以 '_throttle' 字段附带在任务字典中
+        :param result: [推迟数量, 级别或租约ID, 任务, 并发令牌, ...]
+        :return: (任务字典列表, 各级别出队数量, 推迟数量)
+        """
+        deferred, result = result[0], result[1:]
+        tasks, counts = self._parse_priority([item for i, item in enumerate(result) if i % 3 != 2])
+        for task, token in zip(tasks, result[2::3]):
+            token = to_str(token)
+            if token:
+                task['_throttle'] = token
+        return tasks, counts, deferred
+
+    def _record_push(self, task_title: str, submitted: int, pushed: int, is_distinct: bool = True):
+        """
+        记录入队与去重指标
+        :param task_title: 任务队列或延迟 ZSET, 末段为级别
+        :param submitted: 提交的任务数量
+        :param pushed: 实际入队的任务数量
+        :param is_distinct: 是否去重插入
+        """
+        level = task_title.rsplit(':', 1)[-1]
+        self.metrics.inc('spider_task_enqueued_total', pushed, queue=self.task_name, level=level)
+        if is_distinct:
+            self.metrics.inc('spider_task_dedup_checked_total', submitted, queue=self.task_name)
+            self.metrics.inc('spider_task_dedup_hits_total', submitted - pushed, queue=self.task_name)
+
+    def _record_dequeue(self, counts: dict, started: float = None, deferred: int = 0):
+        """
+        记录出队指标
+        :param counts: 各级别出队数量
+        :param started: 非阻塞出队开始时的 time.perf_counter(), 为空表示不记录耗时
+        :param deferred: 被限流推迟的任务数量
+        """
+        if started is not None:
+            self.metrics.observe('spider_task_dequeue_latency_seconds', time.perf_counter() - started,
+                                 queue=self.task_name)
+        for level, count in counts.items():
+            self.metrics.inc('spider_task_dequeued_total', count, queue=self.task_name, level=level)
+        self.metrics.inc('spider_task_deferred_total', deferred, queue=self.task_name)
+
+    def _gauge_commands(self, pipe):
+        """向 pipeline 追加采集队列瞬时指标的命令, 与 _parse_gauges 配套使用"""
+        for level in self.ALLOWED_LEVELS:
+            pipe.llen(f"spider_task:{self.key_name}:{level}")
+            pipe.zcard(f"spider_task_delayed:{self.key_name}:{level}")
+            pipe.zrange(f"spider_task_delayed:{self.key_name}:{level}", 0, 0, withscores=True)
+        pipe.zcard(self.processing_key)
+        pipe.zrange(self.processing_key, 0, 0, withscores=True)
 
-    def add_task(self, task: dict = None, level: str = None, is_distinct: bool = True):
+    def _parse_gauges(self, results: list):
+        """
+        解析 _gauge_commands 的执行结果
+        :return: [(指标名, 标签字典, 值), ...]
+        """
+        now = time.time()
+        gauges = []
+        lag = 0
+        for i, level in enumerate(self.ALLOWED_LEVELS):
+            depth, delayed, oldest_due = results[i * 3:i * 3 + 3]
+            gauges.append(('spider_task_queue_depth', {'queue': self.task_name, 'level': level}, depth))
+            gauges.append(('spider_task_delayed_depth', {'queue': self.task_name, 'level': level}, delayed))
+            if oldest_due:
+                lag = max(lag, now - oldest_due[0][1])
+        processing, oldest_lease = results[-2:]
+        gauges.append(('spider_task_delayed_lag_seconds', {'queue': self.task_name}, lag))
+        if self.reliable:
+            # 租约分值为到期时间, 减去租约时长即为出队时间
+            age = now - (oldest_lease[0][1] - self.visibility_timeout) if oldest_lease else 0
+            gauges.append(('spider_task_processing', {'queue': self.task_name}, processing))
+            gauges.append(('spider_task_oldest_processing_age_seconds', {'queue': self.task_name}, max(age, 0)))
+        return gauges
+
+    def _weighted_quotas(self, levels: list, num: int, weights: dict):
+        """
+        平滑加权轮询分配各级别配额, 轮询状态跨调用保留, 单次获取数量较小时也能按权重公平分配
+        :param levels: 队列级别列表
+        :param num: 获取任务总数量
+        :param weights: 各级别权重
+        :return: 与 levels 对应的配额列表
+        """
+        level_weights = {level: max(weights.get(level, 1), 0) for level in levels}
+        total = sum(level_weights.values()) or 1
+        quotas = dict.fromkeys(levels, 0)
+        for _ in range(num):
+            for level in levels:
+                self._wrr_weights[level] = self._wrr_weights.get(level, 0) + level_weights[level]
+            chosen = max(levels, key=lambda level: self._wrr_weights[level])
+            self._wrr_weights[chosen] -= total
+            quotas[chosen] += 1
+        return [quotas[level] for level in levels]
+
+    def _requeue_args(self, limit: int):
+        """
+        构造租约回收脚本的参数
+        :return: (keys, args)
+        """
+        keys = [self.processing_key, self.lease_key] + \
+               [f"spider_task:{self.key_name}:{level}" for level in self.ALLOWED_LEVELS]
+        args = [time.time(), limit] + self.ALLOWED_LEVELS
+        return keys, args
+
+    def _topic_key(self):
+        """
+        队列登记缓存的键, 与连接池注册表一样按 host/port/db 区分, 同名队列位于不同 Redis 服务器或库时分别登记
+        :return: (host, port, db, 队列名)
+        """
+        kwargs = self.conn.connection_pool.connection_kwargs
+        return kwargs.get('host', kwargs.get('path')), kwargs.get('port'), kwargs.get('db', 0), self.topic_name
+
+
+class TaskQueue(BaseTaskQueue):
+
+    def _create_client(self, config: dict):
+        """初始化 Redis 连接, 使用进程内共享连接池, 第一次执行命令时才建立连接"""
+        return redis.Redis(connection_pool=get_connection_pool(
+            config['REDIS_HOST'],
+            config['REDIS_PORT'],
+            config['REDIS_DB'],
+            decode_responses=not self.codec.binary,  # 二进制编码需要原样返回 bytes
+            max_connections=config.get('MAX_CONNECTIONS', 50)
+        ))
+
+    def add_task(self, task: dict = None, level: str = None, is_distinct: bool = True,
+                 delay: float = None, eta=None):
         """
         增加单条任务
         :param task: 任务字典
         :param level: 队列类型, 默认 normal
         :param is_distinct: 是否去重插入
+        :param delay: 延迟入队秒数, 到期后由 promote_delayed 移入队列
+        :param eta: 到期时间, datetime 或时间戳, 优先级高于 delay
         """
         if task is None:
             logger.error("未指定任务字典!!!")
             return
 
         level = level or self.level
-
-        task_backup = f"spider_task_backup:{self.task_name}"
-        task_title = f"spider_task:{self.task_name}:{level}"
-        task_data = json.dumps(task, ensure_ascii=False)
+        due = self._due(delay, eta)
 
         try:
-            if is_distinct:
-                added = self.conn.sadd(task_backup, task_data)
-                if added:
-                    self.conn.lpush(task_title, task_data)
-                    logger.success(f"添加任务成功: {task}")
-                else:
-                    logger.warning(f"任务已存在: {task}")
+            added = self._push_tasks(self._push_key(level, due), [task], is_distinct, due)
+            if added:
+                logger.success(f"{'不去重·' if not is_distinct else ''}添加任务成功: {task}")
             else:
-                self.conn.lpush(task_title, task_data)
-                logger.success(f"不去重·添加任务成功: {task}")
-
-            # 设置过期时间
-            ttl = self.conn.ttl(task_backup)
-            if ttl == -1:
-                self.conn.expire(task_backup, self.max_ttl)  # 使用配置中的最大 TTL
+                logger.warning(f"任务已存在: {task}")
 
         except redis.RedisError as e:
             logger.error(f"操作 Redis 时发生异常: {e}")
 
-    def add_tasks(self, tasks: list = None, level: str = None, is_distinct: bool = True):
+    def add_tasks(self, tasks=None, level: str = None, is_distinct: bool = True, chunk_size: int = 1000,
+                  delay: float = None, eta=None):
         """
-        批量增加任务
-        :param tasks: 任务字典列表
+        批量增加任务, 每批任务的去重、入队与 TTL 维护在一次往返内完成
+        :param tasks: 任务字典列表, 也可以是生成器等可迭代对象
         :param level: 队列类型, 默认 normal
         :param is_distinct: 是否去重插入
+        :param chunk_size: 每批提交的任务数量, 大量任务分批提交, 避免一次性占用大量内存
+        :param delay: 延迟入队秒数, 到期后由 promote_delayed 移入队列
+        :param eta: 到期时间, datetime 或时间戳, 优先级高于 delay
+        :return: 实际入队的任务数量
         """
-        if not tasks or not isinstance(tasks, list):
+        if not tasks or isinstance(tasks, (dict, str)):
             logger.error("任务列表无效或未指定任务列表!!!")
-            return
+            return 0
 
         level = level or self.level
-        task_backup = f"spider_task_backup:{self.task_name}"
-        task_title = f"spider_task:{self.task_name}:{level}"
-
-        # 使用 pipeline 来减少与 Redis 的交互次数
-        pipe = self.conn.pipeline()
+        due = self._due(delay, eta)
+        task_title = self._push_key(level, due)
 
+        total = added = 0
+        iterator = iter(tasks)
         try:
-            # 批量添加任务到 Redis 集合中
-            for task in tasks:
-                if not task.get('retry'):
-                    task['retry'] = 0
-                task_data = json.dumps(task, ensure_ascii=False)
-                pipe.sadd(task_backup, task_data)
-
-            distinct_results = pipe.execute()
-
-            # 使用 pipeline 来处理队列操作
-            pipe = self.conn.pipeline()
+            while True:
+                chunk = list(itertools.islice(iterator, chunk_size))
+                if not chunk:
+                    break
+                for task in chunk:
+                    if not task.get('retry'):
+                        task['retry'] = 0
+                added += self._push_tasks(task_title, chunk, is_distinct, due)
+                total += len(chunk)
 
-            for i, task in enumerate(tasks):
-                task_data = json.dumps(task, ensure_ascii=False)
-                if is_distinct and not distinct_results[i]:
-                    logger.warning(f"任务已存在: {task}")
-                else:
-                    pipe.lpush(task_title, task_data)
-                    logger.success(f"{'不去重·' if not is_distinct else ''}任务成功添加: {task}")
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
 
-            pipe.execute()
+        logger.success(f"{'不去重·' if not is_distinct else ''}批量添加任务: 共 {total} 条, "
+                       f"入队 {added} 条, 重复 {total - added} 条")
+        return added
 
-            # 设置过期时间
-            ttl = self.conn.ttl(task_backup)
-            if ttl == -1:
-                self.conn.expire(task_backup, self.max_ttl)  # 使用配置中的最大 TTL
+    def _push_tasks(self, task_title: str, tasks: list, is_distinct: bool = True, due: float = None):
+        """
+        通过 Lua 脚本登记去重索引并入队, 每条任务只序列化一次
+        :param task_title: 任务队列
+        :param tasks: 任务字典列表
+        :param is_distinct: 是否去重插入, 否则只登记去重索引
+        :param due: 到期时间戳, 为空表示立即入队
+        :return: 实际入队的任务数量
+        """
+        self._register_topic()
+        pushed = self._add_tasks(keys=[task_title, self.dedup_key], args=self._push_args(tasks, is_distinct, due))
+        self._record_push(task_title, len(tasks), pushed, is_distinct)
+        return pushed
 
-        except redis.RedisError as e:
-            logger.error(f"操作 Redis 时发生异常: {e}")
+    def _register_topic(self):
+        """第一次写入任务时把队列名称添加到 Redis 集合, 每个进程在每个 Redis 库上每个队列只登记一次"""
+        if not self.topic_name:
+            return
+        key = self._topic_key()
+        if key in _REGISTERED_TOPICS:
+            return
+        if self.conn.sadd("spider_topic_list", self.topic_name):
+            logger.info(f"新增队列名: {self.topic_name}")
+        _REGISTERED_TOPICS.add(key)
 
     def get_task(self, level: str = None, fifo: bool = True):
         """
@@ -186,13 +1244,22 @@ class TaskQueue:
         :return: 任务字典或 None
         """
         level = level or self.level
-        task_title = f"spider_task:{self.task_name}:{level}"
+        task_title = f"spider_task:{self.key_name}:{level}"
 
+        started = time.perf_counter()
         try:
-            task_data = self.conn.lpop(task_title) if fifo else self.conn.rpop(task_title)
+            if self.throttle:
+                tasks = self._throttle_tasks([level], 1, fifo)
+                task = tasks[0] if tasks else None
+            elif self.reliable:
+                tasks = self._lease_tasks(level, 1, fifo)
+                task = tasks[0] if tasks else None
+            else:
+                task_data = self.conn.lpop(task_title) if fifo else self.conn.rpop(task_title)
+                task = self.codec.loads(task_data) if task_data else None
+                self._record_dequeue({level: 1 if task else 0}, started)
 
-            if task_data:
-                task = json.loads(task_data)
+            if task:
                 logger.info(f"获取任务成功: {task}")
                 return task
             else:
@@ -212,20 +1279,20 @@ class TaskQueue:
         :return: 任务字典列表
         """
         level = level or self.level
-        task_title = f"spider_task:{self.task_name}:{level}"
-
-        # 设置获取数量的默认值
-        if num <= 0:
-            num = self.conn.llen(task_title)
+        task_title = f"spider_task:{self.key_name}:{level}"
 
+        started = time.perf_counter()
         try:
-            tasks = []
-            for _ in range(num):
-                task_data = self.conn.lpop(task_title) if fifo else self.conn.rpop(task_title)
-                if task_data:
-                    tasks.append(json.loads(task_data))
-                else:
-                    break
+            if self.throttle:
+                # 限流模式下逐条检查限流键, 单次最多取出 throttle.max_batch 个任务
+                tasks = self._throttle_tasks([level], num, fifo)
+            elif self.reliable:
+                tasks = self._lease_tasks(level, num, fifo)
+            else:
+                # 通过 Lua 脚本一次往返批量出队, 避免 LLEN + 逐条 LPOP/RPOP 的多次往返与并发竞争
+                tasks_data = self._batch_pop(keys=[task_title], args=[num, 1 if fifo else 0])
+                tasks = [self.codec.loads(task_data) for task_data in tasks_data]
+                self._record_dequeue({level: len(tasks)}, started)
 
             if tasks:
                 logger.info(f"获取 {len(tasks)} 个任务成功。")
@@ -238,6 +1305,253 @@ class TaskQueue:
             logger.error(f"操作 Redis 时发生异常: {e}")
             return []
 
+    def get_tasks_by_priority(self, levels: list = None, num: int = 1, strategy: str = 'strict',
+                              weights: dict = None, batch_sizes: dict = None, fifo: bool = True):
+        """
+        按优先级跨多个级别批量获取任务, 一次往返完成
+        :param levels: 按优先级排列的队列级别, 默认 ['urgent', 'normal']
+        :param num: 获取任务总数量
+        :param strategy: 'strict' 严格优先级, 高优先级队列取空后才取下一级;
+                         'weighted' 加权公平, 按 weights 分配各级别份额, 某级别不足时由其他级别补足
+        :param weights: 加权公平策略下各级别的权重, 默认均为 1
+        :param batch_sizes: 严格优先级策略下各级别单次最多获取的数量, 未指定的级别不限
+        :param fifo: 是否按先入先出（FIFO）模式获取任务
+        :return: 任务字典列表
+        """
+        levels = levels or ['urgent', 'normal']
+        if num <= 0:
+            logger.error("获取任务数量必须大于 0!!!")
+            return []
+
+        try:
+            if self.throttle:
+                return self._throttle_tasks(levels, num, fifo, strategy, weights, batch_sizes)
+
+            started = time.perf_counter()
+            keys, args = self._priority_args(levels, num, strategy, weights, batch_sizes, fifo)
+            tasks, counts = self._parse_priority(self._priority_pop(keys=keys, args=args))
+            self._record_dequeue(counts, started)
+
+            if tasks:
+                logger.info(f"获取 {len(tasks)} 个任务成功: {counts}")
+            else:
+                logger.info("没有更多任务可获取。")
+            return tasks
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return []
+
+    def get_task_blocking(self, levels: list = None, timeout: int = 5, fifo: bool = True, poll_interval: float = 0.2):
+        """
+        阻塞获取单条任务, 按 levels 顺序优先获取, 所有队列为空时在 Redis 端等待新任务而不是轮询
+        可靠模式下阻塞命令无法与登记租约合并为一个原子操作, 改为按 poll_interval 轮询带租约的出队脚本
+        :param levels: 按优先级排列的队列级别, 默认 ['urgent', 'normal']
+        :param timeout: 最长阻塞时间(秒), 0 表示一直阻塞
+        :param fifo: 是否按先入先出（FIFO）模式获取任务
+        :param poll_interval: 可靠模式下的轮询间隔(秒), 限流模式使用 Throttle.poll_interval
+        :return: 任务字典或 None
+        """
+        levels = levels or ['urgent', 'normal']
+        task_titles = [f"spider_task:{self.key_name}:{level}" for level in levels]
+
+        try:
+            if self.throttle:
+                # 阻塞出队无法在出队前检查限流, 限流模式下改为短间隔轮询, 等待期间顺带提升到期的延迟任务
+                end = time.time() + timeout if timeout else None
+                while True:
+                    tasks = self._throttle_tasks(levels, 1, fifo)
+                    if tasks:
+                        logger.info(f"获取任务成功: {tasks[0]}")
+                        return tasks[0]
+                    if end is not None and time.time() >= end:
+                        return None
+                    time.sleep(self.throttle.poll_interval)
+                    self.promote_delayed()
+
+            if self.reliable:
+                # 出队与登记租约必须在同一脚本内完成, 否则两步之间崩溃或出错会丢失任务, 因此轮询而不使用 BLPOP
+                end = time.time() + timeout if timeout else None
+                while True:
+                    tasks = self.get_tasks_by_priority(levels=levels, num=1, fifo=fifo)
+                    if tasks:
+                        return tasks[0]
+                    if end is not None and time.time() >= end:
+                        return None
+                    time.sleep(poll_interval)
+
+            result = self.conn.blpop(task_titles, timeout) if fifo else self.conn.brpop(task_titles, timeout)
+            if not result:
+                return None
+
+            task_title, task_data = result
+            task = self.codec.loads(task_data)
+            self._record_dequeue({to_str(task_title).rsplit(':', 1)[-1]: 1})
+            logger.info(f"获取任务成功: {task}")
+            return task
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return None
+
+    def _lease_tasks(self, level: str, num: int, fifo: bool):
+        """
+        可靠模式出队: 出队与登记租约在同一脚本内完成, 任务字典中附带 '_lease' 租约ID
+        :param level: 队列紧急程度
+        :param num: 获取任务数量, <=0 表示全部
+        :param fifo: 是否按先入先出（FIFO）模式获取任务
+        :return: 任务字典列表
+        """
+        started = time.perf_counter()
+        keys, args = self._lease_args(level, num, fifo)
+        tasks = self._parse_leases(self._reliable_pop(keys=keys, args=args))
+        self._record_dequeue({level: len(tasks)}, started)
+        return tasks
+
+    def _throttle_tasks(self, levels: list, num: int, fifo: bool, strategy: str = 'strict',
+                        weights: dict = None, batch_sizes: dict = None):
+        """
+        限流模式出队: 出队与限流检查在同一脚本内完成, 被限流的任务推迟到延迟队列,
+        限制并发时任务字典中附带 '_throttle' 并发令牌, 处理完成后由 ack_task 归还
+        :param levels: 按优先级排列的队列级别
+        :param num: 获取任务数量
+        :param fifo: 是否按先入先出（FIFO）模式获取任务
+        :return: 任务字典列表
+        """
+        started = time.perf_counter()
+        keys, args = self._throttle_args(levels, num, strategy, weights, batch_sizes, fifo)
+        tasks, counts, deferred = self._parse_throttle(self._throttle_pop(keys=keys, args=args))
+        self._record_dequeue(counts, started, deferred)
+        if deferred:
+            logger.info(f"{deferred} 个任务被限流, 已推迟出队")
+        if tasks:
+            logger.info(f"获取 {len(tasks)} 个任务成功: {counts}")
+        return tasks
+
+    def ack_task(self, task: dict = None):
+        """
+        确认任务处理完成, 可靠模式下释放租约, 限流模式下归还并发令牌
+        :param task: get_task/get_tasks 返回的任务字典
+        :return: 租约仍有效并成功释放返回 True, 租约已过期(任务已被回收)返回 False
+        """
+        token = task.pop('_throttle', None) if task else None
+        lease = task.pop('_lease', None) if task else None
+
+        try:
+            if token is not None:
+                self._release_throttle(keys=[self.inflight_key, self.inflight_token_key], args=[token])
+            if lease is None:
+                if token is None:
+                    logger.error("任务不包含租约信息, 无法确认!!!")
+                    return False
+                self.metrics.inc('spider_task_acked_total', queue=self.task_name)
+                return True
+
+            pipe = self.conn.pipeline()
+            pipe.zrem(self.processing_key, lease)
+            pipe.hdel(self.lease_key, lease)
+            removed, _ = pipe.execute()
+            if removed:
+                self.metrics.inc('spider_task_acked_total', queue=self.task_name)
+                logger.info(f"确认任务成功: {task}")
+                return True
+            logger.warning(f"任务租约已过期, 任务可能已被重新投递: {task}")
+            return False
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return False
+
+    def nack_task(self, task: dict = None, requeue: bool = True):
+        """
+        可靠模式下拒绝任务, 释放租约
+        :param task: get_task/get_tasks 返回的任务字典
+        :param requeue: 是否按 retry_task 的规则重新入队, 否则直接插入失败队列
+        """
+        if task is None:
+            logger.error("未指定任务字典!!!")
+            return
+
+        self.ack_task(task)
+        if requeue:
+            self.retry_task(task)
+        else:
+            try:
+                self.conn.lpush(f"spider_task:{self.key_name}:fail", self.codec.dumps(task))
+                self.metrics.inc('spider_task_failed_total', queue=self.task_name)
+                logger.warning(f"任务已拒绝, 已插入失败队列: {task}")
+            except redis.RedisError as e:
+                logger.error(f"操作 Redis 时发生异常: {e}")
+
+    def touch_task(self, task: dict = None, visibility_timeout: int = None):
+        """
+        为处理中的任务续租, 适用于耗时较长的任务; 限流模式下同时续期并发令牌
+        :param task: get_task/get_tasks 返回的任务字典
+        :param visibility_timeout: 续租时长(秒), 默认为实例的租约时长
+        :return: 续租成功返回 True
+        """
+        lease = task.get('_lease') if task else None
+        token = task.get('_throttle') if task else None
+        if lease is None and token is None:
+            logger.error("任务不包含租约信息, 无法续租!!!")
+            return False
+
+        deadline = time.time() + (visibility_timeout or self.visibility_timeout)
+        try:
+            if token is not None:
+                # 并发令牌与租约同时续期, 避免长任务的并发计数被提前释放
+                touched = bool(self.conn.zadd(self.inflight_token_key, {token: deadline}, xx=True, ch=True))
+                if lease is None:
+                    return touched
+            return bool(self.conn.zadd(self.processing_key, {lease: deadline}, xx=True, ch=True))
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return False
+
+    def requeue_expired(self, limit: int = 1000):
+        """
+        回收租约已过期的任务, 放回原队列头部重新投递
+        :param limit: 单次回收的最大任务数
+        :return: 回收的任务数量
+        """
+        try:
+            keys, args = self._requeue_args(limit)
+            count = self._requeue_expired(keys=keys, args=args)
+            if count:
+                logger.warning(f"回收 {count} 个租约过期的任务")
+            return count
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return 0
+
+    def promote_delayed(self, limit: int = 1000):
+        """
+        把到期的延迟任务批量移入对应队列头部
+        :param limit: 每个级别单次提升的最大任务数
+        :return: 提升的任务数量
+        """
+        try:
+            keys, args = self._promote_args(limit)
+            count = self._promote_delayed(keys=keys, args=args)
+            if count:
+                logger.info(f"提升 {count} 个到期的延迟任务")
+            return count
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return 0
+
+    def _maintain(self):
+        """消费循环内的定时维护: 提升到期的延迟任务, 可靠模式下回收过期租约"""
+        now = time.time()
+        if now >= self._next_promote:
+            self.promote_delayed()
+            self._next_promote = now + self.promote_interval
+        if self.reliable and now >= self._next_reap:
+            self.requeue_expired()
+            self._next_reap = now + self.reaper_interval
+
     def retry_task(self, task: dict = None, is_distinct: bool = True):
         """
         单个任务重试, 重试次数达到最大重试次数, 插入失败队列
@@ -248,31 +1562,42 @@ class TaskQueue:
             logger.error("未指定任务字典!!!")
             return
 
-        task_backup = f"spider_task_backup:{self.task_name}"
-        task_title = f"spider_task:{self.task_name}:{self.level}"
-        fail_task_title = f"spider_task:{self.task_name}:fail"
+        # 可靠模式下先释放租约, 避免任务被租约回收再次投递; 限流模式下归还并发令牌
+        if '_lease' in task or '_throttle' in task:
+            self.ack_task(task)
+
+        fail_task_title = f"spider_task:{self.key_name}:fail"
 
-        task_data = json.dumps(task, ensure_ascii=False)
+        task_data = self.codec.dumps(task)
 
         try:
             retry_count = task.get('retry', 0)
             if retry_count < self.max_retries:
                 task['retry'] = retry_count + 1
-                updated_task_data = json.dumps(task, ensure_ascii=False)
+                updated_task_data = self.codec.dumps(task)
+                # 开启退避时按指数退避延迟重试, 避免被限流或封禁的任务立即再次失败
+                due = self._retry_due(retry_count)
+                task_title = self._push_key(self.level, due)
 
-                if is_distinct:
-                    added = self.conn.sadd(task_backup, updated_task_data)
-                    if added:
-                        self.conn.lpush(task_title, updated_task_data)
+                # 指纹/布隆去重忽略 retry 字段, 重试任务本身已登记过, 不再参与去重
+                if is_distinct and self.dedup.track_retry:
+                    if self._push_tasks(task_title, [task], due=due):
+                        self.metrics.inc('spider_task_retried_total', queue=self.task_name)
                         logger.success(f"重试任务成功: {task}")
                     else:
                         logger.warning(f"重试任务已存在: {task}")
                 else:
-                    self.conn.lpush(task_title, updated_task_data)
-                    logger.success(f"不去重·重试任务成功: {task}")
+                    if due is None:
+                        self.conn.lpush(task_title, updated_task_data)
+                    else:
+                        self.conn.zadd(task_title, {updated_task_data: due})
+                    self.metrics.inc('spider_task_retried_total', queue=self.task_name)
+                    self.metrics.inc('spider_task_enqueued_total', queue=self.task_name, level=self.level)
+                    logger.success(f"{'不去重·' if not is_distinct else ''}重试任务成功: {task}")
 
             else:
                 self.conn.lpush(fail_task_title, task_data)
+                self.metrics.inc('spider_task_failed_total', queue=self.task_name)
                 logger.error(f"任务重试次数已达上限, 已插入失败队列: {task}")
 
         except redis.RedisError as e:
@@ -280,29 +1605,271 @@ class TaskQueue:
 
     def monitor_tasks(self):
         """
-        任务预警
-        :return:
+        任务预警, 一次往返获取各队列长度, 失败队列超过 FAIL_ALERT_THRESHOLD 时告警
+        :return: 各队列任务数量
         """
-        task_counts = {
-            'urgent': self.conn.llen(f"spider_task:{self.task_name}:urgent"),
-            'normal': self.conn.llen(f"spider_task:{self.task_name}:normal"),
-            'fail': self.conn.llen(f"spider_task:{self.task_name}:fail")
-        }
+        pipe = self.conn.pipeline(transaction=False)
+        for level in ('urgent', 'normal', 'fail'):
+            pipe.llen(f"spider_task:{self.key_name}:{level}")
+        if self.reliable:
+            pipe.zcard(self.processing_key)
+        task_counts = dict(zip(('urgent', 'normal', 'fail', 'processing'), pipe.execute()))
         logger.info(f"任务统计: {task_counts}")
 
         # 监控和报警逻辑
-        if task_counts['fail'] > 100:
-            logger.warning("失败队列中的任务数量超过阈值")
+        if task_counts['fail'] > self.fail_alert_threshold:
+            logger.warning(f"失败队列中的任务数量超过阈值: {task_counts['fail']} > {self.fail_alert_threshold}")
+        return task_counts
 
     def monitor_system_resources(self):
         """
-        内存管理
+        内存管理, CPU 使用率为自上次调用以来的平均值, 不阻塞调度器线程
         :return:
         """
-        cpu_usage = psutil.cpu_percent(interval=1)
+        cpu_usage = psutil.cpu_percent(interval=None)
         memory_usage = psutil.virtual_memory().percent
         logger.info(f"CPU 使用率: {cpu_usage}%, 内存使用率: {memory_usage}%")
 
+    def collect_metrics(self):
+        """
+        读取各级别队列深度、延迟任务数量与滞后、处理中任务数量与时长等瞬时指标, 一次往返完成
+        :return: [(指标名, 标签字典, 值), ...]
+        """
+        try:
+            pipe = self.conn.pipeline(transaction=False)
+            self._gauge_commands(pipe)
+            return self._parse_gauges(pipe.execute())
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+            return []
+
+    def get_metrics(self):
+        """
+        获取当前队列的指标快照: 入队/出队/确认/重试等计数、出队耗时直方图、瞬时指标与去重命中率
+        :return: 见 Metrics.snapshot, 计数与直方图为进程内累计值
+        """
+        snapshot = self.metrics.snapshot(collect=False, queue=self.task_name)
+        for name, labels, value in self.collect_metrics():
+            snapshot['gauges'][(name, tuple(sorted(labels.items())))] = value
+        return snapshot
+
+    def start_metrics_server(self, port: int = None, host: str = '127.0.0.1'):
+        """
+        启动 Prometheus 指标服务并登记当前队列的瞬时指标, 瞬时指标在抓取时由 HTTP 线程读取
+        :param port: 监听端口, 默认读取 METRICS_PORT, 未配置时为 9108
+        :param host: 监听地址, 默认只监听本机
+        """
+        self.metrics.register_collector(self.task_name, self.collect_metrics)
+        start_metrics_server(port or self.metrics_port or 9108, host, self.metrics)
+
+    def export_tasks(self, path: str, levels: list = None, include_delayed: bool = True,
+                     include_processing: bool = True, include_dedup: bool = True, page_size: int = 5000,
+                     fmt: str = None, compresslevel: int = 3):
+        """
+        流式导出队列: 通过 LRANGE/ZSCAN/HSCAN/SSCAN 分页非破坏性读取各级别队列、延迟任务、处理中任务与去重索引,
+        逐条写入 JSON Lines 或 msgpack 文件, 内存占用只与 page_size 有关;
+        导出期间队列可以继续读写, 但导出结果不是严格一致的快照
+        :param path: 导出文件路径, 以 .gz 结尾时使用 gzip 压缩
+        :param levels: 导出的队列级别, 默认全部级别
+        :param include_delayed: 是否导出延迟任务
+        :param include_processing: 是否导出可靠模式下处理中的任务, 导入时作为待处理任务
+        :param include_dedup: 是否导出去重索引
+        :param page_size: 每次读取的数量
+        :param fmt: 'jsonl' 或 'msgpack', 默认按文件名判断, 文件名包含 .msgpack 时为 msgpack
+        :param compresslevel: gzip 压缩级别
+        :return: 各类记录的导出数量
+        """
+        fmt = fmt or ('msgpack' if '.msgpack' in path else 'jsonl')
+        levels = levels or self.ALLOWED_LEVELS
+        counts = {}
+        started = time.time()
+        try:
+            with self._open_export(path, 'wb', compresslevel) as f:
+                write = self._export_writer(f, fmt)
+                write(self._export_header())
+                records = self._export_records(levels, include_delayed, include_processing, include_dedup, page_size)
+                for kind, record in records:
+                    write(record)
+                    counts[kind] = counts.get(kind, 0) + 1
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+
+        logger.success(f"导出队列 {self.task_name} 到 {path}: {counts}, 耗时 {time.time() - started:.1f} 秒")
+        return counts
+
+    def import_tasks(self, path: str, is_distinct: bool = False, include_dedup: bool = True,
+                     chunk_size: int = 1000, fmt: str = None):
+        """
+        流式导入 export_tasks 导出的文件, 按 chunk_size 分批写入, 内存占用与文件大小无关;
+        任务按原顺序恢复到对应级别, 处理中的任务恢复为待处理任务
+        :param path: 导入文件路径, 以 .gz 结尾时按 gzip 解压
+        :param is_distinct: 是否去重插入, 默认原样恢复全部任务
+        :param include_dedup: 是否恢复去重索引, 导出与导入的去重方式不同时跳过
+        :param chunk_size: 每批写入的数量
+        :param fmt: 'jsonl' 或 'msgpack', 默认按文件名判断
+        :return: 各类记录的导入数量
+        """
+        fmt = fmt or ('msgpack' if '.msgpack' in path else 'jsonl')
+        counts = {}
+        started = time.time()
+        tasks, delayed, members = {}, {}, {}
+
+        def flush(buffers, write):
+            for (target, level), items in buffers.items():
+                if items:
+                    write(target, level, items)
+            buffers.clear()
+
+        def push(target, level, items):
+            counts['task'] = counts.get('task', 0) + target._push_tasks(
+                target._push_key(level), items, is_distinct)
+
+        def schedule(target, level, items):
+            target.conn.zadd(f"spider_task_delayed:{target.key_name}:{level}", dict(items))
+            counts['delayed'] = counts.get('delayed', 0) + len(items)
+
+        def register(target, _, items):
+            target.conn.sadd(target.dedup_key, *items)
+            if target.conn.ttl(target.dedup_key) == -1:
+                target.conn.expire(target.dedup_key, target.max_ttl)
+            counts['dedup'] = counts.get('dedup', 0) + len(items)
+
+        try:
+            with self._open_export(path, 'rb') as f:
+                records = self._export_reader(f, fmt)
+                header = next(records, None) or {}
+                if header.get('format') != EXPORT_FORMAT:
+                    logger.error(f"文件 '{path}' 不是队列导出文件!!!")
+                    return counts
+                if include_dedup and header.get('dedup') != self.dedup.kind:
+                    logger.warning(f"导出文件的去重方式为 '{header.get('dedup')}', 与当前 '{self.dedup.kind}' 不同, 跳过去重索引")
+                    include_dedup = False
+
+                for record in records:
+                    if 'task' in record:
+                        target = self._import_target(record)
+                        level = record.get('level') if record.get('level') in self.ALLOWED_LEVELS else self.level
+                        if record.get('due') is not None:
+                            buffer = delayed.setdefault((target, level), [])
+                            buffer.append((target.codec.dumps(record['task']), record['due']))
+                        else:
+                            buffer = tasks.setdefault((target, level), [])
+                            buffer.append(record['task'])
+                    elif 'dedup' in record and include_dedup:
+                        target = self._import_target(record)
+                        member = record['dedup']
+                        if isinstance(member, dict):
+                            member = target.dedup.member(member, target.codec.dumps(member))
+                        buffer = members.setdefault((target, None), [])
+                        buffer.append(member)
+                    elif 'bloom' in record and include_dedup:
+                        target = self._import_target(record)
+                        chunk = record['bloom']
+                        if target is not None:
+                            target.conn.setrange(target.dedup_key, record['offset'],
+                                                 base64.b64decode(chunk) if isinstance(chunk, str) else chunk)
+                            if target.conn.ttl(target.dedup_key) == -1:
+                                target.conn.expire(target.dedup_key, target.max_ttl)
+                            counts['bloom'] = counts.get('bloom', 0) + 1
+                        continue
+                    else:
+                        continue
+
+                    if len(buffer) >= chunk_size:
+                        flush(tasks, push)
+                        flush(delayed, schedule)
+                        flush(members, register)
+
+                flush(tasks, push)
+                flush(delayed, schedule)
+                flush(members, register)
+
+        except redis.RedisError as e:
+            logger.error(f"操作 Redis 时发生异常: {e}")
+
+        logger.success(f"从 {path} 导入队列 {self.task_name}: {counts}, 耗时 {time.time() - started:.1f} 秒")
+        return counts
+
+    def _export_header(self):
+        """导出文件的首条记录"""
+        return {'format': EXPORT_FORMAT, 'version': EXPORT_VERSION, 'task_name': self.task_name,
+                'dedup': self.dedup.kind, 'created_at': time.time()}
+
+    def _export_records(self, levels: list, include_delayed: bool, include_processing: bool, include_dedup: bool,
+                        page_size: int):
+        """
+        分页读取队列内容
+        :return: (记录类型, 记录字典) 生成器
+        """
+        for level in levels:
+            key = f"spider_task:{self.key_name}:{level}"
+            # 从队尾(最早入队的一端)按负下标分页, 导出期间 LPUSH 入队与队头出队不会打乱分页
+            for start in range(0, self.conn.llen(key), page_size):
+                for task_data in reversed(self.conn.lrange(key, -(start + page_size), -(start + 1))):
+                    yield 'task', {'level': level, 'task': self.codec.loads(task_data)}
+
+            if include_delayed:
+                key = f"spider_task_delayed:{self.key_name}:{level}"
+                for task_data, due in self.conn.zscan_iter(key, count=page_size):
+                    yield 'delayed', {'level': level, 'task': self.codec.loads(task_data), 'due': due}
+
+        if include_processing:
+            for lease, task_data in self.conn.hscan_iter(self.lease_key, count=page_size):
+                level = to_str(lease).split(':', 1)[0]
+                if level in levels:
+                    yield 'processing', {'level': level, 'task': self.codec.loads(task_data)}
+
+        if include_dedup:
+            if self.dedup.kind == 'bloom':
+                # 位图是二进制数据, 使用连接参数相同但不解码的连接读取
+                raw = redis.Redis(connection_pool=get_raw_connection_pool(self.conn.connection_pool))
+                size = raw.strlen(self.dedup_key)
+                step = page_size * 64
+                for offset in range(0, size, step):
+                    yield 'bloom', {'offset': offset, 'bloom': raw.getrange(self.dedup_key, offset, offset + step - 1)}
+            else:
+                for member in self.conn.sscan_iter(self.dedup_key, count=page_size):
+                    # 集合去重的成员是任务内容, 解码后导入时按导入方的编码重新序列化
+                    member = self.codec.loads(member) if self.dedup.kind == 'set' else to_str(member)
+                    yield 'dedup', {'dedup': member}
+
+    def _import_target(self, record: dict):
+        """导入记录写入的队列"""
+        return self
+
+    @staticmethod
+    def _open_export(path: str, mode: str, compresslevel: int = 3):
+        if path.endswith('.gz'):
+            return gzip.open(path, mode, compresslevel=compresslevel)
+        return open(path, mode)
+
+    @staticmethod
+    def _export_writer(f, fmt: str):
+        if fmt == 'msgpack':
+            if msgpack is None:
+                raise ImportError("导出 msgpack 文件需要安装 msgpack: pip install msgpack")
+            packer = msgpack.Packer(use_bin_type=True)
+            return lambda record: f.write(packer.pack(record))
+
+        def default(value):
+            if isinstance(value, bytes):
+                return base64.b64encode(value).decode('ascii')
+            return str(value)
+
+        return lambda record: f.write(json.dumps(record, ensure_ascii=False, default=default).encode('utf-8') + b'\n')
+
+    @staticmethod
+    def _export_reader(f, fmt: str):
+        if fmt == 'msgpack':
+            if msgpack is None:
+                raise ImportError("导入 msgpack 文件需要安装 msgpack: pip install msgpack")
+            yield from msgpack.Unpacker(f, raw=False)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
     def setup_scheduler(self, scheduling_strategy=None, interval_seconds=None, cron_expression=None):
         """
         设置调度器，允许用户自定义调度策略和参数。
@@ -315,12 +1882,20 @@ class TaskQueue:
         interval_seconds = interval_seconds or self.interval_seconds
         cron_expression = cron_expression or self.cron_expression
 
-        if not scheduling_strategy:
+        if not scheduling_strategy and not self.reliable and not self.retry_backoff:
             logger.info('当前没有调度器配置')
             return
 
         self.scheduler = BackgroundScheduler()
-        if scheduling_strategy == 'interval':
+        # 定时把到期的延迟任务移入队列
+        self.scheduler.add_job(self.promote_delayed, IntervalTrigger(seconds=self.promote_interval))
+        if self.reliable:
+            # 定时回收租约过期的任务
+            self.scheduler.add_job(self.requeue_expired, IntervalTrigger(seconds=self.reaper_interval))
+
+        if not scheduling_strategy:
+            logger.info('当前没有调度器配置, 仅启动延迟任务提升与租约回收')
+        elif scheduling_strategy == 'interval':
             if interval_seconds is None:
                 interval_seconds = self.interval_seconds
             self.scheduler.add_job(self.process_tasks, IntervalTrigger(seconds=interval_seconds))
@@ -343,8 +1918,144 @@ class TaskQueue:
         logger.info('调用默认方法')
         return self.get_tasks(num=num)
 
+    def register_handler(self, handler):
+        """
+        注册 consume 使用的任务处理函数, 可作为装饰器使用
+        :param handler: 接收任务字典的处理函数
+        :return: 原处理函数
+        """
+        self.handler = handler
+        return handler
+
+    def consume(self, handler=None, levels: list = None, timeout: int = 5, fifo: bool = True):
+        """
+        阻塞消费循环: 基于 BLPOP/BRPOP 按优先级获取任务并交给处理函数,
+        处理函数抛出异常时调用 retry_task 重试, 可靠或限流模式下处理成功后自动 ack_task
+        :param handler: 任务处理函数, 默认使用 register_handler 注册的函数
+        :param levels: 按优先级排列的队列级别, 默认 ['urgent', 'normal']
+        :param timeout: 单次阻塞等待时间(秒), 超时后检查是否需要停止
+        :param fifo: 是否按先入先出（FIFO）模式获取任务
+        """
+        handler = handler or self.handler
+        if handler is None:
+            logger.error("未指定任务处理函数!!!")
+            return
+
+        if self.metrics_port:
+            self.start_metrics_server()
+
+        self._consuming = True
+        try:
+            while self._consuming:
+                # 定时提升到期的延迟任务、回收过期租约, 无需额外启动调度器
+                self._maintain()
+
+                task = self.get_task_blocking(levels=levels, timeout=timeout, fifo=fifo)
+                if task is None:
+                    continue
+
+                try:
+                    handler(task)
+                except Exception as e:
+                    logger.error(f"处理任务时发生异常: {e}, 任务: {task}")
+                    self.retry_task(task)
+                else:
+                    if self.reliable or '_throttle' in task:
+                        self.ack_task(task)
+
+        except KeyboardInterrupt:
+            logger.info("消费已停止")
+        finally:
+            self._consuming = False
+
+    def run_pool(self, handler=None, concurrency: int = 8, backend: str = 'thread', prefetch: int = 10,
+                 buffer_size: int = None, levels: list = None, timeout: int = 5, fifo: bool = True):
+        """
+        并发消费: 主线程按优先级批量预取任务提交给线程池或进程池执行,
+        已提交未完成的任务数量不超过 concurrency + buffer_size, 缓冲区满时暂停预取;
+        处理函数抛出异常时调用 retry_task, 可靠或限流模式下处理成功后自动 ack_task;
+        收到 SIGTERM 或调用 stop() 后停止预取, 等待已提交的任务全部执行完毕再退出
+        :param handler: 任务处理函数, 默认使用 register_handler 注册的函数; 进程池模式下必须可被 pickle
+        :param concurrency: 并发数, 即线程池或进程池的 worker 数量
+        :param backend: 'thread' 线程池, 适合 IO 密集型任务; 'process' 进程池, 适合 CPU 密集型任务
+        :param prefetch: 单次批量预取的最大任务数
+        :param buffer_size: 已预取但尚未开始执行的任务上限, 默认为 concurrency * 2
+        :param levels: 按优先级排列的队列级别, 默认 ['urgent', 'normal']
+        :param timeout: 队列为空时单次阻塞等待时间(秒)
+        :param fifo: 是否按先入先出（FIFO）模式获取任务
+        """
+        handler = handler or self.handler
+        if handler is None:
+            logger.error("未指定任务处理函数!!!")
+            return
+
+        if backend == 'process':
+            executor = ProcessPoolExecutor(max_workers=concurrency)
+        else:
+            if backend != 'thread':
+                logger.warning(f"未知的执行方式 '{backend}'，使用默认方式 'thread'")
+            executor = ThreadPoolExecutor(max_workers=concurrency)
+
+        # 信号处理函数只能在主线程中注册
+        previous_handler = None
+        if threading.current_thread() is threading.main_thread():
+            previous_handler = signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+
+        if self.metrics_port:
+            self.start_metrics_server()
+
+        slots = threading.BoundedSemaphore(concurrency + (buffer_size or concurrency * 2))
+        self._consuming = True
+        try:
+            while self._consuming:
+                # 定时提升到期的延迟任务、回收过期租约, 无需额外启动调度器
+                self._maintain()
+
+                # 至少占用一个槽位才预取, 缓冲区满时在此阻塞, 形成背压
+                if not slots.acquire(timeout=timeout):
+                    continue
+                num = 1
+                while num < prefetch and slots.acquire(blocking=False):
+                    num += 1
+
+                tasks = self.get_tasks_by_priority(levels=levels, num=num, fifo=fifo)
+                if not tasks:
+                    task = self.get_task_blocking(levels=levels, timeout=timeout, fifo=fifo)
+                    tasks = [task] if task else []
+                for _ in range(num - len(tasks)):
+                    slots.release()
+
+                for task in tasks:
+                    future = executor.submit(handler, task)
+                    future.add_done_callback(functools.partial(self._pool_task_done, task, slots))
+
+        except KeyboardInterrupt:
+            logger.info("收到中断信号, 等待已提交的任务执行完毕")
+        finally:
+            self._consuming = False
+            executor.shutdown(wait=True)
+            if previous_handler is not None:
+                signal.signal(signal.SIGTERM, previous_handler)
+            logger.info("并发消费已停止")
+
+    def _pool_task_done(self, task: dict, slots, future):
+        """并发消费的任务完成回调: 释放槽位, 失败重试, 成功确认"""
+        slots.release()
+        error = future.exception()
+        if error is not None:
+            logger.error(f"处理任务时发生异常: {error}, 任务: {task}")
+            self.retry_task(task)
+        elif self.reliable or '_throttle' in task:
+            self.ack_task(task)
+
+    def stop(self):
+        """停止 consume/run_pool 消费循环, 当前阻塞等待结束后生效"""
+        self._consuming = False
+
     def run(self):
         """调度器启动"""
+        if self.metrics_port:
+            self.start_metrics_server()
         self.setup_scheduler()
         try:
             while True: